@@ -0,0 +1 @@
+"""性能基准测试脚本 (合成数据，无需 OBS/B站)"""
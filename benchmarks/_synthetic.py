@@ -0,0 +1,71 @@
+"""
+基准测试用的合成媒体库
+
+在临时目录中生成空文件 (文件名即歌名/录播编号)，管理器照常扫描，
+不需要真实媒体文件。名称由固定种子生成，多次运行结果可比。
+"""
+
+import os
+import random
+import tempfile
+
+# 常见歌名用字 + 全角标点，覆盖 CJK 统一表意文字和全角区段
+_CJK_CHARS = ("晴天稻香七里香告白气球夜曲青花瓷简单爱安静彩虹听妈妈的话"
+              "東風破發如雪蒲公英的約定说好的幸福呢星晴龙卷风半岛铁盒"
+              "演员丑八怪刚刚好绅士认真的雪天后光年之外泡沫画倒数")
+_CJK_PUNCT = "（）「」・～！"
+_LATIN_WORDS = ("love night coffee rain code midnight radio live remix "
+                "acoustic version feat the of and blue city lights dream").split()
+
+SONG_EXTENSIONS = (".mp3", ".mp4", ".flv", ".mkv", ".wav")
+
+
+def song_name(rng: random.Random, long_ratio: float = 0.3) -> str:
+    """生成一个歌名: 纯中文 / 纯英文 / 中英混排，部分为超长名称"""
+    kind = rng.random()
+    long = rng.random() < long_ratio
+    cjk_len = rng.randint(12, 30) if long else rng.randint(2, 8)
+    word_count = rng.randint(6, 12) if long else rng.randint(1, 4)
+
+    cjk = "".join(rng.choice(_CJK_CHARS) for _ in range(cjk_len))
+    latin = " ".join(rng.choice(_LATIN_WORDS) for _ in range(word_count)).title()
+    if kind < 0.45:
+        return cjk
+    if kind < 0.75:
+        return latin
+    punct = rng.choice(_CJK_PUNCT)
+    return f"{cjk} {punct}{latin}{punct}"
+
+
+def song_names(count: int, seed: int = 42, long_ratio: float = 0.3) -> list[str]:
+    """生成 count 个互不相同的歌名"""
+    rng = random.Random(seed)
+    names: set[str] = set()
+    result = []
+    while len(result) < count:
+        name = song_name(rng, long_ratio)
+        if name in names:
+            name = f"{name} {len(result)}"
+        names.add(name)
+        result.append(name)
+    return result
+
+
+def make_song_library(count: int, seed: int = 42, root: str = "") -> str:
+    """在临时目录生成 count 首歌曲文件，返回目录路径"""
+    root = root or tempfile.mkdtemp(prefix="bench_songs_")
+    rng = random.Random(seed)
+    for name in song_names(count, seed):
+        ext = rng.choice(SONG_EXTENSIONS)
+        open(os.path.join(root, name + ext), "wb").close()
+    return root
+
+
+def make_replay_library(count: int, root: str = "") -> str:
+    """生成 count 个录播文件 (YYYYMMDDNN.mp4)，返回目录路径"""
+    root = root or tempfile.mkdtemp(prefix="bench_replay_")
+    for i in range(count):
+        day = 20250101 + (i // 4) % 28 + 100 * ((i // 112) % 12)
+        code = f"{day}{i % 4 + 1:02d}"
+        open(os.path.join(root, code + ".mp4"), "wb").close()
+    return root
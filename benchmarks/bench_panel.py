@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+面板渲染基准测试
+
+用合成歌曲库/录播库构建 SongManager、ReplayManager、ModeManager，
+对 6 种模式的布局各渲染 N 帧，报告:
+  - 状态采集 (capture_state) 耗时
+  - 绘制 (compose) 耗时 p50/p99
+  - 编码 (encode) 耗时 p50/p99
+  - 输出字节数
+  - tracemalloc 峰值 (仅统计 Python 分配；Pillow 图像缓冲区走 C 分配器，不计入)
+
+无需 OBS / B站凭证，不写面板文件，与 --panel-only 一样可在任何机器上运行。
+
+用法:
+  python benchmarks/bench_panel.py
+  python benchmarks/bench_panel.py --songs 20000 --frames 500 --format palette
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks._synthetic import make_song_library, make_replay_library, song_names  # noqa: E402
+from modules.songs import SongManager  # noqa: E402
+from modules.replay import ReplayManager  # noqa: E402
+from modules.modes import Mode, ModeManager  # noqa: E402
+from modules.panel import PanelRenderer  # noqa: E402
+from modules.panel_output import OutputOptions  # noqa: E402
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def build_managers(args, data_dir: str):
+    song_dir = make_song_library(args.songs)
+    replay_dir = make_replay_library(args.replays)
+
+    songs = SongManager(song_dir, data_dir)
+    replays = ReplayManager(replay_dir, data_dir)
+    modes = ModeManager()
+
+    # 队列填满，名称中包含超长中文名
+    for name in song_names(args.queue, seed=7, long_ratio=0.6):
+        songs.queue_add(os.path.join(song_dir, name + ".mp3"), name)
+    for path in replays.get_all_files()[:args.queue]:
+        code = os.path.splitext(os.path.basename(path))[0]
+        replays.queue_add(code, path)
+
+    modes.mode_state[Mode.BROADCAST].update(viewer_count=12345, is_active=True)
+    modes.mode_state[Mode.PK].update(opponent_name="隔壁深夜电台的超长主播名称ABC",
+                                     our_score=1024, opponent_score=998, is_active=True)
+    modes.mode_state[Mode.MUSIC].update(queue_count=songs.queue_count)
+    return songs, replays, modes, [song_dir, replay_dir]
+
+
+def bench_mode(panel: PanelRenderer, modes: ModeManager, songs: SongManager,
+               mode: Mode, frames: int, names: list[str]) -> dict:
+    modes.current_mode = mode
+    capture, compose, encode, sizes = [], [], [], []
+
+    def frame(i: int):
+        # 每帧换一首正在播放的歌，模拟最坏情况 (缓存部分失效)
+        songs._now_playing = names[i % len(names)]
+        t0 = time.perf_counter()
+        state = panel.capture_state()
+        t1 = time.perf_counter()
+        img = panel.compose(state)
+        t2 = time.perf_counter()
+        data = panel.encode(img)
+        t3 = time.perf_counter()
+        return t1 - t0, t2 - t1, t3 - t2, len(data)
+
+    for i in range(frames):
+        c, d, e, n = frame(i)
+        capture.append(c)
+        compose.append(d)
+        encode.append(e)
+        sizes.append(n)
+
+    # 内存峰值单独测量，tracemalloc 本身会拖慢分配，不计入耗时
+    tracemalloc.start()
+    for i in range(min(frames, 50)):
+        frame(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "capture_p50": statistics.median(capture),
+        "compose_p50": statistics.median(compose),
+        "compose_p99": percentile(compose, 99),
+        "encode_p50": statistics.median(encode),
+        "encode_p99": percentile(encode, 99),
+        "bytes": int(statistics.mean(sizes)),
+        "peak_kib": peak / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="面板渲染基准测试")
+    parser.add_argument("--songs", type=int, default=5000, help="合成歌曲库大小")
+    parser.add_argument("--replays", type=int, default=500, help="合成录播库大小")
+    parser.add_argument("--queue", type=int, default=20, help="点歌/点播队列长度")
+    parser.add_argument("--frames", type=int, default=200, help="每种模式渲染帧数")
+    parser.add_argument("--distinct", type=int, default=20,
+                        help="循环使用的不同歌名数量 (越大文本缓存命中率越低)")
+    parser.add_argument("--format", default="png", help="编码格式 (png/palette/bmp)")
+    parser.add_argument("--compress-level", type=int, default=6)
+    parser.add_argument("--width", type=int, default=520)
+    parser.add_argument("--height", type=int, default=435)
+    args = parser.parse_args()
+
+    repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    font_path = os.path.join(repo, "assets", "fonts", "JetBrainsMono-Regular.ttf")
+    if not os.path.exists(font_path):
+        font_path = None
+
+    data_dir = tempfile.mkdtemp(prefix="bench_data_")
+    t0 = time.perf_counter()
+    songs, replays, modes, tmp_dirs = build_managers(args, data_dir)
+    setup = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    panel = PanelRenderer(args.width, args.height, os.path.join(data_dir, "panel.png"),
+                          songs, modes, replay_manager=replays, font_path=font_path,
+                          output_options=OutputOptions(args.format, args.compress_level),
+                          write_file=False)
+    init = time.perf_counter() - t0
+
+    names = song_names(args.distinct, seed=99, long_ratio=0.5)
+
+    print(f"歌曲 {songs.total} 首 / 录播 {replays.total} 个 / 队列 {args.queue} / "
+          f"{args.frames} 帧每模式 / {args.width}x{args.height} {args.format}")
+    print(f"构建管理器 {setup * 1000:.0f}ms, 初始化渲染器 {init * 1000:.1f}ms")
+    print()
+    header = (f"{'模式':<10}{'采集p50':>9}{'绘制p50':>9}{'绘制p99':>9}"
+              f"{'编码p50':>9}{'编码p99':>9}{'字节':>9}{'峰值KiB':>10}")
+    print(header)
+    print("-" * 74)
+    try:
+        for mode in Mode:
+            r = bench_mode(panel, modes, songs, mode, args.frames, names)
+            print(f"{mode.key:<12}"
+                  f"{r['capture_p50'] * 1000:>9.3f}"
+                  f"{r['compose_p50'] * 1000:>9.3f}{r['compose_p99'] * 1000:>9.3f}"
+                  f"{r['encode_p50'] * 1000:>9.3f}{r['encode_p99'] * 1000:>9.3f}"
+                  f"{r['bytes']:>9}{r['peak_kib']:>10.1f}")
+        print()
+        print("时间单位 ms；文本缓存:", panel.stats["text_cache"])
+    finally:
+        for d in tmp_dirs:
+            shutil.rmtree(d, ignore_errors=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+点歌搜索基准测试
+
+对比 SongManager.search 的 n-gram 倒排索引与原先的线性扫描
+(在锁内对每首歌做 name.lower() 子串匹配)，歌曲库 1k / 10k / 100k 首。
+
+查询混合:
+  - 命中: 随机歌名中截取的 1~6 字子串 (中文/英文/混排)
+  - 未命中: 歌曲库中不存在的词
+报告建索引耗时、索引内存 (tracemalloc)、每次查询 p50/p99 (µs)，
+并校验两种实现返回的结果一致。
+
+另测 SongManager.search 实际使用的排序搜索 (SongSearch): 建索引耗时
+(含拼音计算) 和拼音/首字母/错字/原文混合查询的 p50/p99。
+
+用法:
+  python benchmarks/bench_search.py
+  python benchmarks/bench_search.py --sizes 1000 50000 --queries 2000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks._synthetic import song_names  # noqa: E402
+from modules.search_index import NgramIndex  # noqa: E402
+from modules.song_search import SongSearch  # noqa: E402
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def linear_search(index: list[tuple[str, str]], keyword: str):
+    """原实现: 逐首小写后做子串匹配"""
+    keyword_lower = keyword.lower()
+    for name, path in index:
+        if keyword_lower in name.lower():
+            return name, path
+    return None
+
+
+def make_queries(names: list[str], count: int, seed: int = 3) -> list[str]:
+    rng = random.Random(seed)
+    misses = ["不存在的歌", "zzzqqq", "Xylophone", "量子力学", "404"]
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            queries.append(rng.choice(misses))
+            continue
+        name = rng.choice(names)
+        length = rng.randint(1, min(6, len(name)))
+        start = rng.randint(0, len(name) - length)
+        query = name[start:start + length]
+        queries.append(query.upper() if rng.random() < 0.2 else query)
+    return queries
+
+
+def make_ranked_queries(search: SongSearch, names: list[str], count: int,
+                        seed: int = 5) -> list[str]:
+    """排序搜索查询: 原文子串 / 全拼 / 首字母 / 相邻字母交换的错字 / 未命中"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        doc_id = rng.randrange(len(names))
+        keys = search.keys(doc_id)
+        kind = rng.random()
+        if kind < 0.25:
+            queries.append(names[doc_id][:rng.randint(2, 6)])
+        elif kind < 0.5:
+            queries.append(keys.pinyin[:rng.randint(4, 12)])
+        elif kind < 0.7:
+            queries.append(keys.initials[:rng.randint(2, 4)])
+        elif kind < 0.9 and len(keys.pinyin) >= 6:
+            p = keys.pinyin[:8]
+            i = rng.randrange(len(p) - 1)
+            queries.append(p[:i] + p[i + 1] + p[i] + p[i + 2:])
+        else:
+            queries.append(rng.choice(["不存在的歌", "zzzqqq", "xylophone"]))
+    return queries
+
+
+def bench_ranked(names: list[str], query_count: int) -> dict:
+    t0 = time.perf_counter()
+    search = SongSearch(names)
+    build = time.perf_counter() - t0
+
+    times = []
+    for query in make_ranked_queries(search, names, query_count):
+        t0 = time.perf_counter()
+        search.top(query, 5)
+        times.append(time.perf_counter() - t0)
+    return {
+        "build_ms": build * 1000,
+        "p50": statistics.median(times) * 1e6,
+        "p99": percentile(times, 99) * 1e6,
+    }
+
+
+def bench_size(size: int, query_count: int) -> dict:
+    names = sorted(song_names(size, seed=size))
+    index = [(name, f"/songs/{name}.mp3") for name in names]
+    queries = make_queries(names, query_count)
+
+    t0 = time.perf_counter()
+    ngram = NgramIndex(name for name, _ in index)
+    build = time.perf_counter() - t0
+
+    # 内存单独测量 (tracemalloc 会拖慢建索引)
+    tracemalloc.start()
+    NgramIndex(name for name, _ in index)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    linear_times, index_times = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        expected = linear_search(index, query)
+        t1 = time.perf_counter()
+        pos = ngram.first(query)
+        t2 = time.perf_counter()
+        got = index[pos] if pos is not None else None
+        if got != expected:
+            raise AssertionError(f"结果不一致: {query!r} → {got} / {expected}")
+        linear_times.append(t1 - t0)
+        index_times.append(t2 - t1)
+
+    return {
+        "names": names,
+        "build_ms": build * 1000,
+        "index_mib": peak / 1024 / 1024,
+        "linear_p50": statistics.median(linear_times) * 1e6,
+        "linear_p99": percentile(linear_times, 99) * 1e6,
+        "index_p50": statistics.median(index_times) * 1e6,
+        "index_p99": percentile(index_times, 99) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点歌搜索基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="歌曲库大小")
+    parser.add_argument("--queries", type=int, default=1000, help="每个规模的查询次数")
+    parser.add_argument("--no-ranked", action="store_true", help="跳过排序搜索测试")
+    args = parser.parse_args()
+
+    header = (f"{'歌曲数':>8}{'建索引ms':>10}{'索引MiB':>9}"
+              f"{'扫描p50':>10}{'扫描p99':>10}{'索引p50':>10}{'索引p99':>10}{'加速':>8}")
+    print(header)
+    print("-" * 78)
+    libraries = []
+    for size in args.sizes:
+        r = bench_size(size, args.queries)
+        libraries.append(r["names"])
+        print(f"{size:>8}{r['build_ms']:>10.0f}{r['index_mib']:>9.1f}"
+              f"{r['linear_p50']:>10.1f}{r['linear_p99']:>10.1f}"
+              f"{r['index_p50']:>10.1f}{r['index_p99']:>10.1f}"
+              f"{r['linear_p50'] / max(r['index_p50'], 1e-3):>7.0f}x")
+    print()
+    print(f"时间单位 µs (每次查询)；{args.queries} 次查询，20% 未命中，结果已与线性扫描逐一核对")
+
+    if args.no_ranked:
+        return
+    print()
+    print(f"{'歌曲数':>8}{'排序建索引ms':>14}{'排序p50':>10}{'排序p99':>10}")
+    print("-" * 42)
+    for names in libraries:
+        r = bench_ranked(names, args.queries)
+        print(f"{len(names):>8}{r['build_ms']:>14.0f}{r['p50']:>10.1f}{r['p99']:>10.1f}")
+    print()
+    print("排序搜索: 原文/全拼/首字母/错字/未命中混合查询，取前 5")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,13 +23,25 @@ import logging
 import os
 import signal
 import sys
+from functools import partial
+from typing import Optional
 
 # 在导入 aiohttp/blivedm 之前应用 brotli 补丁
 from modules import brotli_patch  # noqa: F401
 
 from modules.songs import SongManager
 from modules.replay import ReplayManager
-from modules.panel import PanelRenderer
+from modules.index_store import open_store
+from modules.metadata import MetadataService, open_service
+from modules.request_queue import RequestQueue
+from modules.state_journal import open_journal
+from modules.text_output import TextOutputs
+from modules.scanner import Scanner
+from modules.watcher import DirectoryWatcher
+from modules.panel import PanelRenderer, PanelSource
+from modules.panel_engine import PanelEngine
+from modules.panel_output import OutputOptions
+from modules.text_cache import TextBitmapCache
 from modules.modes import ModeManager, Mode
 
 log = logging.getLogger("main")
@@ -70,40 +82,146 @@ def ensure_dirs(data_dir: str):
     os.makedirs(data_dir, exist_ok=True)
 
 
-async def _song_request_cleanup_loop(vlc, mode_manager: ModeManager, interval: float = 5.0):
-    """自动清除点歌请求，恢复录像"""
-    log.info("点歌自动清除循环启动")
-    song_request_start_time = None
-    TIMEOUT = 15 * 60  # 15分钟超时
+# 附加面板可覆盖、未设置时沿用 [panel] 的选项
+_PANEL_INHERITED = ("format", "compress_level", "output", "http_host",
+                    "marquee", "marquee_speed")
+
+
+def _build_panels(config: configparser.ConfigParser, panel_dir: str, font_path,
+                  source: PanelSource, obs=None) -> list[tuple[str, PanelRenderer, str]]:
+    """按 [panel] 及 [panel.<名称>] 配置创建面板
+
+    Returns:
+        [(配置节, 面板, 输出方式 file/http/both), ...]，第一个为 [panel] 主面板
+    """
+    text_cache = TextBitmapCache()  # 所有面板共用
+    panels = []
+    for section in ["panel"] + [s for s in config.sections() if s.startswith("panel.")]:
+        name = "panel" if section == "panel" else "panel_" + section[len("panel."):]
+
+        def get(key: str, fallback: str) -> str:
+            if section != "panel" and key in _PANEL_INHERITED:
+                fallback = config.get("panel", key, fallback=fallback)
+            return config.get(section, key, fallback=fallback).strip()
+
+        options = OutputOptions(format=get("format", "png").lower(),
+                                compress_level=int(get("compress_level", "6")))
+        # 面板送达 OBS 的方式: file (图像源) / http (浏览器源) / both
+        target = get("output", "file").lower()
+        if target not in ("file", "http", "both"):
+            log.warning(f"未知面板输出方式 [{section}]: {target}，使用 file")
+            target = "file"
+        layout_key = get("layout", "auto").lower()
+        layout = next((m for m in Mode if m.key == layout_key), None)
+        if layout is None and layout_key != "auto":
+            log.warning(f"未知面板布局 [{section}]: {layout_key}，跟随当前模式")
+
+        file_output = target in ("file", "both")
+        panel = PanelRenderer(
+            int(get("width", "520")), int(get("height", "435")),
+            os.path.join(panel_dir, name + options.extension),
+            source.songs, font_path=font_path,
+            obs_controller=obs if file_output else None,
+            text_cache=text_cache, output_options=options, write_file=file_output,
+            marquee=get("marquee", "false").lower() in ("1", "true", "yes", "on"),
+            marquee_speed=float(get("marquee_speed", "3")),
+            source=source, layout=layout,
+            obs_source=get("obs_source", "") or None, name=name,
+        )
+        panels.append((section, panel, target))
+    return panels
+
+
+async def _start_panel_servers(config: configparser.ConfigParser,
+                               panels: list[tuple[str, PanelRenderer, str]]) -> list:
+    """为 http/both 输出的面板启动 HTTP 服务 (OBS 浏览器源)
+
+    附加面板未设置 http_port 时使用 [panel] 的端口加上它的序号 (第一个附加面板 +1)。
+    """
+    servers = []
+    base_port = config.getint("panel", "http_port", fallback=8765)
+    used: dict[tuple[str, int], str] = {}
+    for index, (section, panel, target) in enumerate(panels):
+        if target not in ("http", "both"):
+            continue
+        from modules.panel_server import PanelServer
+        host = config.get(section, "http_host",
+                          fallback=config.get("panel", "http_host", fallback="127.0.0.1"))
+        port = config.getint(section, "http_port", fallback=base_port + index)
+        if (host, port) in used:
+            log.error(f"[{section}] http_port {port} 与 [{used[host, port]}] 重复，"
+                      f"该面板没有浏览器源输出，请设置不同的 http_port")
+            continue
+        used[host, port] = section
+        server = PanelServer(
+            host=host, port=port,
+            width=panel.width, height=panel.height,
+            content_type=panel.content_type,
+        )
+        if await server.start():
+            panel.add_frame_sink(server.publish)
+            servers.append(server)
+        elif target == "http":
+            log.error(f"[{section}] 只输出到浏览器源，HTTP 服务启动失败后该面板没有任何输出")
+    return servers
+
+
+def _build_watcher(config: configparser.ConfigParser, songs: SongManager,
+                   replays: ReplayManager, vlc) -> Optional[DirectoryWatcher]:
+    """目录监视: 歌曲库/录播索引和录像播放列表随目录变化增量更新"""
+    backend = config.get("watch", "backend", fallback="auto").strip().lower()
+    if backend == "off":
+        return None
+    watcher = DirectoryWatcher(
+        backend=backend,
+        debounce=config.getfloat("watch", "debounce", fallback=1.0),
+        max_delay=config.getfloat("watch", "max_delay", fallback=10.0),
+        poll_interval=config.getfloat("watch", "poll_interval", fallback=5.0),
+        rescan_interval=config.getfloat("watch", "rescan_interval", fallback=600.0),
+    )
+    watcher.watch(songs.song_dir, songs.apply_changes, match=songs.matches,
+                  recursive=True, rescan=songs.build_index, name="歌曲库")
+    if replays.replay_dir:
+        watcher.watch(replays.replay_dir, replays.apply_changes, match=replays.matches,
+                      rescan=replays.build_index, name="录播")
+    for directory, name in ((vlc.playback_dir, "录像"), (vlc.replay_dir, "回放列表")):
+        if directory:
+            vlc.watch_directory(directory)
+            watcher.watch(directory, partial(vlc.apply_changes, directory), match=vlc.is_media,
+                          recursive=True, rescan=partial(vlc.refresh_directory, directory),
+                          name=name)
+    return watcher
+
+
+async def _loop_lag_monitor(report_interval: float = 30.0, tick: float = 0.05):
+    """事件循环延迟监测
+
+    每 tick 秒睡眠一次，记录实际唤醒比预期晚了多少；每 report_interval
+    秒汇总输出一次 p50/p99/最大值，用于对比面板渲染等同步工作对
+    弹幕处理和 OBS 调用的影响。
+    """
+    log.info(f"事件循环延迟监测启动 (每 {report_interval:.0f}s 汇报)")
+    loop = asyncio.get_event_loop()
+    samples: list[float] = []
+    last_report = loop.time()
 
     try:
         while True:
-            has_song_request = vlc._current_song_request is not None
-            has_replay_request = vlc._current_replay_request is not None
-
-            if has_song_request:
-                if song_request_start_time is None:
-                    song_request_start_time = asyncio.get_event_loop().time()
-
-                elapsed = asyncio.get_event_loop().time() - song_request_start_time
-                if elapsed > TIMEOUT:
-                    log.info(f"点歌已播放 {elapsed/60:.0f} 分钟，自动恢复录像")
-                    await vlc.clear_song_request()
-                    song_request_start_time = None
-            elif song_request_start_time is not None:
-                song_request_start_time = None
-
-            # 直播/PK模式下清除点歌和点播
-            current = mode_manager.current_mode
-            if current in (Mode.BROADCAST, Mode.PK):
-                if has_song_request:
-                    log.info(f"切换到 {current.chinese_name}，清除点歌请求")
-                    await vlc.clear_song_request()
-                    song_request_start_time = None
-
-            await asyncio.sleep(interval)
+            start = loop.time()
+            await asyncio.sleep(tick)
+            now = loop.time()
+            samples.append(max(0.0, now - start - tick))
+
+            if now - last_report >= report_interval and samples:
+                samples.sort()
+                p50 = samples[len(samples) // 2]
+                p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+                log.info(f"事件循环延迟: p50 {p50 * 1000:.1f}ms / p99 {p99 * 1000:.1f}ms / "
+                         f"最大 {samples[-1] * 1000:.1f}ms ({len(samples)} 次采样)")
+                samples.clear()
+                last_report = now
     except asyncio.CancelledError:
-        log.info("点歌自动清除循环停止")
+        log.info("事件循环延迟监测停止")
         raise
 
 
@@ -111,12 +229,13 @@ async def _on_mode_change(old_mode, new_mode, reason, vlc, obs):
     """模式变更回调 - 统一处理 OBS 源切换和 VLC 播放控制"""
     log.info(f"模式回调: {old_mode} → {new_mode}")
 
-    # 1. 通过 OBS WebSocket 切换源可见性
+    # 1. 通过 OBS WebSocket 切换源可见性 (同一批请求中读取切换前的播放进度)
+    media = None
     if obs and obs.connected:
-        await obs.apply_mode_sources(new_mode.key)
+        media = await obs.switch_mode_sources(new_mode.key, capture_media=True)
 
-    # 2. 通过 VLC 控制器处理模式切换（保存/恢复状态）
-    await vlc.transition_to_mode(old_mode.key, new_mode.key)
+    # 2. 通过 VLC 控制器处理模式切换（保存/恢复状态与进度）
+    await vlc.transition_to_mode(old_mode.key, new_mode.key, media)
 
 
 async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
@@ -137,10 +256,11 @@ async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
     if replay_dir and not os.path.isdir(replay_dir):
         log.warning(f"录播目录不存在: {replay_dir}")
 
-    panel_width = config.getint("panel", "width", fallback=520)
-    panel_height = config.getint("panel", "height", fallback=435)
     panel_interval = config.getfloat("panel", "refresh_interval", fallback=1.0)
-    panel_output = os.path.join(data_dir, "panel.png")
+    panel_threaded = config.getboolean("panel", "render_in_thread", fallback=True)
+    # 面板输出目录 (可指向 tmpfs/内存盘)，默认 data_dir
+    panel_dir = config.get("panel", "output_dir", fallback="").strip() or data_dir
+    ensure_dirs(panel_dir)
 
     # 字体路径
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -148,24 +268,78 @@ async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
     if not os.path.exists(font_path):
         font_path = None
 
+    # 歌曲/录播索引缓存 (data_dir/index.db): 目录未变时启动不再列目录
+    index_store = open_store(data_dir) if config.getboolean(
+        "paths", "index_cache", fallback=True) else None
+
+    # 歌曲库/录播/录像目录共用的并行扫描器 (单目录超时，NAS 卡死不拖住启动)
+    scanner = Scanner(workers=config.getint("paths", "scan_workers", fallback=8),
+                      timeout=config.getfloat("paths", "scan_timeout", fallback=10.0))
+
+    # 媒体元数据 (时长等)，后台进程池解析，结果缓存在 data_dir/media.db
+    metadata: Optional[MetadataService] = None
+    if config.getboolean("metadata", "enabled", fallback=True):
+        metadata = open_service(
+            data_dir,
+            workers=config.getint("metadata", "workers", fallback=2),
+            batch=config.getint("metadata", "batch", fallback=16),
+            interval=config.getfloat("metadata", "interval", fallback=0.0),
+            ffprobe=config.getboolean("metadata", "ffprobe", fallback=True),
+        )
+
+    # OBS 文本源输出 (now_playing.txt / ticker.txt): 合并突发更新，线程池中原子写入
+    outputs = TextOutputs(data_dir)
+
+    # 运行状态日志 (data_dir/state.journal): 队列、模式、各模式播放进度，重启后恢复
+    journal = None
+    saved = None
+    if config.getboolean("state", "enabled", fallback=True) and not panel_only:
+        journal = open_journal(data_dir,
+                               delay=config.getfloat("state", "flush_delay", fallback=0.5),
+                               compact_every=config.getint("state", "compact_every", fallback=1000))
+        saved = journal.load()
+
+    # 点歌/点播队列: 同一首不重复排队，按点歌人轮转，每人排队数有上限
+    per_user = config.getint("queue", "per_user", fallback=3)
+    max_size = config.getint("queue", "max_size", fallback=50)
+
     # 初始化歌曲管理器
-    songs = SongManager(song_dir, data_dir)
-    log.info(f"歌曲库: {songs.total} 首 (来自: {song_dir})")
+    songs = SongManager(song_dir, data_dir, index_store, scanner, metadata,
+                        cache_size=config.getint("paths", "search_cache", fallback=512),
+                        queue=RequestQueue(per_user, max_size), outputs=outputs, journal=journal)
+    stats = songs.index_stats
+    log.info(f"歌曲库: {songs.total} 首 (来自: {song_dir}, {stats['dirs']} 个目录, "
+             f"索引 {stats['elapsed_ms']}ms, {'热启动' if stats['warm'] else '冷启动'}, "
+             f"新计算检索形式 {stats['keys_derived']} 首)")
+    if stats["timed_out"]:
+        log.warning(f"歌曲库有 {stats['timed_out']} 个目录扫描超时，沿用上次的索引记录")
 
     # 初始化回放管理器
-    replays = ReplayManager(replay_dir or "", data_dir)
+    replays = ReplayManager(replay_dir or "", data_dir, index_store, scanner, metadata,
+                            queue=RequestQueue(per_user, max_size), journal=journal)
     if replay_dir:
         log.info(f"录播库: {replays.total} 个 (来自: {replay_dir})")
 
+    if saved is not None:
+        restored_songs = songs.queue_restore(saved.queues.get("songs", {}))
+        restored_replays = replays.queue_restore(saved.queues.get("replays", {}))
+        if restored_songs or restored_replays:
+            log.info(f"已恢复队列: 点歌 {restored_songs} 首, 点播 {restored_replays} 个")
+
     # 初始化模式管理器
     mode_manager = ModeManager()
     log.info("模式管理器已初始化 (默认录像模式)")
 
+    # 面板数据源: 所有面板每个 tick 共用一份快照
+    panel_source = PanelSource(songs, mode_manager, replays)
+
     if panel_only:
-        panel = PanelRenderer(panel_width, panel_height, panel_output, songs, mode_manager,
-                              replay_manager=replays, font_path=font_path)
-        panel.render()
-        log.info(f"面板已生成: {panel_output}")
+        panels = _build_panels(config, panel_dir, font_path, panel_source)
+        PanelEngine([p for _, p, _ in panels], panel_source).render(force=True)
+        for _, panel, _ in panels:
+            enc = panel.stats["encoder"]
+            log.info(f"面板已生成: {panel.output_path} "
+                     f"({enc['format']}, 编码 {enc['encode_ms']}ms, {enc['bytes_per_frame']} 字节)")
         return
 
     # 延迟导入 (panel-only 模式不需要这些)
@@ -179,6 +353,7 @@ async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
     obs_password = config.get("obs", "password", fallback="")
     obs_scene = config.get("obs", "scene_name", fallback="AScreen")
     obs_vlc_source = config.get("obs", "vlc_source", fallback="vlc_player")
+    obs_vlc_source_b = config.get("obs", "vlc_source_b", fallback="")
     obs_broadcast_source = config.get("obs", "broadcast_source", fallback="broadcast_screen")
     obs_panel_source = config.get("obs", "panel_source", fallback="B区-终端面板")
 
@@ -187,6 +362,7 @@ async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
         scene_name=obs_scene, vlc_source_name=obs_vlc_source,
         broadcast_source_name=obs_broadcast_source,
         panel_source_name=obs_panel_source,
+        vlc_source_b=obs_vlc_source_b,
     )
 
     # 连接 OBS (非阻塞，后台自动重连)
@@ -207,7 +383,12 @@ async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
         song_dir=song_dir,
         replay_dir=replay_dir or "",
         data_dir=data_dir,
+        scanner=scanner,
+        window=config.getint("obs", "playlist_window", fallback=50),
+        journal=journal,
     )
+    if saved is not None:
+        vlc.restore_states(saved.playback)
 
     # 注册模式变更回调
     async def mode_change_callback(old_mode, new_mode, reason):
@@ -215,31 +396,69 @@ async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
 
     mode_manager.register_mode_change_callback(mode_change_callback)
 
-    # 初始化面板
-    panel = PanelRenderer(
-        panel_width, panel_height, panel_output,
-        songs, mode_manager, replay_manager=replays,
-        font_path=font_path, obs_controller=obs,
-    )
+    # 点歌队列播完: 歌曲模式切回录像；其他模式下即时播放的点歌回到该模式的播放
+    async def song_queue_empty():
+        if mode_manager.current_mode == Mode.MUSIC:
+            await mode_manager.auto_switch_for_song_request(0)
+        else:
+            await vlc.transition_to_mode("music", mode_manager.current_mode.key)
+
+    vlc.on_song_queue_empty = song_queue_empty
+
+    if journal is not None:
+        def record_mode(old_mode, new_mode, reason):
+            journal.record("mode", mode=new_mode.key)
+
+        mode_manager.register_mode_change_callback(record_mode)
+
+    # 点歌/点播播完 (OBS 媒体事件) 时立即播放队列下一项
+    obs.add_media_handler(vlc.handle_media_event)
+
+    # 初始化面板 (仅文件输出需要通过 OBS 刷新图像源)
+    panels = _build_panels(config, panel_dir, font_path, panel_source, obs)
+    panel_engine = PanelEngine([p for _, p, _ in panels], panel_source)
+
+    # 面板 HTTP 服务 (OBS 浏览器源)
+    panel_servers = await _start_panel_servers(config, panels)
 
     # 写入 ticker.txt
     ticker_text = config.get("paths", "ticker_text",
                              fallback="欢迎来到程序员的深夜电台 ~ 发「点歌 歌名」即可点歌")
-    ticker_file = os.path.join(data_dir, "ticker.txt")
-    if not os.path.exists(ticker_file):
-        with open(ticker_file, "w", encoding="utf-8") as f:
-            f.write(ticker_text)
+    if not outputs.exists("ticker"):
+        outputs.set("ticker", ticker_text)
 
-    tasks = []
+    tasks = [asyncio.create_task(outputs.run()), asyncio.create_task(obs.watch_events())]
+    # 媒体事件不可用时按源状态/时长兜底切下一项
+    tasks.append(asyncio.create_task(vlc.watch_requests(
+        grace=config.getfloat("metadata", "grace", fallback=30.0))))
+    if journal is not None:
+        tasks.append(asyncio.create_task(journal.run()))
 
     # 启动面板渲染
-    tasks.append(asyncio.create_task(panel.render_loop(panel_interval)))
-
-    # 启动点歌自动清除
-    tasks.append(asyncio.create_task(_song_request_cleanup_loop(vlc, mode_manager, 5)))
-
-    # 触发初始模式 (启动录像)
-    await mode_manager.set_mode(Mode.VIDEO, "系统启动")
+    tasks.append(asyncio.create_task(panel_engine.run(panel_interval, threaded=panel_threaded)))
+
+    # 事件循环延迟监测 (可选)
+    lag_report = config.getfloat("debug", "loop_lag_report", fallback=0)
+    if lag_report > 0:
+        tasks.append(asyncio.create_task(_loop_lag_monitor(lag_report)))
+
+    # 目录监视 (新歌/新录播无需重启)
+    watcher = _build_watcher(config, songs, replays, vlc)
+    if watcher is not None:
+        tasks.append(asyncio.create_task(watcher.run()))
+
+    # 元数据后台解析
+    if metadata is not None:
+        tasks.append(asyncio.create_task(metadata.run()))
+
+    # 进入初始模式: 上次运行的模式 (PK 只在直播中发生，恢复为直播模式)，否则录像
+    initial = mode_manager.get_mode_by_key(saved.mode) if saved is not None and saved.mode else None
+    if initial == Mode.PK:
+        initial = Mode.BROADCAST
+    if initial is not None:
+        await mode_manager.resume(initial, "恢复上次运行的模式")
+    else:
+        await mode_manager.resume(Mode.VIDEO, "系统启动")
 
     # 启动弹幕机器人
     room_id = config.getint("bilibili", "room_id", fallback=0)
@@ -270,9 +489,18 @@ async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
     log.info("=" * 45)
     log.info("  程序员深夜电台 - 所有服务已启动")
     log.info(f"  OBS WebSocket: {obs_host}:{obs_port} ({'已连接' if obs_connected else '等待连接'})")
-    log.info(f"  面板输出:  {panel_output}")
-    log.info(f"  歌曲数量:  {songs.total}")
-    log.info(f"  录播数量:  {replays.total}")
+    for _, panel, target in panels:
+        if target in ("file", "both"):
+            log.info(f"  面板输出:  {panel.output_path}")
+    for server in panel_servers:
+        log.info(f"  面板浏览器源: {server.url}")
+    for label, manager in (("歌曲", songs), ("录播", replays)):
+        stats = manager.index_stats
+        if stats:
+            log.info(f"  {label}数量:  {manager.total} (索引 {stats['elapsed_ms']}ms, "
+                     f"{'热启动' if stats['warm'] else '冷启动'})")
+        else:
+            log.info(f"  {label}数量:  {manager.total}")
     log.info("  按 Ctrl+C 优雅退出")
     log.info("=" * 45)
 
@@ -281,8 +509,22 @@ async def run_all(config: configparser.ConfigParser, panel_only: bool = False):
     except asyncio.CancelledError:
         pass
     finally:
+        outputs.flush()
+        if journal is not None:
+            journal.flush()
         vlc.close()
+        panel_engine.close()
+        for server in panel_servers:
+            await server.stop()
         await obs.disconnect()
+        if index_store is not None:
+            index_store.close()
+        cache = songs.search_cache_stats
+        if cache["hits"] or cache["misses"]:
+            log.info(f"点歌搜索缓存: 命中 {cache['hits']} 次 (其中未找到 {cache['negative_hits']} 次), "
+                     f"未命中 {cache['misses']} 次, 命中率 {cache['hit_rate']:.0%}")
+        if metadata is not None:
+            metadata.close()
 
 
 def main():
@@ -0,0 +1,73 @@
+"""
+合并写入 - TextOutputs 与 StateJournal 共用的后台写盘循环
+
+更新只放进内存中的待写数据 (调用方不等待磁盘)，run 循环被唤醒后再等 delay 秒，
+期间的后续更新合并为一次，在线程池中调用 flush 写盘。
+事件循环未运行 (面板单次渲染、基准测试等) 或已关闭时，更新直接同步写入。
+"""
+
+import asyncio
+import threading
+from typing import Any, Optional
+
+
+class CoalescingWriter:
+    """合并写入的基类
+
+    子类在 _lock 下更新自己的待写数据后调用 _notify，并实现:
+      _take_pending()        在 _lock 下取出并清空待写数据 (没有时返回空值)
+      _write_pending(data)   在 _io_lock 下写盘
+    """
+
+    def __init__(self, delay: float):
+        """
+        Args:
+            delay: 收到更新后等待的秒数，期间的后续更新合并为一次写入
+        """
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()  # 取待写数据与写盘一起串行，保证先后顺序
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def _take_pending(self) -> Any:
+        raise NotImplementedError
+
+    def _write_pending(self, pending: Any):
+        raise NotImplementedError
+
+    def _notify(self):
+        """有新的待写数据: 唤醒后台循环，循环未运行时立即写入"""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None:
+            self.flush()
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            self.flush()  # 事件循环已关闭
+
+    def flush(self):
+        """立即写入所有待写数据"""
+        with self._io_lock:
+            with self._lock:
+                pending = self._take_pending()
+            if pending:
+                self._write_pending(pending)
+
+    async def run(self):
+        """后台写入循环"""
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._loop = loop
+        try:
+            while True:
+                await self._wake.wait()
+                if self.delay > 0:
+                    await asyncio.sleep(self.delay)
+                self._wake.clear()
+                await loop.run_in_executor(None, self.flush)
+        finally:
+            self._loop = None
+            self._wake = None
+            self.flush()
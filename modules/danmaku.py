@@ -24,6 +24,7 @@ from bilibili_api import live as bili_live, Credential, Danmaku
 
 from .songs import SongManager
 from .replay import ReplayManager
+from .request_queue import QueueResult, QueueStatus
 from .vlc_control import VLCController
 from .modes import ModeManager, Mode
 
@@ -135,6 +136,21 @@ class DanmakuBot:
                         retry_count = 0
                         await asyncio.sleep(DANMAKU_SEND_INTERVAL * 3)
 
+    def _requester(self, uid: int):
+        """队列中的点歌人: 主播本人不受每人排队上限约束"""
+        return None if uid == self.uid else uid
+
+    @staticmethod
+    def _queue_reply(result: QueueResult, title: str) -> str:
+        """入队结果的回复 (位置放在前面，歌名过长时截断的是歌名)"""
+        if result.status == QueueStatus.ADDED:
+            return f">_ 你排在第{result.position}位：{title}"
+        if result.status == QueueStatus.DUPLICATE:
+            return f">_ 已在队列第{result.position}位：{title}"
+        if result.status == QueueStatus.USER_LIMIT:
+            return f">_ 你点的还在排队 (最后一首第{result.position}位)，请等播完再点"
+        return ">_ 队列已满，请稍后再点"
+
     async def _handle_danmaku(self, text: str, uid: int, uname: str):
         """处理弹幕命令"""
 
@@ -153,12 +169,14 @@ class DanmakuBot:
             songname, filepath = result
             current_mode = self.mode_manager.current_mode if self.mode_manager else None
 
-            # 仅直播模式添加到队列，其他模式立即播放
-            if current_mode and current_mode.name == "BROADCAST":
-                self.songs.queue_add(filepath, songname)
-                queue_count = self.songs.queue_count
-                await self._send_reply(f">_ 已添加到队列：{songname}")
-                log.info(f"[点歌] {uname}: {keyword} -> {songname} (队列, 位置: {queue_count})")
+            # 直播模式、或已有点歌在播放时加入队列 (播完由 OBS 媒体事件自动接上)，否则立即播放
+            if (current_mode and current_mode.name == "BROADCAST") or self.vlc._current_song_request:
+                result = self.songs.queue_add(filepath, songname, self._requester(uid))
+                await self._send_reply(self._queue_reply(result, songname))
+                if result.added:
+                    await self.vlc.stage_next()
+                log.info(f"[点歌] {uname}: {keyword} -> {songname} "
+                         f"(队列 {result.status.value}, 位置: {result.position})")
             else:
                 try:
                     await self.vlc.play(filepath)
@@ -183,7 +201,11 @@ class DanmakuBot:
                 return
 
             replay_code, filepath = result
-            self.replays.queue_add(replay_code, filepath)
+            queued = self.replays.queue_add(replay_code, filepath, self._requester(uid))
+            if not queued.added:
+                await self._send_reply(self._queue_reply(queued, replay_code))
+                log.info(f"[点播] {uname}: {code} -> {queued.status.value}")
+                return
 
             # 自动切换到回放模式
             if self.mode_manager and self.mode_manager.current_mode != Mode.REPLAY:
@@ -194,10 +216,12 @@ class DanmakuBot:
                 item = self.replays.queue_pop()
                 if item:
                     await self.vlc.play_replay(item[1], item[0])
+            else:
+                await self.vlc.stage_next()
 
-            queue_count = self.replays.queue_count
-            if queue_count > 0:
-                await self._send_reply(f">_ 已加入点播队列：{replay_code} (排队{queue_count})")
+            position = self.replays.queue_position(replay_code)
+            if position > 0:
+                await self._send_reply(f">_ 已加入点播队列第{position}位：{replay_code}")
             else:
                 await self._send_reply(f">_ 正在播放录播：{replay_code}")
             log.info(f"[点播] {uname}: {code} -> {replay_code}")
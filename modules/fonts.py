@@ -0,0 +1,290 @@
+"""
+字体注册表与字体度量
+
+FontRegistry (进程级共享):
+  - 按 (文字体系, 字号) 懒加载 FreeType 字体，首次使用才加载，所有渲染器共用
+  - 字体来源 (指定路径 / 系统字体名回退链 / CJK 字体搜索) 只解析一次
+  - 预计算的码位覆盖表把文本切分为 拉丁/CJK 字体段，混排标题每段用对应字体绘制
+
+GlyphMetrics (按字号):
+  面板原来按字符数截断 (如 song[:22])，中文标题会溢出面板，
+  英文标题却只占一半宽度。这里维护字形前进宽度表，按实际像素宽度
+  截断并补省略号，或生成跑马灯滚动窗口。前进宽度表预填可打印 ASCII，
+  其余字符首次出现时查询一次 FreeType 后永久缓存；适配结果按
+  (文本, 宽度) 记忆，稳态下每帧不再产生任何 FreeType 调用。
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from PIL import ImageFont
+
+log = logging.getLogger("panel")
+
+# 字号档位 - 适配 520×435 面板在 1080p 直播中的可读性
+# 观众在全屏 1080p 观看时，B区仅占 ~27% 屏幕宽度
+SIZES = {"xs": 14, "sm": 17, "md": 20, "lg": 26, "xl": 32}
+
+# 拉丁字体回退链 (系统字体名)
+_LATIN_FONT_FALLBACKS = ["JetBrainsMono-Regular.ttf", "Consolas", "consola.ttf",
+                         "DejaVuSansMono.ttf", "LiberationMono-Regular.ttf"]
+
+# CJK 字体搜索路径
+_CJK_FONT_CANDIDATES = [
+    # Windows
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/msyhbd.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "C:/Windows/Fonts/simsun.ttc",
+    # Linux
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+]
+
+ELLIPSIS = "…"
+
+# 跑马灯首尾之间的间隔
+MARQUEE_GAP = "   "
+
+# 每个字号记忆的适配结果条数上限 / 每个注册表记忆的分段结果条数上限
+_FIT_CACHE_SIZE = 1024
+_RUN_CACHE_SIZE = 4096
+
+# 文字体系
+LATIN = 0
+CJK = 1
+_NEUTRAL = 2  # 符号等: 跟随相邻字体段，避免把 "♫ 晴天" 拆成三段
+
+
+def _build_coverage() -> bytearray:
+    """BMP 码位 → 文字体系 查找表 (64KB，模块加载时构建一次)"""
+    table = bytearray([_NEUTRAL]) * 0x10000
+    for cp in range(0x21, 0x7F):  # 空格保持中性，"点歌 歌名" 不会被拆开
+        table[cp] = LATIN
+    for start, end in ((0x4E00, 0x9FFF),    # CJK Unified Ideographs
+                       (0x3400, 0x4DBF),    # CJK Extension A
+                       (0x3000, 0x303F),    # CJK Symbols
+                       (0xFF00, 0xFFEF)):   # Fullwidth Forms
+        table[start:end + 1] = bytes([CJK]) * (end - start + 1)
+    return table
+
+
+_COVERAGE = _build_coverage()
+
+
+def script_of(ch: str) -> int:
+    cp = ord(ch)
+    if cp < 0x10000:
+        return _COVERAGE[cp]
+    return CJK if 0x20000 <= cp <= 0x3FFFF else _NEUTRAL  # CJK Extension B+
+
+
+def find_cjk_font() -> Optional[str]:
+    """查找 CJK 字体"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    bundled = os.path.join(script_dir, "..", "assets", "fonts", "NotoSansCJKsc-Regular.otf")
+    if os.path.exists(bundled):
+        return bundled
+    for path in _CJK_FONT_CANDIDATES:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class GlyphMetrics:
+    """某一字号的字形前进宽度表 + 文本适配结果缓存
+
+    font_for 按字符返回绘制它的字体，混排文本逐字按对应字体计宽。
+    """
+
+    def __init__(self, font_for: Callable[[str], ImageFont.FreeTypeFont]):
+        self._font_for = font_for
+        self._advances: dict[str, float] = {
+            chr(cp): font_for(chr(cp)).getlength(chr(cp)) for cp in range(0x20, 0x7F)
+        }
+        self._fits: OrderedDict[tuple, str] = OrderedDict()
+
+    def advance(self, ch: str) -> float:
+        width = self._advances.get(ch)
+        if width is None:
+            width = self._advances[ch] = self._font_for(ch).getlength(ch)
+        return width
+
+    def width(self, text: str) -> float:
+        """文本像素宽度 (前进宽度之和)"""
+        advances = self._advances
+        total = 0.0
+        for ch in text:
+            width = advances.get(ch)
+            if width is None:
+                width = self.advance(ch)
+            total += width
+        return total
+
+    def fit(self, text: str, max_width: float, ellipsis: str = ELLIPSIS) -> str:
+        """截断到 max_width 像素以内，被截断时末尾补 ellipsis"""
+        key = (text, max_width, ellipsis)
+        result = self._fits.get(key)
+        if result is not None:
+            self._fits.move_to_end(key)
+            return result
+
+        result = self._fit(text, max_width, ellipsis)
+        self._fits[key] = result
+        if len(self._fits) > _FIT_CACHE_SIZE:
+            self._fits.popitem(last=False)
+        return result
+
+    def _fit(self, text: str, max_width: float, ellipsis: str) -> str:
+        if self.width(text) <= max_width:
+            return text
+        budget = max_width - self.width(ellipsis)
+        used = 0.0
+        for i, ch in enumerate(text):
+            used += self.advance(ch)
+            if used > budget:
+                return text[:i].rstrip() + ellipsis
+        return text
+
+    def marquee(self, text: str, tick: int, max_width: float) -> str:
+        """跑马灯窗口: 文本循环左移 tick 个字符后截取到 max_width"""
+        loop = text + MARQUEE_GAP
+        offset = tick % len(loop)
+        return self.fit(loop[offset:] + loop[:offset], max_width, ellipsis="")
+
+
+class FontRegistry:
+    """进程级字体注册表: 懒加载字体、字体分段、按字号的字形度量"""
+
+    def __init__(self, font_path: Optional[str] = None, cjk_path: Optional[str] = None):
+        self.font_path = font_path
+        self.cjk_path = cjk_path
+        self._latin_source: Optional[str] = None  # 解析后的拉丁字体来源
+        self._fonts: dict[tuple[int, int], ImageFont.FreeTypeFont] = {}
+        self._metrics: dict[int, GlyphMetrics] = {}
+        self._runs: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.RLock()
+
+        if cjk_path:
+            log.info(f"CJK 字体: {cjk_path}")
+
+    @property
+    def key(self) -> tuple:
+        """字体来源标识，用于判断依赖字体的缓存是否失效"""
+        return (self.font_path, self.cjk_path)
+
+    def _load_latin(self, size: int) -> ImageFont.FreeTypeFont:
+        """加载拉丁字体: 首次按回退链解析来源，之后直接加载"""
+        if self._latin_source:
+            return ImageFont.truetype(self._latin_source, size)
+        candidates = ([self.font_path] if self.font_path and os.path.exists(self.font_path) else [])
+        for source in candidates + _LATIN_FONT_FALLBACKS:
+            try:
+                font = ImageFont.truetype(source, size)
+            except Exception:
+                continue
+            self._latin_source = source
+            return font
+        log.warning("未找到可用的等宽字体，使用 Pillow 默认字体")
+        return ImageFont.load_default()
+
+    def font(self, script: int, size: int) -> ImageFont.FreeTypeFont:
+        """获取字体 (首次使用时加载)"""
+        key = (script, size)
+        font = self._fonts.get(key)
+        if font is not None:
+            return font
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is None:
+                if script == CJK and self.cjk_path:
+                    try:
+                        font = ImageFont.truetype(self.cjk_path, size)
+                    except Exception as e:
+                        log.warning(f"CJK 字体加载失败: {e}")
+                if font is None:
+                    font = self.font(LATIN, size) if script == CJK else self._load_latin(size)
+                self._fonts[key] = font
+        return font
+
+    def font_for_char(self, ch: str, size: int) -> ImageFont.FreeTypeFont:
+        return self.font(CJK if script_of(ch) == CJK else LATIN, size)
+
+    def font_runs(self, text: str, size: int) -> list:
+        """文本的 [(片段, 字体), ...]，相邻且字体相同的片段合并
+
+        没有 CJK 字体时 CJK 片段回退到拉丁字体，整行合并为一段。
+        """
+        merged: list = []
+        for segment, script in self.runs(text):
+            font = self.font(script, size)
+            if merged and merged[-1][1] is font:
+                merged[-1] = (merged[-1][0] + segment, font)
+            else:
+                merged.append((segment, font))
+        return merged
+
+    def metrics(self, size: int) -> GlyphMetrics:
+        """某一字号的字形度量"""
+        metrics = self._metrics.get(size)
+        if metrics is None:
+            with self._lock:
+                metrics = self._metrics.get(size)
+                if metrics is None:
+                    metrics = self._metrics[size] = GlyphMetrics(
+                        lambda ch: self.font_for_char(ch, size))
+        return metrics
+
+    def runs(self, text: str) -> tuple:
+        """把文本切分为 ((片段, 文字体系), ...)
+
+        符号等中性字符并入相邻片段；结果按文本记忆。
+        """
+        with self._lock:
+            cached = self._runs.get(text)
+            if cached is not None:
+                self._runs.move_to_end(text)  # LRU: 常用的滚动字幕/队列文本不被挤出
+                return cached
+
+        runs = []
+        start = 0
+        current = _NEUTRAL
+        for i, ch in enumerate(text):
+            script = script_of(ch)
+            if script == _NEUTRAL or script == current:
+                continue
+            if current == _NEUTRAL:
+                current = script  # 前导中性字符并入第一个确定的片段
+                continue
+            runs.append((text[start:i], current))
+            start = i
+            current = script
+        if text:
+            runs.append((text[start:], LATIN if current == _NEUTRAL else current))
+
+        result = tuple(runs)
+        with self._lock:
+            self._runs[text] = result
+            if len(self._runs) > _RUN_CACHE_SIZE:
+                self._runs.popitem(last=False)
+        return result
+
+
+_registries: dict[tuple, FontRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(font_path: Optional[str] = None) -> FontRegistry:
+    """获取进程级共享的字体注册表 (同一字体路径只创建一次)"""
+    with _registries_lock:
+        registry = _registries.get(font_path)
+        if registry is None:
+            registry = _registries[font_path] = FontRegistry(font_path, find_cjk_font())
+        return registry
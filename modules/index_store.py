@@ -0,0 +1,248 @@
+"""
+歌曲/录播索引的持久化存储 (data_dir/index.db, SQLite)
+
+歌曲库和录播目录放在 NAS 上时，每次启动都要列目录、逐个匹配扩展名，
+再为每首歌计算拼音等检索形式，连接 OBS 之前就要卡上好几秒。
+
+这里把扫描结果存进 SQLite (按使用方 scope 区分，如 songs / replays):
+  dirs   每个目录的 mtime 和上级目录 (目录中增删/改名文件时 mtime 变化)
+  files  每个文件的 大小/mtime
+  keys   歌名 → 检索形式 (按歌名存，文件移动/改扩展名后仍可复用)
+
+扫描时 (scanner.Scanner) 每个目录先 stat 一次: mtime 未变则直接用库中的
+文件和子目录列表，不再列目录；变了才重新列目录，结束后统一与库中记录对比
+写回。检索形式只为新出现的歌名计算。扫描超时的目录沿用库中的旧记录。
+
+目录 mtime 的精度有限 (FAT 为 2 秒)，扫描时刚被修改过的目录不记录 mtime，
+下次启动一定重新扫描，避免同一时间粒度内的后续改动被漏掉。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from .scanner import DirListing, FileEntry, Lister, list_directory
+from .song_search import KEYS_VERSION, SearchKeys
+
+log = logging.getLogger("songs")
+
+SCHEMA_VERSION = "2"
+
+# 目录 mtime 距扫描时刻不足该秒数时不信任 (下次启动重新扫描)
+_MTIME_GRACE = 2.0
+
+# SQLite 单条语句的参数个数上限 (保守取值)
+_MAX_VARS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    scope TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    mtime_ns INTEGER,
+    PRIMARY KEY (scope, path)
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (scope, parent);
+CREATE TABLE IF NOT EXISTS files (
+    scope TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (scope, dir, name)
+);
+CREATE TABLE IF NOT EXISTS keys (
+    name TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    pinyin TEXT NOT NULL,
+    initials TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class DirScan:
+    """一次扫描写回持久化索引的统计"""
+    listed: int = 0  # 重新列过的目录数
+    cached: int = 0  # 未变、直接使用记录的目录数
+    changed: int = 0  # 新增或大小/mtime 变化的文件数
+    removed: int = 0
+
+    @property
+    def rescanned(self) -> bool:
+        return self.listed > 0
+
+
+def _within(path: str, root: str) -> bool:
+    return path == root or path.startswith(root + os.sep)
+
+
+class IndexStore:
+    """索引持久化 (线程安全，整个进程共用一个实例)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        with self._db:
+            if self._meta("schema") != SCHEMA_VERSION:
+                self._db.executescript(
+                    "DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS keys;")
+            self._db.executescript(_SCHEMA)
+            self._set_meta("schema", SCHEMA_VERSION)
+            if self._meta("keys") != KEYS_VERSION:
+                # pypinyin/zhconv 安装状态或计算方式变了，检索形式全部重算
+                self._db.execute("DELETE FROM keys")
+                self._set_meta("keys", KEYS_VERSION)
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _stored_files(self, scope: str, directory: str) -> list[FileEntry]:
+        rows = self._db.execute(
+            "SELECT name, size, mtime_ns FROM files WHERE scope = ? AND dir = ?", (scope, directory))
+        return [FileEntry(name, os.path.join(directory, name), size, mtime_ns)
+                for name, size, mtime_ns in rows]
+
+    def _stored_subdirs(self, scope: str, directory: str) -> list[str]:
+        rows = self._db.execute(
+            "SELECT path FROM dirs WHERE scope = ? AND parent = ?", (scope, directory))
+        return [path for (path,) in rows]
+
+    def lister(self, scope: str) -> Lister:
+        """供 Scanner.walk 使用的列目录函数: 目录 mtime 未变时返回库中的记录
+
+        match 变化 (如扩展名表调整) 时需先调用 forget 清除该 scope 的记录。
+        """
+        def list_cached(path: str, match: Callable[[str], object]) -> DirListing:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with self._lock:
+                row = self._db.execute("SELECT mtime_ns FROM dirs WHERE scope = ? AND path = ?",
+                                       (scope, path)).fetchone()
+                if row is not None and row[0] == mtime_ns:
+                    return DirListing(path, mtime_ns, self._stored_files(scope, path),
+                                      self._stored_subdirs(scope, path), cached=True)
+            return list_directory(path, match)
+        return list_cached
+
+    def fallback(self, scope: str, path: str) -> list[FileEntry]:
+        """扫描超时的目录: 返回库中该目录及其子目录的旧记录"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT dir, name, size, mtime_ns FROM files WHERE scope = ?", (scope,)).fetchall()
+        return [FileEntry(name, os.path.join(d, name), size, mtime_ns)
+                for d, name, size, mtime_ns in rows if _within(d, path)]
+
+    def record(self, scope: str, root: str, listings: Iterable[DirListing],
+               recursive: bool = True) -> DirScan:
+        """把一次扫描的结果写回库中
+
+        重新列过的目录与记录逐个对比；root 下未出现在本次扫描中的目录视为已删除
+        (超时目录及其子目录除外，保留旧记录)。
+        """
+        stats = DirScan()
+        now = time.time()
+        visited: set[str] = set()
+        skipped: list[str] = []
+        with self._lock, self._db:
+            for listing in listings:
+                if listing.timed_out:
+                    skipped.append(listing.path)
+                    continue
+                if listing.error:
+                    continue
+                visited.add(listing.path)
+                if listing.cached:
+                    stats.cached += 1
+                    continue
+                stats.listed += 1
+                stored = {f.name: f for f in self._stored_files(scope, listing.path)}
+                current = {f.name: f for f in listing.files}
+                changed = [f for f in listing.files if stored.get(f.name) != f]
+                removed = [name for name in stored if name not in current]
+                self._db.executemany(
+                    "DELETE FROM files WHERE scope = ? AND dir = ? AND name = ?",
+                    ((scope, listing.path, name) for name in removed))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO files (scope, dir, name, size, mtime_ns) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    ((scope, listing.path, f.name, f.size, f.mtime_ns) for f in changed))
+                stats.changed += len(changed)
+                stats.removed += len(removed)
+                # 刚被修改过的目录: 本轮之后同一 mtime 粒度内可能还有改动
+                trusted = now - listing.mtime_ns / 1e9 > _MTIME_GRACE
+                parent = "" if listing.path == root else os.path.dirname(listing.path)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO dirs (scope, path, parent, mtime_ns) VALUES (?, ?, ?, ?)",
+                    (scope, listing.path, parent, listing.mtime_ns if trusted else None))
+                if not recursive:
+                    continue
+                # 子目录先登记 (mtime 为空)，即使本轮未能列出，下次也会被扫描
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO dirs (scope, path, parent, mtime_ns) VALUES (?, ?, ?, NULL)",
+                    ((scope, subdir, listing.path) for subdir in listing.subdirs))
+
+            stale = [path for (path,) in self._db.execute(
+                "SELECT path FROM dirs WHERE scope = ?", (scope,))
+                if _within(path, root) and path not in visited
+                and not any(_within(path, s) for s in skipped)]
+            for path in stale:
+                stats.removed += self._db.execute(
+                    "DELETE FROM files WHERE scope = ? AND dir = ?", (scope, path)).rowcount
+                self._db.execute("DELETE FROM dirs WHERE scope = ? AND path = ?", (scope, path))
+        return stats
+
+    def forget(self, scope: str):
+        """丢弃某个 scope 的全部目录记录 (下次扫描重新列目录)"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM dirs WHERE scope = ?", (scope,))
+            self._db.execute("DELETE FROM files WHERE scope = ?", (scope,))
+
+    def load_keys(self, names: Iterable[str]) -> dict[str, SearchKeys]:
+        """读取已持久化的检索形式 {歌名: SearchKeys}"""
+        names = list(set(names))
+        result = {}
+        with self._lock:
+            for i in range(0, len(names), _MAX_VARS):
+                chunk = names[i:i + _MAX_VARS]
+                rows = self._db.execute(
+                    "SELECT name, text, pinyin, initials FROM keys WHERE name IN "
+                    f"({','.join('?' * len(chunk))})", chunk)
+                for name, text, pinyin, initials in rows:
+                    result[name] = SearchKeys(text, pinyin, initials)
+        return result
+
+    def save_keys(self, keys: dict[str, SearchKeys], prune: Optional[Iterable[str]] = None):
+        """写入新计算的检索形式；prune 给出时删除不在其中的歌名"""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO keys (name, text, pinyin, initials) VALUES (?, ?, ?, ?)",
+                ((name, k.text, k.pinyin, k.initials) for name, k in keys.items()))
+            if prune is not None:
+                live = set(prune)
+                stale = [(name,) for (name,) in self._db.execute("SELECT name FROM keys")
+                         if name not in live]
+                self._db.executemany("DELETE FROM keys WHERE name = ?", stale)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_store(data_dir: str, filename: str = "index.db") -> Optional[IndexStore]:
+    """打开 data_dir 下的索引库；失败 (只读目录、文件损坏等) 时返回 None，退回每次全量扫描"""
+    path = os.path.join(data_dir, filename)
+    try:
+        return IndexStore(path)
+    except sqlite3.DatabaseError as e:
+        log.warning(f"索引缓存不可用，改为每次启动全量扫描: {path} ({e})")
+        return None
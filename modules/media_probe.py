@@ -0,0 +1,398 @@
+"""
+媒体文件元数据解析 (时长 / 码率 / 标题 / 艺术家)
+
+纯 Python 解析常见容器的头部，只读取文件开头/结尾的少量字节:
+  mp3       ID3v2 标签 + Xing/Info/VBRI 帧数，无 VBR 头时按 CBR 码率估算
+  mp4/m4a   moov/mvhd 的 timescale 与 duration
+  wav       fmt 块的字节率 + data 块大小
+  flv       onMetaData 的 duration，缺失时取最后一个 tag 的时间戳
+  mkv       Segment/Info 的 Duration × TimecodeScale
+  avi       avih 的每帧微秒数 × 总帧数
+  ogg       首页识别头的采样率 + 末页 granule position
+
+解析不出时长时可回退到本机 ffprobe (可选，未安装则跳过)。
+本模块只依赖标准库，供 metadata.MetadataService 在进程池中调用。
+"""
+
+import json
+import os
+import shutil
+import struct
+import subprocess
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+# 读取文件尾部的字节数 (ogg 末页 / flv 末 tag)
+_TAIL = 64 * 1024
+
+_FFPROBE_TIMEOUT = 15
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    """一个媒体文件的元数据 (未知字段为 None)"""
+    duration: Optional[float] = None  # 秒
+    bitrate: Optional[int] = None  # kbps
+    title: Optional[str] = None
+    artist: Optional[str] = None
+    container: Optional[str] = None
+
+
+# --- MP3 ---
+
+# MPEG1 Layer III / MPEG2(.5) Layer III 码率表 (kbps)，下标为码率索引
+_MP3_BITRATES = {
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+}
+_MP3_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _id3_text(payload: bytes) -> Optional[str]:
+    if not payload:
+        return None
+    encoding, body = payload[0], payload[1:]
+    codec = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}.get(encoding, "latin-1")
+    text = body.decode(codec, errors="replace").split("\0")[0].strip()
+    return text or None
+
+
+def _parse_id3v2(tag: bytes, major: int) -> dict:
+    """ID3v2.3/2.4 标签中的标题/艺术家"""
+    fields = {}
+    pos = 0
+    while pos + 10 <= len(tag):
+        frame_id = tag[pos:pos + 4]
+        if not frame_id.strip(b"\0"):
+            break
+        raw = tag[pos + 4:pos + 8]
+        size = _syncsafe(raw) if major >= 4 else struct.unpack(">I", raw)[0]
+        payload = tag[pos + 10:pos + 10 + size]
+        if frame_id == b"TIT2":
+            fields["title"] = _id3_text(payload)
+        elif frame_id == b"TPE1":
+            fields["artist"] = _id3_text(payload)
+        pos += 10 + size
+    return fields
+
+
+def _probe_mp3(f: BinaryIO, size: int) -> MediaInfo:
+    head = f.read(10)
+    offset = 0
+    tags: dict = {}
+    if head[:3] == b"ID3" and len(head) == 10:
+        major, flags = head[3], head[5]
+        tag_size = _syncsafe(head[6:10])
+        if major in (3, 4):
+            tags = _parse_id3v2(f.read(tag_size), major)
+        offset = 10 + tag_size + (10 if flags & 0x10 else 0)
+    f.seek(offset)
+    data = f.read(64 * 1024)
+    for i in range(len(data) - 4):
+        if data[i] != 0xFF or (data[i + 1] & 0xE0) != 0xE0:
+            continue
+        b1, b2, b3 = data[i + 1], data[i + 2], data[i + 3]
+        version_bits, layer_bits = (b1 >> 3) & 3, (b1 >> 1) & 3
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+        if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+        version = 1 if version_bits == 3 else 2
+        layer = 4 - layer_bits
+        bitrate = _MP3_BITRATES[(version, layer)][bitrate_index]
+        rate = _MP3_RATES[version_bits][rate_index]
+        spf = 384 if layer == 1 else (1152 if layer == 2 or version == 1 else 576)
+        mono = (b3 >> 6) == 3
+        frame = data[i:i + 200]
+        # Xing/Info (VBR 帧数)
+        xing = (21 if mono else 36) if version == 1 else (13 if mono else 21)
+        if frame[xing:xing + 4] in (b"Xing", b"Info"):
+            xing_flags = struct.unpack(">I", frame[xing + 4:xing + 8])[0]
+            if xing_flags & 1:
+                frames = struct.unpack(">I", frame[xing + 8:xing + 12])[0]
+                duration = frames * spf / rate
+                audio = size - offset - i
+                return MediaInfo(duration, round(audio * 8 / duration / 1000) if duration else None,
+                                 container="mp3", **tags)
+        if frame[36:40] == b"VBRI":
+            frames = struct.unpack(">I", frame[50:54])[0]
+            duration = frames * spf / rate
+            return MediaInfo(duration, bitrate, container="mp3", **tags)
+        # CBR: 音频字节数 / 码率 (扣除 ID3v1)
+        f.seek(max(0, size - 128))
+        audio = size - offset - i - (128 if f.read(3) == b"TAG" else 0)
+        return MediaInfo(audio * 8 / (bitrate * 1000), bitrate, container="mp3", **tags)
+    return MediaInfo(container="mp3", **tags)
+
+
+# --- MP4 ---
+
+def _boxes(f: BinaryIO, start: int, end: int):
+    """遍历 [start, end) 范围内的 box: 产出 (类型, 数据起点, 数据终点)"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        box_size, box_type = struct.unpack(">I4s", header)
+        data_start = pos + 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", f.read(8))[0]
+            data_start += 8
+        elif box_size == 0:
+            box_size = end - pos
+        if box_size < 8:
+            return
+        yield box_type, data_start, min(pos + box_size, end)
+        pos += box_size
+
+
+def _probe_mp4(f: BinaryIO, size: int) -> MediaInfo:
+    for box_type, start, end in _boxes(f, 0, size):
+        if box_type != b"moov":
+            continue
+        for child, child_start, _child_end in _boxes(f, start, end):
+            if child != b"mvhd":
+                continue
+            f.seek(child_start)
+            version = f.read(4)[0]
+            if version == 1:
+                _c, _m, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+            else:
+                _c, _m, timescale, duration = struct.unpack(">IIII", f.read(16))
+            if not timescale:
+                break
+            seconds = duration / timescale
+            return MediaInfo(seconds, round(size * 8 / seconds / 1000) if seconds else None,
+                             container="mp4")
+        break
+    return MediaInfo(container="mp4")
+
+
+# --- WAV / AVI (RIFF) ---
+
+def _probe_wav(f: BinaryIO, size: int) -> MediaInfo:
+    header = f.read(12)
+    if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return MediaInfo(container="wav")
+    byte_rate = None
+    pos = 12
+    while pos + 8 <= size:
+        f.seek(pos)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        if chunk_id == b"fmt ":
+            byte_rate = struct.unpack("<I", f.read(12)[8:12])[0]
+        elif chunk_id == b"data" and byte_rate:
+            data_size = min(chunk_size, size - pos - 8)
+            return MediaInfo(data_size / byte_rate, round(byte_rate * 8 / 1000), container="wav")
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return MediaInfo(container="wav")
+
+
+def _probe_avi(f: BinaryIO, size: int) -> MediaInfo:
+    head = f.read(4096)
+    i = head.find(b"avih")
+    if head[:4] != b"RIFF" or i < 0 or i + 32 > len(head):
+        return MediaInfo(container="avi")
+    usec_per_frame, _rate, _pad, _flags, total_frames = struct.unpack("<5I", head[i + 8:i + 28])
+    seconds = usec_per_frame * total_frames / 1e6
+    return MediaInfo(seconds or None, round(size * 8 / seconds / 1000) if seconds else None,
+                     container="avi")
+
+
+# --- FLV ---
+
+def _amf_duration(data: bytes) -> Optional[float]:
+    """onMetaData 脚本 tag 中的 duration (AMF0)"""
+    i = data.find(b"duration")
+    if i < 0 or i + 17 > len(data) or data[i + 8] != 0x00:
+        return None
+    return struct.unpack(">d", data[i + 9:i + 17])[0]
+
+
+def _probe_flv(f: BinaryIO, size: int) -> MediaInfo:
+    head = f.read(9)
+    if head[:3] != b"FLV":
+        return MediaInfo(container="flv")
+    f.seek(struct.unpack(">I", head[5:9])[0] + 4)
+    tag = f.read(11)
+    duration = None
+    if len(tag) == 11 and tag[0] == 18:
+        data_size = int.from_bytes(tag[1:4], "big")
+        duration = _amf_duration(f.read(min(data_size, 4096)))
+    if not duration:
+        # 最后一个 tag 的时间戳: 文件末尾 4 字节为其长度
+        f.seek(size - 4)
+        last_size = struct.unpack(">I", f.read(4))[0]
+        if 11 <= last_size < size:
+            f.seek(size - 4 - last_size)
+            tag = f.read(8)
+            duration = (int.from_bytes(tag[4:7], "big") | (tag[7] << 24)) / 1000
+    return MediaInfo(duration or None, round(size * 8 / duration / 1000) if duration else None,
+                     container="flv")
+
+
+# --- MKV (EBML) ---
+
+def _vint(f: BinaryIO, strip: bool) -> Optional[int]:
+    """EBML 变长整数 (strip=True 去掉长度标记位，用于元素大小)"""
+    first = f.read(1)
+    if not first:
+        return None
+    b = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not b & mask:
+        length += 1
+        mask >>= 1
+    if length > 8:
+        return None
+    value = b & (mask - 1) if strip else b
+    for byte in f.read(length - 1):
+        value = (value << 8) | byte
+    if strip and value == (1 << (7 * length)) - 1:
+        return -1  # 未知大小
+    return value
+
+
+def _probe_mkv(f: BinaryIO, size: int) -> MediaInfo:
+    scale, duration, title = 1_000_000, None, None
+    pos = 0
+    end = size
+    while pos < end:
+        f.seek(pos)
+        element = _vint(f, strip=False)
+        length = _vint(f, strip=True)
+        if element is None or length is None:
+            break
+        data_start = f.tell()
+        if element in (0x18538067, 0x1549A966):  # Segment / Info: 进入子元素
+            if element == 0x1549A966:
+                end = data_start + length
+            pos = data_start
+            continue
+        if length < 0 or element == 0x1F43B675:  # 未知大小或 Cluster: 不再向后找
+            break
+        if element == 0x2AD7B1:  # TimecodeScale
+            scale = int.from_bytes(f.read(length), "big")
+        elif element == 0x4489:  # Duration
+            raw = f.read(length)
+            duration = struct.unpack(">f" if length == 4 else ">d", raw)[0]
+        elif element == 0x7BA9:  # Title
+            title = f.read(length).decode("utf-8", errors="replace") or None
+        pos = data_start + length
+    seconds = duration * scale / 1e9 if duration else None
+    return MediaInfo(seconds, round(size * 8 / seconds / 1000) if seconds else None,
+                     title=title, container="mkv")
+
+
+# --- OGG ---
+
+def _probe_ogg(f: BinaryIO, size: int) -> MediaInfo:
+    head = f.read(512)
+    rate, pre_skip = None, 0
+    i = head.find(b"\x01vorbis")
+    if i >= 0:
+        rate = struct.unpack("<I", head[i + 12:i + 16])[0]
+    else:
+        i = head.find(b"OpusHead")
+        if i >= 0:
+            rate, pre_skip = 48000, struct.unpack("<H", head[i + 10:i + 12])[0]
+    if not rate:
+        return MediaInfo(container="ogg")
+    f.seek(max(0, size - _TAIL))
+    tail = f.read()
+    j = tail.rfind(b"OggS")
+    if j < 0 or j + 14 > len(tail):
+        return MediaInfo(container="ogg")
+    granule = struct.unpack("<q", tail[j + 6:j + 14])[0]
+    seconds = max(0, granule - pre_skip) / rate
+    return MediaInfo(seconds, round(size * 8 / seconds / 1000) if seconds else None,
+                     container="ogg")
+
+
+_PARSERS = {
+    ".mp3": _probe_mp3,
+    ".mp4": _probe_mp4, ".m4a": _probe_mp4,
+    ".wav": _probe_wav,
+    ".avi": _probe_avi,
+    ".flv": _probe_flv,
+    ".mkv": _probe_mkv,
+    ".ogg": _probe_ogg,
+}
+
+
+def probe_file(path: str, size: int) -> MediaInfo:
+    """纯 Python 解析 (不支持的格式返回空的 MediaInfo)"""
+    parser = _PARSERS.get(os.path.splitext(path)[1].lower())
+    if parser is None:
+        return MediaInfo()
+    with open(path, "rb") as f:
+        return parser(f, size)
+
+
+def probe_ffprobe(path: str) -> Optional[MediaInfo]:
+    """调用本机 ffprobe (未安装或失败时返回 None)"""
+    exe = shutil.which("ffprobe")
+    if exe is None:
+        return None
+    try:
+        out = subprocess.run(
+            [exe, "-v", "error", "-show_entries", "format=duration,bit_rate,format_name:format_tags",
+             "-of", "json", path],
+            capture_output=True, timeout=_FFPROBE_TIMEOUT, check=True).stdout
+        fmt = json.loads(out).get("format", {})
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
+    tags = {k.lower(): v for k, v in (fmt.get("tags") or {}).items()}
+    duration = fmt.get("duration")
+    bit_rate = fmt.get("bit_rate")
+    return MediaInfo(
+        duration=float(duration) if duration else None,
+        bitrate=round(int(bit_rate) / 1000) if bit_rate else None,
+        title=tags.get("title"),
+        artist=tags.get("artist"),
+        container=(fmt.get("format_name") or "").split(",")[0] or None,
+    )
+
+
+def probe_batch(jobs: list[tuple[str, Optional[tuple[int, int]]]],
+                use_ffprobe: bool = False) -> list[tuple]:
+    """进程池任务: 解析一批文件
+
+    Args:
+        jobs: [(路径, 已缓存的 (大小, mtime) 或 None), ...]
+        use_ffprobe: 纯 Python 解析不出时长时回退到 ffprobe
+
+    Returns:
+        [(路径, 大小, mtime, MediaInfo 或 None, 错误信息或 None), ...]；
+        文件大小/mtime 与缓存一致时 MediaInfo 为 None 且无错误 (无需更新)
+    """
+    results = []
+    for path, known in jobs:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            results.append((path, None, None, None, str(e)))
+            continue
+        if known == (st.st_size, st.st_mtime_ns):
+            results.append((path, st.st_size, st.st_mtime_ns, None, None))
+            continue
+        try:
+            info = probe_file(path, st.st_size)
+        except (OSError, struct.error, IndexError, ValueError) as e:
+            info, error = MediaInfo(), f"{type(e).__name__}: {e}"
+        else:
+            error = None
+        if info.duration is None and use_ffprobe:
+            info = probe_ffprobe(path) or info
+        results.append((path, st.st_size, st.st_mtime_ns, info, error))
+    return results
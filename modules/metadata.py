@@ -0,0 +1,278 @@
+"""
+媒体元数据后台提取 (时长 / 码率 / 标题 / 艺术家)
+
+歌曲/录播的时长原来无从得知，面板也不知道队列还要播多久。
+MetadataService 在后台进程池中解析歌曲库和录播文件 (media_probe)，
+结果按 (路径, 大小, mtime) 缓存在 data_dir/media.db，下次启动只解析新增
+或改动过的文件；解析失败也记录下来，不会每次启动重试。
+
+请求分两档: 普通请求 (建索引/目录监视新增的整个库) 按顺序慢慢解析，
+priority 请求 (刚点的歌、刚入队的歌) 插到最前面。同一时刻最多 workers 批
+在解析，批与批之间可设间隔，不与推流抢 CPU 和磁盘。
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Iterable, Optional, Union
+
+from .media_probe import MediaInfo, probe_batch
+from .scanner import FileEntry
+
+log = logging.getLogger("metadata")
+
+SCHEMA_VERSION = "1"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    bitrate INTEGER,
+    title TEXT,
+    artist TEXT,
+    container TEXT,
+    error TEXT
+);
+"""
+
+
+@dataclass(frozen=True)
+class _Record:
+    size: int
+    mtime_ns: int
+    info: MediaInfo
+    error: Optional[str] = None
+
+
+class MetadataService:
+    """媒体元数据缓存 + 后台解析 (info/duration 线程安全，run 在事件循环中运行)"""
+
+    def __init__(self, db_path: Optional[str], workers: int = 2, batch: int = 16,
+                 interval: float = 0.0, ffprobe: bool = True):
+        """
+        Args:
+            db_path: 缓存库路径 (None 时只缓存在内存中)
+            workers: 解析进程数
+            batch: 每批交给进程池的文件数
+            interval: 每批之后的间隔 (秒)
+            ffprobe: 纯 Python 解析不出时长时回退到本机 ffprobe (已安装时)
+        """
+        self.workers = max(1, workers)
+        self.batch = max(1, batch)
+        self.interval = interval
+        self.ffprobe = ffprobe
+        self.stats = {"probed": 0, "unchanged": 0, "failed": 0, "pending": 0}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # 多批结果可能同时写库
+        self._records: dict[str, _Record] = {}
+        self._queue: deque[tuple[str, Optional[tuple[int, int]]]] = deque()
+        self._queued: set[str] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open(db_path)
+
+    def _open(self, path: str):
+        try:
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            with db:
+                row = db.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+                if row is None or row[0] != SCHEMA_VERSION:
+                    db.execute("DROP TABLE IF EXISTS media")
+                db.executescript(_SCHEMA)
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)",
+                           (SCHEMA_VERSION,))
+            rows = db.execute("SELECT path, size, mtime_ns, duration, bitrate, title, artist, "
+                              "container, error FROM media").fetchall()
+        except sqlite3.DatabaseError as e:
+            log.warning(f"元数据缓存不可用，仅缓存在内存中: {path} ({e})")
+            return
+        self._db = db
+        for path_, size, mtime_ns, duration, bitrate, title, artist, container, error in rows:
+            self._records[path_] = _Record(
+                size, mtime_ns, MediaInfo(duration, bitrate, title, artist, container), error)
+
+    # --- 查询 ---
+
+    def info(self, path: str) -> Optional[MediaInfo]:
+        """已缓存的元数据 (尚未解析时为 None)"""
+        with self._lock:
+            record = self._records.get(os.path.abspath(path))
+        return record.info if record is not None else None
+
+    def duration(self, path: str) -> Optional[float]:
+        """已缓存的时长 (秒)，未知时为 None"""
+        info = self.info(path)
+        return info.duration if info is not None else None
+
+    @property
+    def cached(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    # --- 请求解析 ---
+
+    def request(self, files: Iterable[Union[FileEntry, str]], priority: bool = False):
+        """请求解析一批文件 (线程安全)
+
+        传入 FileEntry 时按其大小/mtime 与缓存对比，未变的文件直接跳过，
+        不再交给进程池；传入路径时由解析进程 stat 后判断。
+        """
+        added = 0
+        with self._lock:
+            for item in files:
+                if isinstance(item, FileEntry):
+                    path = os.path.abspath(item.path)
+                    record = self._records.get(path)
+                    if record is not None and (record.size, record.mtime_ns) == (item.size, item.mtime_ns):
+                        continue
+                else:
+                    path = os.path.abspath(item)
+                    record = self._records.get(path)
+                known = (record.size, record.mtime_ns) if record is not None else None
+                if path in self._queued:
+                    if not priority:
+                        continue
+                    try:
+                        self._queue.remove((path, known))
+                    except ValueError:
+                        pass
+                else:
+                    self._queued.add(path)
+                if priority:
+                    self._queue.appendleft((path, known))
+                else:
+                    self._queue.append((path, known))
+                added += 1
+            self.stats["pending"] = len(self._queue)
+        if added:
+            self._notify()
+
+    def _notify(self):
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _take(self) -> list[tuple[str, Optional[tuple[int, int]]]]:
+        with self._lock:
+            jobs = []
+            while self._queue and len(jobs) < self.batch:
+                job = self._queue.popleft()
+                self._queued.discard(job[0])
+                jobs.append(job)
+            self.stats["pending"] = len(self._queue)
+        return jobs
+
+    # --- 后台解析 ---
+
+    def _store(self, results: list[tuple]):
+        """写入解析结果 (在线程池中执行)"""
+        rows = []
+        with self._lock:
+            for path, size, mtime_ns, info, error in results:
+                if size is None:
+                    # 文件已不存在: 丢弃缓存
+                    self._records.pop(path, None)
+                    rows.append((path, None))
+                    continue
+                if info is None:
+                    self.stats["unchanged"] += 1
+                    continue
+                record = _Record(size, mtime_ns, info, error)
+                self._records[path] = record
+                self.stats["failed" if error or info.duration is None else "probed"] += 1
+                rows.append((path, record))
+        if not rows:
+            return
+        with self._db_lock:
+            if self._db is not None:
+                self._write(rows)
+
+    def _write(self, rows: list[tuple[str, Optional[_Record]]]):
+        try:
+            with self._db:
+                self._db.executemany("DELETE FROM media WHERE path = ?",
+                                     ((path,) for path, record in rows if record is None))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO media (path, size, mtime_ns, duration, bitrate, "
+                    "title, artist, container, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    ((path, r.size, r.mtime_ns, r.info.duration, r.info.bitrate, r.info.title,
+                      r.info.artist, r.info.container, r.error)
+                     for path, r in rows if r is not None))
+        except sqlite3.Error as e:
+            log.warning(f"写入元数据缓存失败: {e}")
+
+    async def _probe(self, jobs: list):
+        loop = asyncio.get_running_loop()
+        try:
+            if self._pool is None:
+                # 首次有任务时才创建进程池 (库未变时启动不产生子进程)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            results = await loop.run_in_executor(
+                self._pool, partial(probe_batch, jobs, self.ffprobe))
+        except Exception as e:
+            log.warning(f"元数据解析失败 ({len(jobs)} 个文件): {e}")
+            return
+        await loop.run_in_executor(None, self._store, results)
+
+    async def run(self):
+        """后台解析循环: 同时最多 workers 批在进程池中"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        running: set[asyncio.Task] = set()
+        t0 = None
+        try:
+            while True:
+                while len(running) < self.workers:
+                    jobs = self._take()
+                    if not jobs:
+                        break
+                    if t0 is None:
+                        t0 = time.monotonic()
+                    running.add(asyncio.create_task(self._probe(jobs)))
+                if not running:
+                    if t0 is not None:
+                        log.info(f"元数据解析完成: 新解析 {self.stats['probed']} 个, "
+                                 f"失败 {self.stats['failed']} 个, "
+                                 f"耗时 {time.monotonic() - t0:.1f}s, 缓存 {self.cached} 个")
+                        t0 = None
+                    self._wake.clear()
+                    await self._wake.wait()
+                    continue
+                _done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                if self.interval > 0:
+                    await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            for task in running:
+                task.cancel()
+            raise
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def open_service(data_dir: str, filename: str = "media.db", **kwargs) -> MetadataService:
+    """创建元数据服务，缓存库放在 data_dir 下"""
+    return MetadataService(os.path.join(data_dir, filename), **kwargs)
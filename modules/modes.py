@@ -103,6 +103,18 @@ class ModeManager:
             await self._call_mode_change_callbacks(self.previous_mode, mode, reason)
             return True
 
+    async def resume(self, mode: Mode, reason: str = "") -> None:
+        """启动时进入模式 (上次运行的模式或默认录像模式)
+
+        与 set_mode 不同，即使与当前模式相同也触发回调，开始播放。
+        """
+        async with self._mode_lock:
+            self.current_mode = mode
+            self.mode_changed_at = datetime.now()
+
+            log.info(f"进入模式: {mode} (原因: {reason})")
+            await self._call_mode_change_callbacks(self.previous_mode, mode, reason)
+
     async def update_mode_state(self, mode: Mode, **kwargs) -> None:
         """更新指定模式的状态信息"""
         async with self._mode_lock:
@@ -4,9 +4,12 @@ OBS WebSocket v5 控制器
 
 功能:
   - VLC 源播放列表管理 (直接设置 playlist 数组)
-  - 源可见性控制 (显示/隐藏)
-  - 媒体播放控制 (play/pause/next/stop)
+  - 源可见性控制 (显示/隐藏)；模式切换的可见性变更与进度读取合并为一个 RequestBatch
+  - 媒体播放控制 (play/pause/next/stop)，读取/设置播放进度
   - 图像源刷新 (面板 PNG)
+  - 媒体事件订阅 (VLC 源开始/播完，点歌队列据此立即推进)
+  - 可选 A/B 双 VLC 源: 下一项预先加载在隐藏的备用源上，切换只需一批
+    可见性互换 + 播放请求 (不再替换播放列表造成黑帧和断音)
   - 自动重连机制
 
 依赖: pip install obsws-python>=1.7.0
@@ -15,9 +18,14 @@ OBS WebSocket v5 控制器
 """
 
 import asyncio
+import json
 import logging
+import threading
+import time
+import uuid
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
 
 log = logging.getLogger("obs")
 
@@ -29,33 +37,96 @@ MEDIA_RESTART = "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART"
 MEDIA_NEXT = "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_NEXT"
 MEDIA_PREVIOUS = "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PREVIOUS"
 
+# 媒体事件 (传给 add_media_handler 注册的回调)
+MEDIA_STARTED = "started"  # MediaInputPlaybackStarted
+MEDIA_ENDED = "ended"  # MediaInputPlaybackEnded
+
+MediaHandler = Callable[[str, str], Awaitable[object]]  # (事件, 源名称)
+
+MEDIA_STATE_PLAYING = "OBS_MEDIA_STATE_PLAYING"
+MEDIA_STATE_PAUSED = "OBS_MEDIA_STATE_PAUSED"
+MEDIA_STATE_ENDED = "OBS_MEDIA_STATE_ENDED"
+
+# WebSocket v5 操作码
+_OP_REQUEST_BATCH = 8
+_OP_REQUEST_BATCH_RESPONSE = 9
+
+
+@dataclass(frozen=True)
+class MediaStatus:
+    """媒体源状态 (GetMediaInputStatus)"""
+    state: str
+    cursor: Optional[int] = None  # 毫秒
+    duration: Optional[int] = None  # 毫秒
+
+    @property
+    def active(self) -> bool:
+        """正在播放或暂停 (进度有意义)"""
+        return self.state in (MEDIA_STATE_PLAYING, MEDIA_STATE_PAUSED)
+
 
 class OBSController:
     """OBS WebSocket v5 控制器
 
     所有 OBS 操作通过 WebSocket 完成，消除了对 Lua 脚本和文件监听的依赖。
     obsws-python 是同步库，所有调用通过 ThreadPoolExecutor 包装为异步。
+    媒体事件由单独的 EventClient 连接接收 (其自身的线程)，转交事件循环处理。
     """
 
     def __init__(self, host: str = "localhost", port: int = 4455,
                  password: str = "", scene_name: str = "AScreen",
                  vlc_source_name: str = "vlc_player",
                  broadcast_source_name: str = "broadcast_screen",
-                 panel_source_name: str = "B区-终端面板"):
+                 panel_source_name: str = "B区-终端面板",
+                 vlc_source_b: str = ""):
+        """
+        Args:
+            vlc_source_name: VLC 源名称 (A/B 模式下为 A 源)
+            vlc_source_b: 第二个 VLC 源名称 (留空为单源模式)
+        """
         self.host = host
         self.port = port
         self.password = password
         self.scene_name = scene_name
-        self.vlc_source_name = vlc_source_name
+        self._vlc_sources = [vlc_source_name]
+        if vlc_source_b and vlc_source_b != vlc_source_name:
+            self._vlc_sources.append(vlc_source_b)
+        self._active_vlc = 0  # 当前显示 (正在播放) 的 VLC 源下标
+        # 预加载时改为 pause_unpause 的备用源 → 原来的「不可见时」行为 (切换后恢复)
+        self._saved_behavior: dict[str, str] = {}
         self.broadcast_source_name = broadcast_source_name
         self.panel_source_name = panel_source_name
 
         self._client = None
         self._connected = False
         self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="obs")
+        # 同一连接上的请求/响应不能交错 (批量请求直接读写底层 WebSocket)
+        self._request_lock = threading.Lock()
+        self._item_ids: dict[tuple[str, str], int] = {}  # (场景, 源) → 场景项 ID
         self._reconnect_interval = 5
         self._reconnecting = False
 
+        self._events = None  # obsws.EventClient
+        self._media_handlers: list[MediaHandler] = []
+        self._handler_tasks: set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def vlc_source_name(self) -> str:
+        """当前使用的 VLC 源 (A/B 模式下为正在显示的那个)"""
+        return self._vlc_sources[self._active_vlc]
+
+    @property
+    def standby_vlc_source(self) -> Optional[str]:
+        """A/B 模式下隐藏的备用 VLC 源 (单源模式为 None)"""
+        if len(self._vlc_sources) < 2:
+            return None
+        return self._vlc_sources[1 - self._active_vlc]
+
+    @property
+    def dual_vlc(self) -> bool:
+        return len(self._vlc_sources) > 1
+
     @property
     def connected(self) -> bool:
         return self._connected
@@ -79,7 +150,9 @@ class OBSController:
                 )
             )
             self._connected = True
+            self._item_ids.clear()  # OBS 可能已重启，场景项 ID 重新查询
             log.info(f"OBS WebSocket 已连接: {self.host}:{self.port}")
+            await self._start_events(obsws)
             return True
         except Exception as e:
             log.warning(f"OBS WebSocket 连接失败: {e}")
@@ -89,6 +162,7 @@ class OBSController:
 
     async def disconnect(self):
         """断开连接"""
+        await self._stop_events()
         if self._client:
             try:
                 loop = asyncio.get_event_loop()
@@ -103,9 +177,14 @@ class OBSController:
         """在线程池中运行同步 OBS 调用，失败时触发重连"""
         if not self._connected or not self._client:
             return None
+
+        def locked():
+            with self._request_lock:
+                return func()
+
         try:
             loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(self._executor, func)
+            return await loop.run_in_executor(self._executor, locked)
         except Exception as e:
             error_msg = str(e).lower()
             if "closed" in error_msg or "connection" in error_msg or "eof" in error_msg:
@@ -132,6 +211,87 @@ class OBSController:
         finally:
             self._reconnecting = False
 
+    # --- 媒体事件 ---
+
+    def add_media_handler(self, handler: MediaHandler):
+        """注册媒体事件回调 handler(事件, 源名称)，事件为 MEDIA_STARTED / MEDIA_ENDED"""
+        self._media_handlers.append(handler)
+
+    @property
+    def events_alive(self) -> bool:
+        """媒体事件订阅是否在工作"""
+        events = self._events
+        return events is not None and events.worker.is_alive()
+
+    async def _start_events(self, obsws=None):
+        """建立媒体事件订阅 (每次连接/重连后)"""
+        if obsws is None:
+            import obsws_python as obsws
+        await self._stop_events()
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+
+        # obsws-python 按函数名匹配事件 (on_<事件名 snake_case>)
+        def on_media_input_playback_started(data):
+            self._post_media(MEDIA_STARTED, data.input_name)
+
+        def on_media_input_playback_ended(data):
+            self._post_media(MEDIA_ENDED, data.input_name)
+
+        try:
+            events = await loop.run_in_executor(
+                self._executor,
+                lambda: obsws.EventClient(host=self.host, port=self.port, password=self.password,
+                                          timeout=5, subs=obsws.Subs.MEDIAINPUTS))
+        except Exception as e:
+            log.warning(f"OBS 媒体事件订阅失败 (点歌播完不会自动切下一首): {e}")
+            return
+        events.callback.register([on_media_input_playback_started, on_media_input_playback_ended])
+        self._events = events
+        log.info("OBS 媒体事件已订阅")
+
+    async def _stop_events(self):
+        events, self._events = self._events, None
+        if events is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, events.disconnect)
+        except Exception:
+            pass
+
+    def _post_media(self, event: str, input_name: str):
+        """事件线程 → 事件循环"""
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch_media, event, input_name)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _dispatch_media(self, event: str, input_name: str):
+        log.debug(f"媒体事件: {event} ← {input_name}")
+        for handler in self._media_handlers:
+            task = asyncio.ensure_future(handler(event, input_name))
+            self._handler_tasks.add(task)
+            task.add_done_callback(self._handler_done)
+
+    def _handler_done(self, task: asyncio.Task):
+        self._handler_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error(f"媒体事件处理失败: {task.exception()}")
+
+    async def watch_events(self):
+        """事件连接意外断开 (请求连接仍正常) 时重新订阅
+
+        订阅本身失败 (如 OBS 版本过旧) 时不在这里反复重试，等下次重连。
+        """
+        while True:
+            await asyncio.sleep(self._reconnect_interval)
+            if self._connected and self._events is not None and not self.events_alive:
+                log.warning("OBS 媒体事件连接已断开，重新订阅")
+                await self._start_events()
+
     # --- VLC 源播放列表管理 ---
 
     async def set_vlc_playlist(self, files: list, source_name: Optional[str] = None) -> bool:
@@ -142,7 +302,7 @@ class OBSController:
             source_name: VLC 源名称，默认使用配置的名称
         """
         source = source_name or self.vlc_source_name
-        playlist = [{"value": f, "hidden": False, "selected": False} for f in files]
+        playlist = _playlist_items(files)
 
         def _do():
             self._client.set_input_settings(source, {
@@ -197,12 +357,14 @@ class OBSController:
             return True
         return False
 
-    async def apply_mode_sources(self, mode_key: str) -> bool:
-        """根据模式设置 AScreen 内源的可见性
+    def _mode_visibility(self, mode_key: str) -> Optional[dict[str, bool]]:
+        config = self._mode_sources(mode_key)
+        standby = self.standby_vlc_source
+        if config is not None and standby is not None:
+            config[standby] = False  # 备用源始终隐藏
+        return config
 
-        Args:
-            mode_key: 模式键 ('video', 'music', 'replay', 'broadcast', 'pk', 'other')
-        """
+    def _mode_sources(self, mode_key: str) -> Optional[dict[str, bool]]:
         configs = {
             "video": {self.vlc_source_name: True, self.broadcast_source_name: False},
             "music": {self.vlc_source_name: True, self.broadcast_source_name: False},
@@ -211,17 +373,209 @@ class OBSController:
             "pk": {self.vlc_source_name: False, self.broadcast_source_name: True},
             "other": {self.vlc_source_name: False, self.broadcast_source_name: False},
         }
+        return configs.get(mode_key)
+
+    def _send_batch(self, requests: list[tuple[str, Optional[dict]]]) -> list[Optional[dict]]:
+        """发送一个 RequestBatch (op 8)，按顺序返回各请求的 responseData (失败为 None)
+
+        obsws-python 没有批量请求接口，这里直接在其连接上收发；调用方持有 _request_lock。
+        """
+        ws = self._client.base_client.ws
+        batch_id = uuid.uuid4().hex
+        payload = {"op": _OP_REQUEST_BATCH, "d": {
+            "requestId": batch_id,
+            "haltOnFailure": False,
+            "requests": [{"requestType": t, **({"requestData": d} if d else {})}
+                         for t, d in requests],
+        }}
+        ws.send(json.dumps(payload))
+        while True:
+            response = json.loads(ws.recv())
+            if (response.get("op") == _OP_REQUEST_BATCH_RESPONSE
+                    and response["d"].get("requestId") == batch_id):
+                break
+        results = response["d"].get("results", [])
+        return [r.get("responseData", {}) if r.get("requestStatus", {}).get("result") else None
+                for r in results]
+
+    async def request_batch(self, requests: list[tuple[str, Optional[dict]]]) -> Optional[list[Optional[dict]]]:
+        """批量请求 (一次往返)
+
+        Args:
+            requests: [(requestType, requestData 或 None), ...]
+
+        Returns:
+            各请求的 responseData (失败为 None)；未连接或发送失败时返回 None
+        """
+        return await self._run_sync(lambda: self._send_batch(requests))
+
+    async def switch_mode_sources(self, mode_key: str,
+                                  capture_media: bool = False) -> Optional[MediaStatus]:
+        """按模式设置 AScreen 内源的可见性，可在同一批请求中读取 VLC 源的播放进度
 
-        config = configs.get(mode_key)
+        场景项 ID 首次查询后缓存，之后一次模式切换只需一个 RequestBatch 往返
+        (原来每个源 GetSceneItemId + SetSceneItemEnabled 各一次往返)。
+
+        Args:
+            mode_key: 模式键 ('video', 'music', 'replay', 'broadcast', 'pk', 'other')
+            capture_media: 切换前读取 VLC 源的 GetMediaInputStatus
+
+        Returns:
+            切换前 VLC 源的状态 (capture_media 为 False 或读取失败时为 None)
+        """
+        config = self._mode_visibility(mode_key)
         if not config:
             log.warning(f"未知模式: {mode_key}")
-            return False
+            return None
 
         log.info(f"OBS 源切换: 模式={mode_key}")
+        await self._ensure_item_ids(config)
+
+        requests: list[tuple[str, Optional[dict]]] = []
+        if capture_media:
+            # 先读进度再改可见性 (隐藏/停止前的位置)
+            requests.append(("GetMediaInputStatus", {"inputName": self.vlc_source_name}))
+        requests.extend(self._visibility_requests(config))
+        results = await self.request_batch(requests)
+        if not capture_media or not results or results[0] is None:
+            return None
+        data = results[0]
+        return MediaStatus(data.get("mediaState", ""), data.get("mediaCursor"),
+                           data.get("mediaDuration"))
+
+    async def _ensure_item_ids(self, sources):
+        """查询尚未缓存的场景项 ID (一个 RequestBatch)"""
+        scene = self.scene_name
+        missing = [source for source in sources if (scene, source) not in self._item_ids]
+        if not missing:
+            return
+        found = await self.request_batch([
+            ("GetSceneItemId", {"sceneName": scene, "sourceName": source}) for source in missing])
+        for source, data in zip(missing, found or []):
+            if data is not None:
+                self._item_ids[(scene, source)] = data["sceneItemId"]
+            else:
+                log.warning(f"场景 {scene} 中找不到源: {source}")
+
+    def _visibility_requests(self, config: dict[str, bool]) -> list[tuple[str, dict]]:
+        scene = self.scene_name
+        requests = []
         for source, visible in config.items():
-            await self.set_source_visible(source, visible)
+            item_id = self._item_ids.get((scene, source))
+            if item_id is not None:
+                requests.append(("SetSceneItemEnabled", {
+                    "sceneName": scene, "sceneItemId": item_id, "sceneItemEnabled": visible}))
+        return requests
+
+    async def apply_mode_sources(self, mode_key: str) -> bool:
+        """根据模式设置 AScreen 内源的可见性
+
+        Args:
+            mode_key: 模式键 ('video', 'music', 'replay', 'broadcast', 'pk', 'other')
+        """
+        if not self._mode_visibility(mode_key):
+            log.warning(f"未知模式: {mode_key}")
+            return False
+        await self.switch_mode_sources(mode_key)
+        return self._connected
+
+    # --- A/B 双 VLC 源 ---
+
+    async def stage_vlc_playlist(self, files: list) -> bool:
+        """在隐藏的备用 VLC 源上预先加载播放列表并暂停 (A/B 模式)
+
+        备用源的「不可见时」行为临时设为暂停/取消暂停，显示时从开头继续播放；
+        原来的设置在同一批请求中读取，切换后由 swap_vlc_sources 恢复。
+        """
+        standby = self.standby_vlc_source
+        if standby is None:
+            return False
+        results = await self.request_batch([
+            ("GetInputSettings", {"inputName": standby}),
+            ("SetInputSettings", {"inputName": standby, "inputSettings": {
+                "playlist": _playlist_items(files), "playback_behavior": "pause_unpause"}}),
+            ("TriggerMediaInputAction", {"inputName": standby, "mediaAction": MEDIA_PAUSE}),
+        ])
+        if not results or any(r is None for r in results):
+            log.warning(f"预加载到备用源失败: {standby}")
+            return False
+        # 重复预加载时读到的是上次改过的值，只保存第一次的原值
+        if standby not in self._saved_behavior:
+            settings = results[0].get("inputSettings") or {}
+            self._saved_behavior[standby] = settings.get("playback_behavior", "stop_restart")
+        log.debug(f"已预加载到备用源 {standby}: {len(files)} 个文件")
         return True
 
+    async def swap_vlc_sources(self) -> bool:
+        """显示备用源并播放，隐藏并停止当前源 (一个 RequestBatch)
+
+        同一批请求中恢复新的当前源原来的「不可见时」行为。
+
+        两个可见性请求都成功即视为已互换 (之后 vlc_source_name 指向原备用源)；
+        只成功了一个时再发一批请求恢复原来的可见性。
+
+        Returns:
+            是否完整切换 (False 时调用方应在当前源上重新设置播放列表)
+        """
+        standby = self.standby_vlc_source
+        if standby is None:
+            return False
+        active = self.vlc_source_name
+        t0 = time.perf_counter()
+        await self._ensure_item_ids((standby, active))
+        # 先显示新源再隐藏旧源，中间不出现空白帧
+        requests = self._visibility_requests({standby: True, active: False})
+        if len(requests) < 2:
+            return False
+        requests += [
+            ("TriggerMediaInputAction", {"inputName": standby, "mediaAction": MEDIA_PLAY}),
+            ("TriggerMediaInputAction", {"inputName": active, "mediaAction": MEDIA_STOP}),
+        ]
+        behavior = self._saved_behavior.get(standby)
+        if behavior is not None:
+            requests.append(("SetInputSettings", {"inputName": standby,
+                                                  "inputSettings": {"playback_behavior": behavior}}))
+        results = await self.request_batch(requests)
+        if not results or len(results) < len(requests):
+            log.warning(f"A/B 切换失败: {active} → {standby}")
+            return False
+        # haltOnFailure 为 False: 后面的请求失败时前面的可见性变化已经生效
+        shown, hidden = results[0] is not None, results[1] is not None
+        if shown and hidden:
+            self._active_vlc = 1 - self._active_vlc
+            if behavior is None or results[-1] is not None:
+                self._saved_behavior.pop(standby, None)
+        elif shown or hidden:
+            await self.request_batch(self._visibility_requests({active: True, standby: False}))
+        if any(r is None for r in results):
+            log.warning(f"A/B 切换失败: {active} → {standby}"
+                        + (" (已显示备用源)" if shown and hidden else ""))
+            return False
+        log.info(f"A/B 切换: {active} → {standby} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+        return True
+
+    # --- 播放进度 ---
+
+    async def get_media_status(self, source_name: Optional[str] = None) -> Optional[MediaStatus]:
+        """读取媒体源状态与播放进度"""
+        source = source_name or self.vlc_source_name
+
+        def _do():
+            resp = self._client.get_media_input_status(source)
+            return MediaStatus(resp.media_state, resp.media_cursor, resp.media_duration)
+
+        return await self._run_sync(_do)
+
+    async def set_media_cursor(self, cursor: int, source_name: Optional[str] = None) -> bool:
+        """跳转到指定进度 (毫秒)"""
+        source = source_name or self.vlc_source_name
+
+        def _do():
+            self._client.set_media_input_cursor(source, max(0, int(cursor)))
+            return True
+
+        return bool(await self._run_sync(_do))
+
     # --- 图像源刷新 ---
 
     async def refresh_image_source(self, source_name: Optional[str] = None) -> bool:
@@ -253,3 +607,7 @@ class OBSController:
             return f"OBS {resp.obs_version} / WebSocket {resp.obs_web_socket_version}"
 
         return await self._run_sync(_do)
+
+
+def _playlist_items(files: list) -> list[dict]:
+    return [{"value": f, "hidden": False, "selected": False} for f in files]
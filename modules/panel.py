@@ -12,20 +12,26 @@ B区终端风格信息面板 - 多模式 Pillow PNG 渲染器
 520×435 PNG 图片，视觉风格：
 - 深色背景 + 绿色提示符 + 青色状态块 + 品红色队列
 - 字体大小根据模式自动调整，充分利用B区空间
+
+多面板: PanelSource 每个 tick 采集一份 PanelSnapshot，各面板 (PanelRenderer，
+可以是不同尺寸、固定布局、不同输出目标) 将其投影为自己的 PanelState，
+仅在自身内容变化时重绘。调度见 panel_engine.PanelEngine。
 """
 
-import asyncio
 import logging
-import os
 import time
+from dataclasses import dataclass
 from datetime import timedelta as td, datetime, timezone
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, Iterable
 
 from PIL import Image, ImageDraw, ImageFont
 
 from .songs import SongManager
 from .replay import ReplayManager
 from .modes import Mode, ModeManager
+from .text_cache import TextBitmapCache, rasterize_runs
+from .fonts import SIZES, CJK, LATIN, FontRegistry, get_registry
+from .panel_output import OutputOptions, PanelEncoder, build_palette, write_atomic
 
 log = logging.getLogger("panel")
 
@@ -38,125 +44,61 @@ C_MAGENTA = "#ff00ff"
 C_YELLOW = "#ffff00"
 C_RED = "#ff5555"
 
-# CJK 字体搜索路径
-_CJK_FONT_CANDIDATES = [
-    # Windows
-    "C:/Windows/Fonts/msyh.ttc",
-    "C:/Windows/Fonts/msyhbd.ttc",
-    "C:/Windows/Fonts/simhei.ttf",
-    "C:/Windows/Fonts/simsun.ttc",
-    # Linux
-    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
-    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
-    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
-    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
-    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
-]
-
-
 def _hex_to_rgb(hex_color: str) -> tuple:
     """转换十六进制颜色为 RGB 元组"""
     h = hex_color.lstrip("#")
     return tuple(int(h[i:i+2], 16) for i in (0, 2, 4))
 
 
-def _find_cjk_font() -> Optional[str]:
-    """查找 CJK 字体"""
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    bundled = os.path.join(script_dir, "..", "assets", "fonts", "NotoSansCJKsc-Regular.otf")
-    if os.path.exists(bundled):
-        return bundled
-    for path in _CJK_FONT_CANDIDATES:
-        if os.path.exists(path):
-            return path
-    return None
+def _format_duration(seconds: float) -> str:
+    """时长显示为 m:ss 或 h:mm:ss"""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
 
 
-class PanelRenderer:
-    """多模式终端风格面板 PNG 渲染器"""
+@dataclass(frozen=True)
+class PanelSnapshot:
+    """一个 tick 内采集的面板输入，所有面板共用
 
-    def __init__(self, width: int, height: int, output_path: str,
-                 song_manager: SongManager, mode_manager: Optional[ModeManager] = None,
-                 replay_manager: Optional[ReplayManager] = None,
-                 font_path: Optional[str] = None, obs_controller=None):
-        self.width = width
-        self.height = height
-        self.output_path = output_path
+    只采集本 tick 各面板布局用得到的字段，其余为空值。
+    """
+    mode: Mode  # 当前播放模式
+    mode_states: tuple  # ((Mode, ((key, value), ...)), ...)
+    now_playing: str
+    queue: tuple  # 点歌队列前几首歌名
+    queue_duration: Optional[float]  # 点歌队列总时长 (秒)，有未知时长时为 None
+    next_song: Optional[str]
+    total: int
+    replay_now_playing: str
+    replay_queue: tuple
+    replay_total: int
+    clock: str
+    uptime: str
+
+    def mode_state(self, mode: Mode) -> tuple:
+        for m, items in self.mode_states:
+            if m == mode:
+                return items
+        return ()
+
+
+class PanelSource:
+    """面板数据源: 从歌曲/录播/模式管理器采集快照"""
+
+    # 各模式最多显示的队列条目数
+    QUEUE_PREVIEW = 4
+
+    def __init__(self, song_manager: SongManager, mode_manager: Optional[ModeManager] = None,
+                 replay_manager: Optional[ReplayManager] = None):
         self.songs = song_manager
         self.replays = replay_manager
         self.mode_manager = mode_manager
-        self.obs = obs_controller
         self._start_time = time.time()
 
-        # 加载字体 - 适配 520×435 面板在 1080p 直播中的可读性
-        # 观众在全屏 1080p 观看时，B区仅占 ~27% 屏幕宽度
-        self._font_xs = self._load_font(font_path, 14)
-        self._font_sm = self._load_font(font_path, 17)
-        self._font_md = self._load_font(font_path, 20)
-        self._font_lg = self._load_font(font_path, 26)
-        self._font_xl = self._load_font(font_path, 32)
-
-        # CJK 字体
-        cjk_path = _find_cjk_font()
-        if cjk_path:
-            log.info(f"CJK 字体: {cjk_path}")
-        self._cjk_xs = self._load_font(cjk_path, 14) if cjk_path else self._font_xs
-        self._cjk_sm = self._load_font(cjk_path, 17) if cjk_path else self._font_sm
-        self._cjk_md = self._load_font(cjk_path, 20) if cjk_path else self._font_md
-        self._cjk_lg = self._load_font(cjk_path, 26) if cjk_path else self._font_lg
-        self._cjk_xl = self._load_font(cjk_path, 32) if cjk_path else self._font_xl
-
-    def _load_font(self, font_path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
-        """加载字体，优先使用指定路径，回退到系统默认"""
-        if font_path and os.path.exists(font_path):
-            try:
-                return ImageFont.truetype(font_path, size)
-            except Exception:
-                pass
-        for name in ["JetBrainsMono-Regular.ttf", "Consolas", "consola.ttf",
-                     "DejaVuSansMono.ttf", "LiberationMono-Regular.ttf"]:
-            try:
-                return ImageFont.truetype(name, size)
-            except Exception:
-                continue
-        return ImageFont.load_default()
-
-    def _has_cjk(self, text: str) -> bool:
-        """检测文本是否包含 CJK 字符"""
-        for ch in text:
-            cp = ord(ch)
-            if (0x4E00 <= cp <= 0x9FFF or   # CJK Unified Ideographs
-                0x3400 <= cp <= 0x4DBF or   # CJK Extension A
-                0x3000 <= cp <= 0x303F or   # CJK Symbols
-                0xFF00 <= cp <= 0xFFEF):    # Fullwidth Forms
-                return True
-        return False
-
-    def _pick_font(self, text: str, size: str = "md"):
-        """根据文本内容选择字体"""
-        if self._has_cjk(text):
-            return {
-                "xs": self._cjk_xs, "sm": self._cjk_sm,
-                "md": self._cjk_md, "lg": self._cjk_lg,
-                "xl": self._cjk_xl
-            }[size]
-        return {
-            "xs": self._font_xs, "sm": self._font_sm,
-            "md": self._font_md, "lg": self._font_lg,
-            "xl": self._font_xl
-        }[size]
-
-    def _text_width(self, text: str, font) -> int:
-        """计算文本宽度"""
-        try:
-            bbox = font.getbbox(text)
-            return bbox[2] - bbox[0]
-        except AttributeError:
-            try:
-                return font.getsize(text)[0]
-            except Exception:
-                return len(text) * 8
+    @property
+    def current_mode(self) -> Mode:
+        return self.mode_manager.current_mode if self.mode_manager else Mode.VIDEO
 
     def _get_uptime(self) -> str:
         """获取运行时间"""
@@ -169,242 +111,580 @@ class PanelRenderer:
         now = datetime.now(beijing_tz)
         return now.strftime("%H:%M:%S")
 
-    def render(self):
-        """根据当前模式渲染面板"""
-        # 创建图像
-        img = Image.new("RGB", (self.width, self.height), _hex_to_rgb(C_BG))
+    def snapshot(self, mode: Mode, layouts: Iterable[Mode]) -> PanelSnapshot:
+        """采集快照
+
+        Args:
+            mode: 当前播放模式
+            layouts: 本 tick 需要绘制的布局 (决定采集哪些字段)
+        """
+        layouts = set(layouts)
+        mode_states = tuple(
+            (m, tuple(sorted(self.mode_manager.get_mode_state(m).items())) if self.mode_manager else ())
+            for m in sorted(layouts, key=lambda m: m.key)
+        )
+
+        # 管理器发布的不可变快照: 无锁读取，同一 tick 内各字段一致
+        songs = self.songs.snapshot
+        replays = self.replays.snapshot if self.replays else None
+        if Mode.REPLAY in layouts and replays is not None:
+            replay_now_playing = replays.now_playing
+            replay_queue = tuple(code for code, _ in replays.queue[:self.QUEUE_PREVIEW])
+        else:
+            replay_now_playing = ""
+            replay_queue = ()
+
+        next_song = songs.head[0] if Mode.VIDEO in layouts and songs.head else None
+
+        return PanelSnapshot(
+            mode=mode,
+            mode_states=mode_states,
+            now_playing=songs.now_playing,
+            queue=tuple(name for name, _ in songs.queue[:self.QUEUE_PREVIEW]),
+            queue_duration=self.songs.queue_duration(songs) if Mode.MUSIC in layouts else None,
+            next_song=next_song,
+            total=songs.total,
+            replay_now_playing=replay_now_playing,
+            replay_queue=replay_queue,
+            replay_total=replays.total if replays is not None else 0,
+            clock=self._get_beijing_time(),
+            uptime=self._get_uptime() if Mode.BROADCAST in layouts else "",
+        )
+
+
+@dataclass(frozen=True)
+class PanelState:
+    """一个面板一帧的全部输入 (PanelSnapshot 按面板布局投影而来)
+
+    不可变且可哈希，直接作为内容指纹使用：两帧的 PanelState 相等，
+    渲染结果就完全相同，可以跳过绘制、编码、写盘和 OBS 刷新。
+    时钟和运行时间按面板上显示的精度 (秒) 采样。
+    """
+    mode: Mode  # 布局 (跟随当前模式的面板即当前模式)
+    mode_state: tuple  # ((key, value), ...) 已排序
+    now_playing: str
+    queue: tuple  # 点歌队列前几首歌名
+    queue_duration: str  # 点歌队列总时长 (仅歌曲模式显示，未知或队列为空时为空串)
+    next_song: Optional[str]
+    total: int
+    replay_now_playing: str
+    replay_queue: tuple
+    replay_total: int
+    clock: str
+    uptime: str  # 仅直播模式显示，其他模式为空串，避免无谓的重绘
+    marquee_tick: Optional[int] = None  # 正在播放的标题超宽且启用跑马灯时的滚动步数
+
+    def mode_value(self, key: str, default: Any = None) -> Any:
+        """读取模式状态中的字段"""
+        for k, v in self.mode_state:
+            if k == key:
+                return v
+        return default
+
+
+class PanelRenderer:
+    """多模式终端风格面板 PNG 渲染器 (一个输出面板)"""
+
+    # 文本右侧留白 (与左侧 x=15 对称)
+    MARGIN = 15
+
+    # 各模式"正在播放"行的 (前缀, 字号)，跑马灯只作用于这一行
+    NOW_PLAYING_LINE = {
+        Mode.BROADCAST: ("♫ ", "md"),
+        Mode.PK: ("♫ ", "md"),
+        Mode.MUSIC: ("▶ ", "lg"),
+        Mode.VIDEO: ("▶ ", "lg"),
+        Mode.REPLAY: ("▶ ", "lg"),
+    }
+
+    def __init__(self, width: int, height: int, output_path: str,
+                 song_manager: SongManager, mode_manager: Optional[ModeManager] = None,
+                 replay_manager: Optional[ReplayManager] = None,
+                 font_path: Optional[str] = None, obs_controller=None,
+                 text_cache: Optional[TextBitmapCache] = None,
+                 output_options: Optional[OutputOptions] = None,
+                 write_file: bool = True,
+                 marquee: bool = False, marquee_speed: float = 3.0,
+                 source: Optional[PanelSource] = None, layout: Optional[Mode] = None,
+                 obs_source: Optional[str] = None, name: str = "panel"):
+        """
+        Args:
+            source: 共用的数据源 (多面板时由 PanelEngine 传入)，默认按管理器新建
+            layout: 固定使用某个模式的布局，None 为跟随当前模式
+            obs_source: 刷新的 OBS 图像源名称，None 为 OBSController 默认面板源
+            name: 面板名称 (日志用)
+        """
+        self.width = width
+        self.height = height
+        self.output_path = output_path
+        self.source = source or PanelSource(song_manager, mode_manager, replay_manager)
+        self.songs = self.source.songs
+        self.replays = self.source.replays
+        self.mode_manager = self.source.mode_manager
+        self.layout = layout
+        self.name = name
+        self.obs = obs_controller
+        self.obs_source = obs_source
+
+        # 超宽标题: 默认截断补省略号，启用后改为跑马灯滚动 (字符/秒)
+        self.marquee = marquee
+        self.marquee_speed = marquee_speed
+
+        # 内容指纹: 上一次成功输出的面板状态
+        self._last_state: Optional[PanelState] = None
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0  # 工作线程忙时丢弃的过期帧 (由 PanelEngine 计数)
+
+        # 编码器 (调色板模式使用终端配色)
+        palette = build_palette(_hex_to_rgb(C_BG), [
+            _hex_to_rgb(c) for c in (C_TEXT, C_DIM, C_CYAN, C_MAGENTA, C_YELLOW, C_RED)
+        ])
+        self._encoder = PanelEncoder(output_options, palette)
+
+        # 输出目标: 文件 (OBS 图像源) 和/或 帧订阅者 (如 HTTP 推送服务)
+        self.write_file = write_file
+        self._frame_sinks: list[Callable[[bytes], None]] = []
+
+        # 字体: 进程级共享注册表，各字号首次使用时才加载
+        self._fonts: FontRegistry = get_registry(font_path)
+
+        # 分层合成: 每个模式 (静态层绘制, 动态区域绘制)
+        self._layouts = {
+            Mode.BROADCAST: (self._static_broadcast_mode, self._render_broadcast_mode),
+            Mode.PK: (self._static_pk_mode, self._render_pk_mode),
+            Mode.MUSIC: (self._static_music_mode, self._render_music_mode),
+            Mode.VIDEO: (self._static_video_mode, self._render_video_mode),
+            Mode.REPLAY: (self._static_replay_mode, self._render_replay_mode),
+            Mode.OTHER: (self._static_other_mode, self._render_other_mode),
+        }
+        self._layers: Dict[Mode, Image.Image] = {}
+        self._layers_key = None
+
+        # 动态文本的光栅化结果缓存
+        self._text_cache = text_cache or TextBitmapCache()
+        self._advances: Dict[tuple, float] = {}
+
+    def _pick_font(self, text: str, size: str = "md") -> ImageFont.FreeTypeFont:
+        """按文本选择单一字体: 含 CJK 片段时用 CJK 字体"""
+        script = CJK if any(run[1] == CJK for run in self._fonts.runs(text)) else LATIN
+        return self._fonts.font(script, SIZES[size])
+
+    def _draw_text(self, img: Image.Image, xy: tuple, text: str, color: str,
+                   size: str = "md", font_hint: Optional[str] = None):
+        """经由文本位图缓存绘制文本
+
+        默认按文字体系分段，拉丁/CJK 片段各用对应字体绘制；
+        给出 font_hint 时整段使用 font_hint 所选的单一字体
+        (用于与静态层标签对齐的数值)。
+
+        Args:
+            xy: 左上角坐标
+            color: 十六进制颜色
+            size: 字号档位 (xs/sm/md/lg/xl)
+            font_hint: 用于选择单一字体的文本
+        """
+        key = (text, size, font_hint)
+        entry = self._text_cache.get(key)
+        if entry is None:
+            if font_hint is None:
+                runs = self._fonts.font_runs(text, SIZES[size])
+            else:
+                runs = [(text, self._pick_font(font_hint, size))]
+            entry = self._text_cache.put(key, rasterize_runs(runs))
+        mask, (dx, dy) = entry
+        if mask is not None:
+            img.paste(_hex_to_rgb(color), (round(xy[0]) + dx, round(xy[1]) + dy), mask)
+
+    def _advance(self, text: str, size: str, font_hint: Optional[str] = None) -> float:
+        """文本前进宽度 (用于在固定标签后接续绘制)，结果按参数记忆"""
+        key = (text, size, font_hint)
+        width = self._advances.get(key)
+        if width is None:
+            if font_hint is None:
+                width = self._fonts.metrics(SIZES[size]).width(text)
+            else:
+                width = self._pick_font(font_hint, size).getlength(text)
+            self._advances[key] = width
+        return width
+
+    def _fit_line(self, prefix: str, text: str, size: str, x: int,
+                  tick: Optional[int] = None) -> str:
+        """把 prefix + text 按像素宽度适配到 x 起的可用区域
+
+        text 超宽时截断并补省略号；给出 tick 时改为跑马灯滚动 (prefix 固定不动)。
+        """
+        metrics = self._fonts.metrics(SIZES[size])
+        avail = self.width - x - self.MARGIN - metrics.width(prefix)
+        if tick is not None and metrics.width(text) > avail:
+            return prefix + metrics.marquee(text, tick, avail)
+        return prefix + metrics.fit(text, avail)
+
+    def _marquee_tick(self, mode: Mode, text: str) -> Optional[int]:
+        """正在播放的标题超出可用宽度时返回当前滚动步数，否则 None"""
+        line = self.NOW_PLAYING_LINE.get(mode)
+        if not self.marquee or line is None:
+            return None
+        prefix, size = line
+        metrics = self._fonts.metrics(SIZES[size])
+        if metrics.width(prefix + text) <= self.width - 15 - self.MARGIN:
+            return None
+        return int(time.time() * self.marquee_speed)
+
+    def layout_for(self, mode: Mode) -> Mode:
+        """当前模式下本面板使用的布局"""
+        return self.layout or mode
+
+    def project(self, snapshot: PanelSnapshot) -> PanelState:
+        """把共用快照投影为本面板的状态 (只保留本布局显示的字段)"""
+        layout = self.layout_for(snapshot.mode)
+        replay = layout == Mode.REPLAY
+        replay_now_playing = snapshot.replay_now_playing if replay else ""
+        title = (replay_now_playing if replay else snapshot.now_playing) or "等待播放..."
+        return PanelState(
+            mode=layout,
+            mode_state=snapshot.mode_state(layout),
+            now_playing=snapshot.now_playing,
+            queue=snapshot.queue,
+            queue_duration=(_format_duration(snapshot.queue_duration)
+                            if layout == Mode.MUSIC and snapshot.queue and snapshot.queue_duration
+                            else ""),
+            next_song=snapshot.next_song if layout == Mode.VIDEO else None,
+            total=snapshot.total,
+            replay_now_playing=replay_now_playing,
+            replay_queue=snapshot.replay_queue if replay else (),
+            replay_total=snapshot.replay_total,
+            clock=snapshot.clock,
+            uptime=snapshot.uptime if layout == Mode.BROADCAST else "",
+            marquee_tick=self._marquee_tick(layout, title),
+        )
+
+    def capture_state(self) -> PanelState:
+        """采集当前面板输入，生成状态快照"""
+        mode = self.source.current_mode
+        return self.project(self.source.snapshot(mode, (self.layout_for(mode),)))
+
+    @property
+    def content_type(self) -> str:
+        """输出帧的 HTTP 内容类型"""
+        return self._encoder.options.content_type
+
+    @property
+    def last_state(self) -> Optional[PanelState]:
+        """上一次成功输出的面板状态"""
+        return self._last_state
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """渲染统计: 实际输出帧数 / 因内容未变而跳过的帧数 / 丢弃的过期帧 / 文本缓存"""
+        return {
+            "rendered": self.frames_rendered,
+            "skipped": self.frames_skipped,
+            "dropped": self.frames_dropped,
+            "encoder": self._encoder.stats,
+            "text_cache": self._text_cache.stats,
+        }
+
+    def render(self, force: bool = False) -> bool:
+        """根据当前模式渲染面板
+
+        内容指纹与上一帧相同时直接跳过 (不绘制、不编码、不写盘)。
+
+        Args:
+            force: 忽略指纹，强制重新输出
+
+        Returns:
+            是否输出了新的一帧
+        """
+        state = self.capture_state()
+        if not force and state == self._last_state:
+            self.frames_skipped += 1
+            return False
+        return self.render_state(state)
+
+    def compose(self, state: PanelState) -> Image.Image:
+        """按状态快照绘制一帧: 静态层的副本 + 动态区域"""
+        img = self._static_layer(state.mode).copy()
         draw = ImageDraw.Draw(img)
+        _, draw_dynamic = self._layouts[state.mode]
+        draw_dynamic(img, draw, state)
+        return img
 
-        # 获取当前模式
-        if self.mode_manager:
-            mode = self.mode_manager.current_mode
-            mode_state = self.mode_manager.get_mode_state(mode)
-        else:
-            mode = Mode.VIDEO
-            mode_state = {}
-
-        # 根据模式调用不同的渲染方法
-        if mode == Mode.BROADCAST:
-            self._render_broadcast_mode(img, draw, mode_state)
-        elif mode == Mode.PK:
-            self._render_pk_mode(img, draw, mode_state)
-        elif mode == Mode.MUSIC:
-            self._render_music_mode(img, draw, mode_state)
-        elif mode == Mode.VIDEO:
-            self._render_video_mode(img, draw, mode_state)
-        elif mode == Mode.REPLAY:
-            self._render_replay_mode(img, draw, mode_state)
-        else:  # Mode.OTHER
-            self._render_other_mode(img, draw, mode_state)
-
-        # 保存为 PNG
+    def encode(self, img: Image.Image) -> bytes:
+        """按输出选项编码一帧"""
+        return self._encoder.encode(img)
+
+    def render_state(self, state: PanelState) -> bool:
+        """绘制并输出一帧 (不访问管理器，可在工作线程中调用)"""
+        img = self.compose(state)
+
+        # 编码后原子替换输出文件
         try:
-            img.save(self.output_path, "PNG")
+            data = self.encode(img)
+            if self.write_file:
+                write_atomic(self.output_path, data)
         except Exception as e:
-            log.error(f"保存 PNG 失败: {e}")
-
-    def _render_broadcast_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: Dict[str, Any]):
-        """直播模式 - 显示直播间信息和在线人数"""
-        y = 15
+            log.error(f"保存面板图像失败: {e}")
+            self._last_state = None
+            return False
 
+        for sink in self._frame_sinks:
+            try:
+                sink(data)
+            except Exception as e:
+                log.error(f"面板帧推送失败: {e}")
+
+        self._last_state = state
+        self.frames_rendered += 1
+        return True
+
+    def add_frame_sink(self, sink: Callable[[bytes], None]):
+        """订阅编码后的新帧 (仅在内容变化时调用，可能在工作线程中)"""
+        self._frame_sinks.append(sink)
+
+    # --- 静态层缓存 ---
+
+    def _static_layer(self, mode: Mode) -> Image.Image:
+        """获取模式的静态层 (背景 + 标题/提示等固定内容)
+
+        每个模式只光栅化一次；面板尺寸或字体变化时整体失效重建。
+        """
+        key = (self.width, self.height, self._fonts.key)
+        if key != self._layers_key:
+            self._layers.clear()
+            self._layers_key = key
+
+        layer = self._layers.get(mode)
+        if layer is None:
+            layer = Image.new("RGB", (self.width, self.height), _hex_to_rgb(C_BG))
+            draw_static, _ = self._layouts[mode]
+            draw_static(ImageDraw.Draw(layer))
+            self._layers[mode] = layer
+            log.debug(f"静态层已生成: {mode}")
+        return layer
+
+    def invalidate_layers(self):
+        """丢弃所有静态层和文本缓存 (修改 width/height 或字体后调用)"""
+        self._layers.clear()
+        self._layers_key = None
+        self._text_cache.clear()
+        self._advances.clear()
+
+    # --- 直播模式 ---
+
+    def _static_broadcast_mode(self, draw: ImageDraw.ImageDraw):
+        """直播模式静态层 - 标题、字段标签和点歌提示"""
         # 标题
         title_font = self._pick_font("直播中", "xl")
-        draw.text((15, y), "● 直播中", fill=_hex_to_rgb(C_RED), font=title_font)
-        y += 46
+        draw.text((15, 15), "● 直播中", fill=_hex_to_rgb(C_RED), font=title_font)
+
+        # 字段标签
+        draw.text((15, 61), "在线: ", fill=_hex_to_rgb(C_CYAN), font=self._pick_font("在线", "lg"))
+        draw.text((15, 99), "时长: ", fill=_hex_to_rgb(C_YELLOW), font=self._pick_font("0", "md"))
+        draw.text((15, 159), "时间: ", fill=_hex_to_rgb(C_DIM), font=self._pick_font("0", "md"))
+
+        # 提示
+        hint_font = self._pick_font("发送「点歌 歌名」即可点歌", "xs")
+        draw.text((15, self.height - 25), "发送「点歌 歌名」即可点歌",
+                  fill=_hex_to_rgb(C_DIM), font=hint_font)
+
+    def _render_broadcast_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: PanelState):
+        """直播模式 - 显示直播间信息和在线人数"""
+        y = 61
 
         # 在线人数
-        viewer_count = state.get("viewer_count", 0)
-        info_font = self._pick_font(f"在线: {viewer_count}", "lg")
-        draw.text((15, y), f"在线: {viewer_count:,}", fill=_hex_to_rgb(C_CYAN), font=info_font)
+        viewer_count = state.mode_value("viewer_count", 0)
+        x = 15 + self._advance("在线: ", "lg", "在线")
+        self._draw_text(img, (x, y), f"{viewer_count:,}", C_CYAN, "lg", "在线")
         y += 38
 
         # 运行时间
-        uptime_font = self._pick_font(self._get_uptime(), "md")
-        draw.text((15, y), f"时长: {self._get_uptime()}", fill=_hex_to_rgb(C_YELLOW), font=uptime_font)
+        x = 15 + self._advance("时长: ", "md", "0")
+        self._draw_text(img, (x, y), state.uptime, C_YELLOW, "md")
         y += 30
 
         # 当前歌曲
-        current_song = self.songs.now_playing or "等待播放..."
-        song_font = self._pick_font(current_song, "md")
-        draw.text((15, y), "♫ " + current_song[:22], fill=_hex_to_rgb(C_TEXT), font=song_font)
+        current_song = state.now_playing or "等待播放..."
+        line = self._fit_line("♫ ", current_song, "md", 15, tick=state.marquee_tick)
+        self._draw_text(img, (15, y), line, C_TEXT, "md")
         y += 30
 
         # 北京时间
-        time_font = self._pick_font(self._get_beijing_time(), "md")
-        draw.text((15, y), "时间: " + self._get_beijing_time(), fill=_hex_to_rgb(C_DIM), font=time_font)
-
-        # 提示
-        hint_font = self._pick_font("发送「点歌 歌名」即可点歌", "xs")
-        draw.text((15, self.height - 25), "发送「点歌 歌名」即可点歌",
-                  fill=_hex_to_rgb(C_DIM), font=hint_font)
+        x = 15 + self._advance("时间: ", "md", "0")
+        self._draw_text(img, (x, y), state.clock, C_DIM, "md")
 
-    def _render_pk_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: Dict[str, Any]):
-        """PK模式 - 显示PK对战信息"""
-        y = 15
+    # --- PK 模式 ---
 
+    def _static_pk_mode(self, draw: ImageDraw.ImageDraw):
+        """PK模式静态层 - 标题和比分标签"""
         # 标题
         title_font = self._pick_font("PK模式", "xl")
-        draw.text((15, y), "⚔ PK对战", fill=_hex_to_rgb(C_MAGENTA), font=title_font)
-        y += 46
+        draw.text((15, 15), "⚔ PK对战", fill=_hex_to_rgb(C_MAGENTA), font=title_font)
+
+        # 比分标签
+        score_font = self._pick_font("我方: 0000", "lg")
+        draw.text((15, 61), "我方: ", fill=_hex_to_rgb(C_CYAN), font=score_font)
+        draw.text((15, 99), "对手: ", fill=_hex_to_rgb(C_YELLOW), font=score_font)
+
+    def _render_pk_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: PanelState):
+        """PK模式 - 显示PK对战信息"""
+        y = 61
 
         # 对手信息
-        opponent_name = state.get("opponent_name", "未知")
-        our_score = state.get("our_score", 0)
-        opponent_score = state.get("opponent_score", 0)
+        opponent_name = state.mode_value("opponent_name", "未知")
+        our_score = state.mode_value("our_score", 0)
+        opponent_score = state.mode_value("opponent_score", 0)
 
-        score_font = self._pick_font("我方: 0000", "lg")
-        draw.text((15, y), f"我方: {our_score:>4}", fill=_hex_to_rgb(C_CYAN), font=score_font)
+        x = 15 + self._advance("我方: ", "lg", "我方: 0000")
+        self._draw_text(img, (x, y), f"{our_score:>4}", C_CYAN, "lg", "我方: 0000")
         y += 38
 
-        draw.text((15, y), f"对手: {opponent_score:>4}", fill=_hex_to_rgb(C_YELLOW), font=score_font)
+        self._draw_text(img, (x, y), f"{opponent_score:>4}", C_YELLOW, "lg", "我方: 0000")
         y += 38
 
-        opponent_font = self._pick_font(opponent_name[:15], "md")
-        draw.text((15, y), f"VS {opponent_name[:15]}", fill=_hex_to_rgb(C_RED), font=opponent_font)
+        line = self._fit_line("VS ", opponent_name, "md", 15)
+        self._draw_text(img, (15, y), line, C_RED, "md")
         y += 30
 
         # 当前歌曲
-        current_song = self.songs.now_playing or "等待播放..."
-        song_font = self._pick_font(current_song, "md")
-        draw.text((15, y), "♫ " + current_song[:22], fill=_hex_to_rgb(C_TEXT), font=song_font)
+        current_song = state.now_playing or "等待播放..."
+        line = self._fit_line("♫ ", current_song, "md", 15, tick=state.marquee_tick)
+        self._draw_text(img, (15, y), line, C_TEXT, "md")
 
         # 时间
-        time_font = self._pick_font(self._get_beijing_time(), "xs")
-        draw.text((15, self.height - 25), self._get_beijing_time(),
-                  fill=_hex_to_rgb(C_DIM), font=time_font)
+        self._draw_text(img, (15, self.height - 25), state.clock, C_DIM, "xs")
+
+    # --- 歌曲模式 ---
+
+    def _static_music_mode(self, draw: ImageDraw.ImageDraw):
+        """歌曲模式静态层 - 标题前缀和点歌提示"""
+        # 标题前缀 (首数为动态内容)
+        title_font = self._pick_font("歌曲队列", "xl")
+        draw.text((15, 15), "♫ 队列 ", fill=_hex_to_rgb(C_MAGENTA), font=title_font)
 
-    def _render_music_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: Dict[str, Any]):
+        # 提示
+        hint_font = self._pick_font("发送「点歌 歌名」加入队列", "xs")
+        draw.text((15, self.height - 45), "发送「点歌 歌名」加入队列",
+                  fill=_hex_to_rgb(C_MAGENTA), font=hint_font)
+
+    def _render_music_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: PanelState):
         """歌曲模式 - 显示点歌队列"""
         y = 15
 
         # 标题
-        title_font = self._pick_font("歌曲队列", "xl")
-        queue_count = state.get("queue_count", 0)
-        draw.text((15, y), f"♫ 队列 {queue_count}首", fill=_hex_to_rgb(C_MAGENTA), font=title_font)
+        queue_count = state.mode_value("queue_count", 0)
+        x = 15 + self._advance("♫ 队列 ", "xl", "歌曲队列")
+        self._draw_text(img, (x, y), f"{queue_count}首", C_MAGENTA, "xl", "歌曲队列")
         y += 46
 
         # 当前播放
-        current_song = self.songs.now_playing or "等待播放..."
-        song_font = self._pick_font(current_song, "lg")
-        draw.text((15, y), "▶ " + current_song[:18], fill=_hex_to_rgb(C_CYAN), font=song_font)
+        current_song = state.now_playing or "等待播放..."
+        line = self._fit_line("▶ ", current_song, "lg", 15, tick=state.marquee_tick)
+        self._draw_text(img, (15, y), line, C_CYAN, "lg")
         y += 38
 
         # 队列列表 (最多显示4首) - 使用实际点歌队列
-        queue_songs = self.songs.queue_list()[:4]
+        queue_songs = list(state.queue[:4])
         if not queue_songs:
-            empty_font = self._pick_font("暂无排队", "md")
-            draw.text((15, y), "暂无排队", fill=_hex_to_rgb(C_DIM), font=empty_font)
+            self._draw_text(img, (15, y), "暂无排队", C_DIM, "md")
             y += 28
         else:
             for i, song in enumerate(queue_songs, 1):
-                song_line = f"{i}. {song[:20]}"
-                q_font = self._pick_font(song_line, "sm")
-                draw.text((15, y), song_line, fill=_hex_to_rgb(C_TEXT), font=q_font)
+                line = self._fit_line(f"{i}. ", song, "sm", 15)
+                self._draw_text(img, (15, y), line, C_TEXT, "sm")
                 y += 26
 
-        # 提示
-        hint_font = self._pick_font("发送「点歌 歌名」加入队列", "xs")
-        draw.text((15, self.height - 45), "发送「点歌 歌名」加入队列",
-                  fill=_hex_to_rgb(C_MAGENTA), font=hint_font)
+            # 队列总时长 (元数据已解析时)
+            if state.queue_duration:
+                self._draw_text(img, (15, y + 4), f"合计约 {state.queue_duration}", C_DIM, "xs")
 
         # 时间
-        time_font = self._pick_font(self._get_beijing_time(), "xs")
-        draw.text((15, self.height - 22), self._get_beijing_time(),
-                  fill=_hex_to_rgb(C_DIM), font=time_font)
+        self._draw_text(img, (15, self.height - 22), state.clock, C_DIM, "xs")
 
-    def _render_video_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: Dict[str, Any]):
-        """录像模式 - 显示当前播放和队列预览"""
-        y = 15
+    # --- 录像模式 ---
 
+    def _static_video_mode(self, draw: ImageDraw.ImageDraw):
+        """录像模式静态层 - 标题"""
         # 标题
         title_font = self._pick_font("录像模式", "lg")
-        draw.text((15, y), "[录像模式]", fill=_hex_to_rgb(C_CYAN), font=title_font)
-        y += 36
+        draw.text((15, 15), "[录像模式]", fill=_hex_to_rgb(C_CYAN), font=title_font)
+
+    def _render_video_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: PanelState):
+        """录像模式 - 显示当前播放和队列预览"""
+        y = 51
 
         # 当前播放（大字）
-        current_song = self.songs.now_playing or "等待播放..."
-        song_font = self._pick_font(current_song, "lg")
-        draw.text((15, y), "▶ " + current_song[:18], fill=_hex_to_rgb(C_CYAN), font=song_font)
+        current_song = state.now_playing or "等待播放..."
+        line = self._fit_line("▶ ", current_song, "lg", 15, tick=state.marquee_tick)
+        self._draw_text(img, (15, y), line, C_CYAN, "lg")
         y += 38
 
         # 下一首 (显示歌曲库的前几首)
-        all_songs = self.songs.list_songs(limit=2)
-        if all_songs:
-            next_font = self._pick_font(all_songs[0], "md")
-            draw.text((15, y), "> " + all_songs[0][:22], fill=_hex_to_rgb(C_TEXT), font=next_font)
+        if state.next_song:
+            line = self._fit_line("> ", state.next_song, "md", 15)
+            self._draw_text(img, (15, y), line, C_TEXT, "md")
             y += 30
 
         # 点歌队列预览
-        queue_songs = self.songs.queue_list()[:3]
+        queue_songs = list(state.queue[:3])
         if queue_songs:
-            draw.text((15, y), "歌曲队列:", fill=_hex_to_rgb(C_MAGENTA), font=self._pick_font("歌曲队列:", "md"))
+            self._draw_text(img, (15, y), "歌曲队列:", C_MAGENTA, "md")
             y += 28
             for i, song in enumerate(queue_songs, 1):
-                song_line = f"{i}. {song[:20]}"
-                q_font = self._pick_font(song_line, "sm")
-                draw.text((20, y), song_line, fill=_hex_to_rgb(C_DIM), font=q_font)
+                line = self._fit_line(f"{i}. ", song, "sm", 20)
+                self._draw_text(img, (20, y), line, C_DIM, "sm")
                 y += 26
         else:
-            draw.text((15, y), "发送「点歌 歌名」即可点歌",
-                      fill=_hex_to_rgb(C_DIM), font=self._pick_font("发送「点歌 歌名」即可点歌", "xs"))
+            self._draw_text(img, (15, y), "发送「点歌 歌名」即可点歌", C_DIM, "xs")
             y += 22
 
         # 统计
-        total_font = self._pick_font(f"共 {self.songs.total} 首", "xs")
-        draw.text((15, self.height - 45), f"共 {self.songs.total} 首",
-                  fill=_hex_to_rgb(C_DIM), font=total_font)
+        self._draw_text(img, (15, self.height - 45), f"共 {state.total} 首", C_DIM, "xs")
 
         # 时间
-        time_font = self._pick_font(self._get_beijing_time(), "xs")
-        draw.text((15, self.height - 22), self._get_beijing_time(),
-                  fill=_hex_to_rgb(C_DIM), font=time_font)
+        self._draw_text(img, (15, self.height - 22), state.clock, C_DIM, "xs")
 
-    def _render_replay_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: Dict[str, Any]):
-        """回放模式 - 显示回放信息和点播队列"""
-        y = 15
+    # --- 回放模式 ---
 
+    def _static_replay_mode(self, draw: ImageDraw.ImageDraw):
+        """回放模式静态层 - 标题"""
         # 标题
         title_font = self._pick_font("回放模式", "lg")
-        draw.text((15, y), "[回放模式]", fill=_hex_to_rgb(C_CYAN), font=title_font)
-        y += 36
+        draw.text((15, 15), "[回放模式]", fill=_hex_to_rgb(C_CYAN), font=title_font)
+
+    def _render_replay_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: PanelState):
+        """回放模式 - 显示回放信息和点播队列"""
+        y = 51
 
         # 当前播放
-        current_replay = self.replays.now_playing if self.replays else "等待播放..."
-        replay_font = self._pick_font(current_replay, "lg")
-        draw.text((15, y), "▶ " + current_replay[:18], fill=_hex_to_rgb(C_CYAN), font=replay_font)
+        current_replay = state.replay_now_playing if self.replays else "等待播放..."
+        line = self._fit_line("▶ ", current_replay, "lg", 15, tick=state.marquee_tick)
+        self._draw_text(img, (15, y), line, C_CYAN, "lg")
         y += 38
 
         # 点播队列
         if self.replays:
-            queue_items = self.replays.queue_list()[:3]
+            queue_items = list(state.replay_queue[:3])
             if queue_items:
-                draw.text((15, y), "点播队列:", fill=_hex_to_rgb(C_MAGENTA),
-                          font=self._pick_font("点播队列:", "md"))
+                self._draw_text(img, (15, y), "点播队列:", C_MAGENTA, "md")
                 y += 28
                 for i, code in enumerate(queue_items, 1):
-                    line = f"{i}. {code}"
-                    q_font = self._pick_font(line, "sm")
-                    draw.text((20, y), line, fill=_hex_to_rgb(C_TEXT), font=q_font)
+                    self._draw_text(img, (20, y), f"{i}. {code}", C_TEXT, "sm")
                     y += 26
             else:
-                hint = "发送「点播 日期编号」点播录播"
-                draw.text((15, y), hint,
-                          fill=_hex_to_rgb(C_DIM), font=self._pick_font(hint, "xs"))
+                self._draw_text(img, (15, y), "发送「点播 日期编号」点播录播", C_DIM, "xs")
                 y += 22
 
         # 统计
-        total = self.replays.total if self.replays else 0
-        total_font = self._pick_font(f"共 {total} 个回放", "xs")
-        draw.text((15, self.height - 45), f"共 {total} 个回放",
-                  fill=_hex_to_rgb(C_DIM), font=total_font)
+        self._draw_text(img, (15, self.height - 45), f"共 {state.replay_total} 个回放", C_DIM, "xs")
 
         # 时间
-        time_font = self._pick_font(self._get_beijing_time(), "xs")
-        draw.text((15, self.height - 22), self._get_beijing_time(),
-                  fill=_hex_to_rgb(C_DIM), font=time_font)
+        self._draw_text(img, (15, self.height - 22), state.clock, C_DIM, "xs")
 
-    def _render_other_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: Dict[str, Any]):
-        """其他模式 - 显示欢迎信息和帮助"""
+    # --- 其他模式 ---
+
+    def _static_other_mode(self, draw: ImageDraw.ImageDraw):
+        """其他模式静态层 - 欢迎信息和帮助 (整屏仅时间为动态)"""
         y = 40
 
         # 欢迎
@@ -432,21 +712,7 @@ class PanelRenderer:
         hint_font = self._pick_font("感谢关注~", "lg")
         draw.text((15, y), "感谢关注~", fill=_hex_to_rgb(C_MAGENTA), font=hint_font)
 
+    def _render_other_mode(self, img: Image.Image, draw: ImageDraw.ImageDraw, state: PanelState):
+        """其他模式 - 显示欢迎信息和帮助"""
         # 时间
-        time_font = self._pick_font(self._get_beijing_time(), "xs")
-        draw.text((15, self.height - 22), self._get_beijing_time(),
-                  fill=_hex_to_rgb(C_DIM), font=time_font)
-
-    async def render_loop(self, interval: float = 1.0):
-        """异步循环渲染面板"""
-        log.info(f"面板渲染器启动 (间隔 {interval}s)")
-        try:
-            while True:
-                self.render()
-                # 通过 OBS WebSocket 刷新图像源
-                if self.obs:
-                    await self.obs.refresh_image_source()
-                await asyncio.sleep(interval)
-        except asyncio.CancelledError:
-            log.info("面板渲染器停止")
-            raise
+        self._draw_text(img, (15, self.height - 22), state.clock, C_DIM, "xs")
@@ -0,0 +1,117 @@
+"""
+多面板渲染调度
+
+README 布局中除 B区信息面板 (520×435) 外，还有 C区 (532×488) 等区域。
+每个区域各开一个 PanelRenderer 循环会重复读取管理器状态，且同一 tick
+内不同面板看到的状态可能不一致。PanelEngine 每个 tick:
+
+  1. 由共用的 PanelSource 采集一份快照 (事件循环内，只读管理器一次)
+  2. 各面板把快照投影为自己的 PanelState，与上一帧相同则跳过
+  3. 有变化的面板在同一个工作线程中依次绘制/编码/输出
+  4. 只刷新内容确实变化、且以文件输出的面板对应的 OBS 图像源
+
+字体注册表是进程级共享的，文本位图缓存由引擎统一创建后传给各面板。
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .panel import PanelRenderer, PanelSource, PanelState
+
+log = logging.getLogger("panel")
+
+
+class PanelEngine:
+    """从同一份快照渲染多个面板"""
+
+    def __init__(self, surfaces: list[PanelRenderer], source: Optional[PanelSource] = None):
+        self.surfaces = surfaces
+        self.source = source or surfaces[0].source
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def capture(self) -> list[tuple[PanelRenderer, PanelState]]:
+        """采集一份快照，返回内容有变化的 (面板, 状态)"""
+        mode = self.source.current_mode
+        snapshot = self.source.snapshot(mode, {s.layout_for(mode) for s in self.surfaces})
+        pending = []
+        for surface in self.surfaces:
+            state = surface.project(snapshot)
+            if state == surface.last_state:
+                surface.frames_skipped += 1
+            else:
+                pending.append((surface, state))
+        return pending
+
+    @staticmethod
+    def _render_batch(pending: list[tuple[PanelRenderer, PanelState]]) -> list[PanelRenderer]:
+        """依次输出各面板，返回成功输出的面板"""
+        return [surface for surface, state in pending if surface.render_state(state)]
+
+    def render(self, force: bool = False) -> list[PanelRenderer]:
+        """同步渲染一次所有面板 (force 忽略内容指纹)"""
+        if force:
+            mode = self.source.current_mode
+            snapshot = self.source.snapshot(mode, {s.layout_for(mode) for s in self.surfaces})
+            pending = [(s, s.project(snapshot)) for s in self.surfaces]
+        else:
+            pending = self.capture()
+        return self._render_batch(pending)
+
+    async def _refresh(self, surfaces: list[PanelRenderer]):
+        """刷新内容变化的面板对应的 OBS 图像源"""
+        for surface in surfaces:
+            if surface.obs:
+                await surface.obs.refresh_image_source(surface.obs_source)
+
+    async def _render_in_worker(self, pending: list[tuple[PanelRenderer, PanelState]]):
+        """在工作线程中输出一批面板，完成后刷新 OBS 图像源"""
+        loop = asyncio.get_event_loop()
+        await self._refresh(await loop.run_in_executor(self._executor, self._render_batch, pending))
+
+    async def run(self, interval: float = 1.0, threaded: bool = True):
+        """异步循环渲染所有面板
+
+        Args:
+            interval: 刷新间隔 (秒)
+            threaded: 在事件循环中只采集快照，绘制/编码/写盘交给
+                专用工作线程。同一时间最多一批在途，上一批未完成时
+                丢弃本次快照 (下一轮会采集最新状态)，不排队。
+        """
+        names = ", ".join(f"{s.name} {s.width}x{s.height}" for s in self.surfaces)
+        log.info(f"面板渲染器启动 ({names}; 间隔 {interval}s, "
+                 f"{'工作线程' if threaded else '事件循环内'}渲染)")
+        if threaded and self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="panel")
+        inflight: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if not threaded:
+                    # 内容未变的面板不输出，也不刷新 OBS
+                    await self._refresh(self._render_batch(self.capture()))
+                elif inflight is not None and not inflight.done():
+                    for surface in self.surfaces:
+                        surface.frames_dropped += 1
+                else:
+                    pending = self.capture()
+                    if pending:
+                        inflight = asyncio.ensure_future(self._render_in_worker(pending))
+                await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            if inflight is not None:
+                inflight.cancel()
+            for surface in self.surfaces:
+                cache = surface.stats["text_cache"]
+                enc = surface.stats["encoder"]
+                log.info(f"面板 {surface.name} 停止 (输出 {surface.frames_rendered} 帧, "
+                         f"跳过 {surface.frames_skipped} 帧, 丢弃 {surface.frames_dropped} 帧, "
+                         f"文本缓存命中率 {cache['hit_rate']:.0%}, "
+                         f"{enc['format']} 编码 {enc['encode_ms']}ms/{enc['bytes_per_frame']}B 每帧)")
+            raise
+
+    def close(self):
+        """释放渲染工作线程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,131 @@
+"""
+面板输出管线 - 编码 + 原子写入
+
+OBS 图像源在文件被改写的瞬间读取会得到半张图；这里先写入同目录
+下的临时文件，再 os.replace 原子替换，OBS 永远只会看到完整的旧帧
+或完整的新帧。
+
+编码方式 ([panel] format):
+  png      - 标准 PNG，compress_level 控制 zlib 级别 (0-9)
+  palette  - 量化到终端配色的固定调色板后存 PNG (8bit，体积和压缩开销都更小)
+  bmp      - 无压缩 BMP，编码几乎零开销，适合配合 tmpfs/内存盘使用
+"""
+
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image
+
+log = logging.getLogger("panel")
+
+FORMATS = ("png", "palette", "bmp")
+
+# 每种格式的输出文件扩展名 / HTTP 内容类型
+FORMAT_EXTENSIONS = {"png": ".png", "palette": ".png", "bmp": ".bmp"}
+FORMAT_CONTENT_TYPES = {"png": "image/png", "palette": "image/png", "bmp": "image/bmp"}
+
+# 调色板量化时，每种前景色到背景色之间的抗锯齿过渡级数
+_PALETTE_RAMP = 16
+
+
+@dataclass
+class OutputOptions:
+    """面板编码选项"""
+    format: str = "png"
+    compress_level: int = 6  # 与 Pillow 默认值一致
+
+    def __post_init__(self):
+        if self.format not in FORMATS:
+            log.warning(f"未知面板格式: {self.format}，使用 png")
+            self.format = "png"
+        self.compress_level = min(9, max(0, self.compress_level))
+
+    @property
+    def extension(self) -> str:
+        return FORMAT_EXTENSIONS[self.format]
+
+    @property
+    def content_type(self) -> str:
+        return FORMAT_CONTENT_TYPES[self.format]
+
+
+def build_palette(background: tuple, colors: list) -> Image.Image:
+    """构建终端配色调色板图像
+
+    每种前景色与背景色之间线性插值 _PALETTE_RAMP 级，覆盖文字
+    抗锯齿边缘的全部过渡色，量化后几乎看不出差异。
+    """
+    entries = [background]
+    for color in colors:
+        for i in range(1, _PALETTE_RAMP + 1):
+            t = i / _PALETTE_RAMP
+            entries.append(tuple(round(b + (c - b) * t) for b, c in zip(background, color)))
+    entries = entries[:256]
+    flat = [v for rgb in entries for v in rgb]
+    flat += list(entries[-1]) * (256 - len(entries))
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(flat)
+    return palette
+
+
+class PanelEncoder:
+    """按选项编码面板图像，并统计编码耗时与输出字节数"""
+
+    def __init__(self, options: Optional[OutputOptions] = None,
+                 palette: Optional[Image.Image] = None):
+        self.options = options or OutputOptions()
+        self._palette = palette
+
+        self.frames = 0
+        self.encode_seconds = 0.0
+        self.bytes_written = 0
+        self.last_bytes = 0
+
+    def encode(self, img: Image.Image) -> bytes:
+        """编码为文件内容"""
+        start = time.perf_counter()
+        buf = io.BytesIO()
+        fmt = self.options.format
+        if fmt == "bmp":
+            img.save(buf, "BMP")
+        else:
+            if fmt == "palette" and self._palette is not None:
+                img = img.quantize(palette=self._palette, dither=0)  # 不抖动
+            img.save(buf, "PNG", compress_level=self.options.compress_level)
+        data = buf.getvalue()
+
+        self.frames += 1
+        self.encode_seconds += time.perf_counter() - start
+        self.last_bytes = len(data)
+        self.bytes_written += len(data)
+        return data
+
+    @property
+    def stats(self) -> dict:
+        """平均每帧编码耗时 (ms) 与字节数"""
+        n = self.frames or 1
+        return {
+            "format": self.options.format,
+            "frames": self.frames,
+            "encode_ms": round(self.encode_seconds / n * 1000, 2),
+            "bytes_per_frame": self.bytes_written // n,
+        }
+
+
+def write_atomic(path: str, data: bytes, fsync: bool = False):
+    """写入临时文件后原子替换目标文件
+
+    临时文件与目标在同一目录，保证 os.replace 是同一文件系统内的重命名。
+    fsync 为 True 时替换前先落盘 (断电后不会得到空文件)。
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,194 @@
+"""
+面板本地 HTTP 服务 - 供 OBS 浏览器源直接显示面板
+
+替代 panel.png + refresh_image_source 的文件轮询方案:
+  GET /        浏览器源页面 (全屏显示面板图像，通过 WebSocket 接收新帧)
+  GET /panel   最新一帧图像 (调试用)
+  GET /ws      WebSocket，内容变化时推送整帧图像 (二进制消息)
+
+只有面板内容变化、渲染器产出新帧时才推送，没有文件读写，
+也没有每帧两次 OBS WebSocket 请求，刷新率可以高于 1Hz。
+某个客户端还在发送上一帧时只记下最新一帧，发完后再发它 (中间的帧丢弃)，
+慢客户端不会积压发送任务。
+
+OBS 设置: 添加「浏览器」源，URL 填 http://127.0.0.1:<端口>/，
+宽高与 [panel] width/height 一致。
+"""
+
+import asyncio
+import logging
+import weakref
+from typing import Optional
+
+from aiohttp import web, WSMsgType
+
+log = logging.getLogger("panel")
+
+_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<style>
+  html, body {{ margin: 0; padding: 0; overflow: hidden; background: transparent; }}
+  img {{ display: block; width: {width}px; height: {height}px; }}
+</style>
+</head>
+<body>
+<img id="panel" src="/panel">
+<script>
+  const img = document.getElementById("panel");
+  let lastUrl = null;
+  function connect() {{
+    const ws = new WebSocket(`ws://${{location.host}}/ws`);
+    ws.binaryType = "blob";
+    ws.onmessage = (ev) => {{
+      const url = URL.createObjectURL(ev.data);
+      img.onload = () => {{ if (lastUrl) URL.revokeObjectURL(lastUrl); lastUrl = url; }};
+      img.src = url;
+    }};
+    ws.onclose = () => setTimeout(connect, 1000);
+  }}
+  connect();
+</script>
+</body>
+</html>
+"""
+
+
+class PanelServer:
+    """面板 HTTP/WebSocket 推送服务"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765,
+                 width: int = 520, height: int = 435,
+                 content_type: str = "image/png"):
+        self.host = host
+        self.port = port
+        self.content_type = content_type
+        self._page = _PAGE.format(width=width, height=height)
+
+        self._frame: Optional[bytes] = None
+        self._clients: "weakref.WeakSet[web.WebSocketResponse]" = weakref.WeakSet()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+
+        # 正在发送的客户端 → 发完后要发的最新一帧 (None 表示没有)
+        self._pending: dict[web.WebSocketResponse, Optional[bytes]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        self.frames_pushed = 0
+        self.frames_dropped = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    async def start(self) -> bool:
+        """启动 HTTP 服务"""
+        self._loop = asyncio.get_event_loop()
+        app = web.Application()
+        app.router.add_get("/", self._handle_page)
+        app.router.add_get("/panel", self._handle_frame)
+        app.router.add_get("/ws", self._handle_ws)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            log.error(f"面板 HTTP 服务启动失败 ({self.host}:{self.port}): {e}")
+            await self._runner.cleanup()
+            self._runner = None
+            return False
+        log.info(f"面板 HTTP 服务已启动: {self.url}")
+        return True
+
+    async def stop(self):
+        """关闭所有 WebSocket 连接并停止服务"""
+        for task in list(self._tasks):
+            task.cancel()
+        for ws in list(self._clients):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+            log.info(f"面板 HTTP 服务已停止 (推送 {self.frames_pushed} 帧, "
+                     f"慢客户端跳过 {self.frames_dropped} 帧)")
+
+    def publish(self, data: bytes):
+        """发布新帧 (线程安全，可在渲染工作线程中调用)"""
+        if self._loop is None or self._loop.is_closed():
+            self._frame = data
+            return
+        self._loop.call_soon_threadsafe(self._broadcast, data)
+
+    def _broadcast(self, data: bytes):
+        self._frame = data
+        for ws in list(self._clients):
+            self._push(ws, data)
+
+    def _push(self, ws: web.WebSocketResponse, data: bytes):
+        """向一个客户端发送一帧；该客户端仍在发送时只保留最新一帧"""
+        if ws.closed:
+            return
+        if ws in self._pending:
+            if self._pending[ws] is not None:
+                self.frames_dropped += 1
+            self._pending[ws] = data
+            return
+        self._pending[ws] = None
+        task = asyncio.ensure_future(self._drain(ws, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._send_done)
+
+    def _send_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error(f"面板推送失败: {task.exception()}")
+
+    async def _drain(self, ws: web.WebSocketResponse, data: Optional[bytes]):
+        try:
+            while data is not None and not ws.closed:
+                if await self._send(ws, data):
+                    self.frames_pushed += 1
+                data = self._pending.get(ws)
+                self._pending[ws] = None
+        finally:
+            self._pending.pop(ws, None)
+
+    async def _send(self, ws: web.WebSocketResponse, data: bytes) -> bool:
+        try:
+            await ws.send_bytes(data)
+        except (ConnectionError, RuntimeError) as e:
+            log.debug(f"面板推送失败: {e}")
+            return False
+        return True
+
+    # --- 路由 ---
+
+    async def _handle_page(self, request: web.Request) -> web.Response:
+        return web.Response(text=self._page, content_type="text/html")
+
+    async def _handle_frame(self, request: web.Request) -> web.Response:
+        if self._frame is None:
+            return web.Response(status=503, text="panel not ready")
+        return web.Response(body=self._frame, content_type=self.content_type,
+                            headers={"Cache-Control": "no-store"})
+
+    async def _handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        self._clients.add(ws)
+        log.info(f"面板浏览器源已连接 ({request.remote})")
+
+        # 新连接立即收到当前帧，不必等内容变化
+        if self._frame is not None:
+            self._push(ws, self._frame)
+
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            self._clients.discard(ws)
+            log.info(f"面板浏览器源已断开 ({request.remote})")
+        return ws
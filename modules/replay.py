@@ -6,58 +6,153 @@
   NN = 场次编号 (01-99)
 
 支持的格式: .mp4, .mkv, .avi, .flv
+
+正在播放/队列/总数与 SongManager 一样在每次修改时发布不可变快照 (ReplaySnapshot)，
+面板无锁读取。
 """
 
 import os
 import re
 import threading
 import logging
-from typing import Optional
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from .index_store import IndexStore
+from .metadata import MetadataService
+from .request_queue import QueueResult, RequestQueue
+from .scanner import REPLAY_EXTENSIONS, FileEntry, Scanner, suffix_of
+from .state_journal import StateJournal
 
 log = logging.getLogger("replay")
 
-# 文件名匹配: 10位数字 + 视频扩展名
-_REPLAY_PATTERN = re.compile(r"^(\d{10})\.(mp4|mkv|avi|flv)$", re.IGNORECASE)
+# 文件名匹配: 10位数字 + 扩展名 (扩展名见 scanner.REPLAY_EXTENSIONS)
+_REPLAY_PATTERN = re.compile(r"^(\d{10})(\.[^.]+)$")
 
-# 支持的扩展名
-REPLAY_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.flv'}
+
+@dataclass(frozen=True)
+class ReplaySnapshot:
+    """录播库对外可见状态的不可变快照"""
+    version: int
+    now_playing: str
+    total: int
+    queue: tuple[tuple[str, str], ...]  # 按播放顺序的 (code, filepath)
 
 
 class ReplayManager:
     """录播文件索引 + 点播队列管理"""
 
-    def __init__(self, replay_dir: str, data_dir: str):
+    def __init__(self, replay_dir: str, data_dir: str, store: Optional[IndexStore] = None,
+                 scanner: Optional[Scanner] = None, metadata: Optional[MetadataService] = None,
+                 queue: Optional[RequestQueue] = None, journal: Optional[StateJournal] = None):
         self.replay_dir = replay_dir
         self.data_dir = data_dir
+        self.store = store  # 持久化索引 (None 时每次列目录)
+        self.scanner = scanner or Scanner()
+        self.metadata = metadata  # 时长等元数据 (None 时时长一律未知)
+        self.journal = journal  # 队列变化写入状态日志 (None 时不持久化)
+        self.index_stats: dict = {}
         self._index: dict[str, str] = {}  # {code: filepath}
-        self._queue: list[tuple[str, str]] = []  # [(code, filepath), ...]
+        self._queue = queue if queue is not None else RequestQueue()  # 出队内容为 (code, filepath)
         self._now_playing: str = "等待播放..."
         self._lock = threading.Lock()
+        self._snapshot = ReplaySnapshot(0, self._now_playing, 0, ())
         self.build_index()
 
+    def _publish(self):
+        """发布新快照 (调用方持有锁)"""
+        self._snapshot = ReplaySnapshot(
+            version=self._snapshot.version + 1,
+            now_playing=self._now_playing,
+            total=len(self._index),
+            queue=tuple(self._queue.items()),
+        )
+
+    @property
+    def snapshot(self) -> ReplaySnapshot:
+        """当前快照 (无锁读取，内容不可变)"""
+        return self._snapshot
+
     def build_index(self):
         """扫描录播目录，构建日期编号索引"""
         index = {}
-        if not self.replay_dir or not os.path.isdir(self.replay_dir):
+        if not self.replay_dir:
             log.warning(f"录播目录不存在: {self.replay_dir}")
             with self._lock:
                 self._index = index
+                self._publish()
             return
 
-        try:
-            for filename in os.listdir(self.replay_dir):
-                match = _REPLAY_PATTERN.match(filename)
-                if match:
-                    code = match.group(1)
-                    filepath = os.path.join(self.replay_dir, filename)
-                    index[code] = filepath
-        except Exception as e:
-            log.error(f"扫描录播目录失败: {e}")
+        t0 = time.perf_counter()
+        root = os.path.abspath(self.replay_dir)
+        store = self.store
+        lister = store.lister("replays") if store is not None else None
+        listings = []
+        found: list[FileEntry] = []
+        for listing in self.scanner.walk(root, self.matches, recursive=False, lister=lister):
+            listings.append(listing)
+            files = listing.files
+            if listing.timed_out and store is not None:
+                files = store.fallback("replays", listing.path)
+            found.extend(files)
+            for entry in files:
+                index[entry.name[:10]] = entry.path
+        rescanned = True
+        if store is not None:
+            rescanned = store.record("replays", root, listings, recursive=False).rescanned
+        self.index_stats = {
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000),
+            "warm": store is not None and not rescanned,
+            "rescanned": rescanned,
+            "timed_out": sum(1 for listing in listings if listing.timed_out),
+        }
 
         with self._lock:
             self._index = index
+            self._publish()
+        if self.metadata is not None:
+            self.metadata.request(found)
+
+        log.info(f"录播索引: {len(index)} 个文件 (来自: {self.replay_dir}, "
+                 f"{self.index_stats['elapsed_ms']}ms, "
+                 f"{'热启动' if self.index_stats['warm'] else '冷启动'})")
 
-        log.info(f"录播索引: {len(index)} 个文件 (来自: {self.replay_dir})")
+    @staticmethod
+    def matches(filename: str) -> bool:
+        """文件名是否为录播文件 (YYYYMMDDNN.ext)"""
+        return (_REPLAY_PATTERN.match(filename) is not None
+                and suffix_of(filename) in REPLAY_EXTENSIONS)
+
+    def apply_changes(self, added: Iterable[str], removed: Iterable[str]) -> tuple[int, int]:
+        """增量更新索引 (目录监视): added / removed 为文件路径
+
+        Returns:
+            (新增个数, 移除个数)
+        """
+        added_count = removed_count = 0
+        fresh = []
+        with self._lock:
+            for path in removed:
+                match = _REPLAY_PATTERN.match(os.path.basename(path))
+                if not match:
+                    continue
+                code = match.group(1)
+                current = self._index.get(code)
+                if current and os.path.abspath(current) == os.path.abspath(path):
+                    del self._index[code]
+                    removed_count += 1
+            for path in added:
+                filename = os.path.basename(path)
+                if self.matches(filename) and filename[:10] not in self._index:
+                    self._index[filename[:10]] = path
+                    fresh.append(path)
+                    added_count += 1
+            if added_count or removed_count:
+                self._publish()
+        if self.metadata is not None and fresh:
+            self.metadata.request(fresh)
+        return added_count, removed_count
 
     def search(self, code: str) -> Optional[tuple[str, str]]:
         """按编号查找录播文件
@@ -74,6 +169,10 @@ class ReplayManager:
                 return code, filepath
         return None
 
+    def duration(self, filepath: str) -> Optional[float]:
+        """录播时长 (秒)，尚未解析或解析失败时为 None"""
+        return self.metadata.duration(filepath) if self.metadata is not None else None
+
     def get_all_files(self) -> list[str]:
         """返回按日期编号排序的全部文件路径列表"""
         with self._lock:
@@ -82,43 +181,85 @@ class ReplayManager:
 
     @property
     def total(self) -> int:
-        with self._lock:
-            return len(self._index)
+        return self._snapshot.total
 
     # --- 点播队列 ---
 
-    def queue_add(self, code: str, filepath: str):
-        """添加到点播队列"""
+    def queue_add(self, code: str, filepath: str, uid: Optional[int] = None) -> QueueResult:
+        """添加到点播队列 (同一录播不重复排队，按点歌人轮转)"""
         with self._lock:
-            self._queue.append((code, filepath))
+            result = self._queue.push(code, (code, filepath), uid)
+            if result.added:
+                self._publish()
+        if result.added and self.journal is not None:
+            self.journal.record("push", q="replays", key=code, item=[code, filepath], uid=uid)
+        return result
 
     def queue_pop(self) -> Optional[tuple[str, str]]:
         """弹出队列头部"""
         with self._lock:
-            return self._queue.pop(0) if self._queue else None
+            item = self._queue.pop()
+            if item is not None:
+                self._publish()
+        if item is not None and self.journal is not None:
+            self.journal.record("pop", q="replays", key=item[0])
+        return item
+
+    def queue_restore(self, entries: dict) -> int:
+        """从状态日志恢复点播队列，已不存在 (或超出队列上限) 的录播丢弃
+
+        Args:
+            entries: {编号: ([code, filepath], uid)}，按入队顺序
+
+        Returns:
+            恢复的数量
+        """
+        dropped = []
+        with self._lock:
+            for code, (item, uid) in entries.items():
+                filepath = item[1]
+                if not (os.path.exists(filepath) and self._queue.push(code, (code, filepath), uid).added):
+                    dropped.append(code)
+            self._publish()
+        if self.journal is not None:
+            for code in dropped:
+                self.journal.record("pop", q="replays", key=code)
+        return len(entries) - len(dropped)
+
+    def queue_list(self, limit: int = 0) -> list[str]:
+        """返回队列中的编号列表 (按播放顺序，limit > 0 时至多 limit 个)"""
+        queue = self._snapshot.queue
+        return [code for code, _ in (queue[:limit] if limit > 0 else queue)]
 
-    def queue_list(self) -> list[str]:
-        """返回队列中的编号列表"""
+    def queue_peek(self) -> Optional[tuple[str, str]]:
+        """队列中下一个 (code, filepath)，不出队"""
+        queue = self._snapshot.queue
+        return queue[0] if queue else None
+
+    def queue_position(self, code: str) -> int:
+        """录播的排队位置 (从 1 开始)，不在队列中时为 0"""
         with self._lock:
-            return [code for code, _ in self._queue]
+            return self._queue.position(code)
 
     def queue_clear(self):
         with self._lock:
             self._queue.clear()
+            self._publish()
+        if self.journal is not None:
+            self.journal.record("clear", q="replays")
 
     @property
     def queue_count(self) -> int:
-        with self._lock:
-            return len(self._queue)
+        return len(self._snapshot.queue)
 
     # --- 当前播放 ---
 
     @property
     def now_playing(self) -> str:
-        with self._lock:
-            return self._now_playing
+        return self._snapshot.now_playing
 
     @now_playing.setter
     def now_playing(self, value: str):
         with self._lock:
             self._now_playing = value
+            self._publish()
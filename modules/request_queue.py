@@ -0,0 +1,158 @@
+"""
+点歌/点播请求队列 - SongManager 与 ReplayManager 共用
+
+原来两个队列都是 list + pop(0)，同一首歌可以重复排队，一个观众也能刷满整个队列。
+RequestQueue 按点歌人 (uid) 分桶，出队时在各点歌人之间轮转:
+
+  入队 / 出队 / 是否已在队列   O(1)
+  查询排队位置                 O(点歌人数)
+  预览前 n 个                  O(n + 点歌人数)
+
+同一项目 (歌曲路径 / 录播编号) 已在队列中时不重复入队，返回其现有位置；
+每人排队数可设上限。uid 为 None 的请求 (主播端/内部调用) 不受个人上限约束，
+与其他点歌人一样参与轮转。
+
+非线程安全，由所属管理器在自身的锁内调用。
+"""
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Hashable, Iterator, Optional
+
+
+class QueueStatus(Enum):
+    """入队结果"""
+    ADDED = "added"
+    DUPLICATE = "duplicate"  # 已在队列中 (位置为现有位置)
+    USER_LIMIT = "user_limit"  # 该点歌人排队数已达上限
+    FULL = "full"  # 队列总数已达上限
+
+
+@dataclass(frozen=True)
+class QueueResult:
+    status: QueueStatus
+    position: int = 0  # 从 1 开始；未入队时为 0
+
+    @property
+    def added(self) -> bool:
+        return self.status == QueueStatus.ADDED
+
+
+@dataclass
+class _Request:
+    key: Hashable
+    item: Any
+    uid: Optional[int]
+    seq: int  # 在该点歌人桶中的序号
+
+
+class _Bucket:
+    """一个点歌人的待播请求"""
+
+    __slots__ = ("requests", "popped")
+
+    def __init__(self):
+        self.requests: deque[_Request] = deque()
+        self.popped = 0  # 已出队数 (序号 - popped = 桶内下标)
+
+
+class RequestQueue:
+    """去重 + 按点歌人轮转的请求队列"""
+
+    def __init__(self, per_user: int = 0, capacity: int = 0):
+        """
+        Args:
+            per_user: 每个点歌人最多排队数 (0 表示不限)
+            capacity: 队列总数上限 (0 表示不限)
+        """
+        self.per_user = per_user
+        self.capacity = capacity
+        # 轮转顺序: 队首的点歌人下一个出队，出队后移到末尾
+        self._buckets: OrderedDict[Optional[int], _Bucket] = OrderedDict()
+        self._requests: dict[Hashable, _Request] = {}
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._requests
+
+    def push(self, key: Hashable, item: Any, uid: Optional[int] = None) -> QueueResult:
+        """入队
+
+        Args:
+            key: 去重键 (歌曲路径 / 录播编号)
+            item: 出队时返回的内容
+            uid: 点歌人
+        """
+        if key in self._requests:
+            return QueueResult(QueueStatus.DUPLICATE, self.position(key))
+        if self.capacity > 0 and len(self._requests) >= self.capacity:
+            return QueueResult(QueueStatus.FULL)
+        bucket = self._buckets.get(uid)
+        if (uid is not None and self.per_user > 0 and bucket is not None
+                and len(bucket.requests) >= self.per_user):
+            return QueueResult(QueueStatus.USER_LIMIT, self.position(bucket.requests[-1].key))
+        if bucket is None:
+            bucket = self._buckets[uid] = _Bucket()
+        request = _Request(key, item, uid, bucket.popped + len(bucket.requests))
+        bucket.requests.append(request)
+        self._requests[key] = request
+        return QueueResult(QueueStatus.ADDED, self.position(key))
+
+    def pop(self) -> Optional[Any]:
+        """出队: 轮到的点歌人的最早一个请求"""
+        if not self._buckets:
+            return None
+        uid, bucket = next(iter(self._buckets.items()))
+        request = bucket.requests.popleft()
+        bucket.popped += 1
+        del self._requests[request.key]
+        if bucket.requests:
+            self._buckets.move_to_end(uid)
+        else:
+            del self._buckets[uid]
+        return request.item
+
+    def position(self, key: Hashable) -> int:
+        """排队位置 (从 1 开始)，不在队列中时为 0"""
+        request = self._requests.get(key)
+        if request is None:
+            return 0
+        bucket = self._buckets[request.uid]
+        index = request.seq - bucket.popped  # 桶内下标: 前面还有 index 轮
+        ahead = 0
+        before = True  # 轮转顺序上排在该点歌人之前
+        for uid, other in self._buckets.items():
+            if uid == request.uid:
+                before = False
+                continue
+            ahead += min(len(other.requests), index + 1 if before else index)
+        return ahead + index + 1
+
+    def items(self, limit: int = 0) -> Iterator[Any]:
+        """按出队顺序产出请求内容 (limit > 0 时至多 limit 个)"""
+        buckets = [bucket.requests for bucket in self._buckets.values()]
+        produced = 0
+        depth = 0
+        while buckets:
+            remaining = []
+            for requests in buckets:
+                if limit > 0 and produced >= limit:
+                    return
+                yield requests[depth].item
+                produced += 1
+                if len(requests) > depth + 1:
+                    remaining.append(requests)
+            buckets = remaining
+            depth += 1
+
+    def count(self, uid: Optional[int]) -> int:
+        """某个点歌人的排队数"""
+        bucket = self._buckets.get(uid)
+        return len(bucket.requests) if bucket is not None else 0
+
+    def clear(self):
+        self._buckets.clear()
+        self._requests.clear()
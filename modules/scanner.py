@@ -0,0 +1,166 @@
+"""
+媒体库目录扫描 - 歌曲库/录播/录像目录共用
+
+原来三处各扫各的: 歌曲库按五个扩展名各 glob 一次 (同一目录列五遍)，
+录播用 os.listdir，录像播放列表用 os.walk，三套扩展名也各不相同。
+
+这里统一为:
+  - 扩展名表集中定义，每个文件只取一次后缀做集合查找
+  - 每个目录只 os.scandir 一次，文件大小/mtime 与子目录一并取得
+  - 多个工作线程并行列目录，子目录列出后立即分派 (NAS 上延迟可叠加)
+  - 每个目录单独计时，超时则放弃该目录 (卡死的 SMB 挂载不会拖住启动)
+  - 生成器逐目录产出结果，调用方边扫描边建索引
+
+工作线程是守护线程，卡死在网络文件系统上的线程不会阻止进程退出；
+超时后补一个新线程，其余目录照常扫描。
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+log = logging.getLogger("scanner")
+
+# 歌曲库收录的格式
+SONG_EXTENSIONS = frozenset({".mp4", ".mp3", ".flv", ".mkv", ".wav"})
+# 录播文件格式 (文件名 YYYYMMDDNN.ext)
+REPLAY_EXTENSIONS = frozenset({".mp4", ".mkv", ".avi", ".flv"})
+# VLC 目录播放收录的格式
+MEDIA_EXTENSIONS = frozenset({".mp3", ".mp4", ".mkv", ".avi", ".flv", ".m4a", ".aac", ".ogg", ".wav"})
+
+# 等待结果时检查超时的间隔 (秒)
+_TICK = 0.25
+
+
+def suffix_of(filename: str) -> str:
+    """小写扩展名 (含点)"""
+    return os.path.splitext(filename)[1].lower()
+
+
+@dataclass(frozen=True)
+class FileEntry:
+    """目录中的一个文件"""
+    name: str  # 文件名 (含扩展名)
+    path: str
+    size: int
+    mtime_ns: int
+
+
+@dataclass
+class DirListing:
+    """一个目录的扫描结果"""
+    path: str
+    mtime_ns: Optional[int] = None
+    files: list[FileEntry] = field(default_factory=list)
+    subdirs: list[str] = field(default_factory=list)
+    cached: bool = False  # 来自持久化索引 (目录未变，未重新列目录)
+    timed_out: bool = False
+    error: Optional[str] = None
+
+
+Lister = Callable[[str, Callable[[str], object]], DirListing]
+
+
+def list_directory(path: str, match: Callable[[str], object]) -> DirListing:
+    """os.scandir 列一次目录: 文件名满足 match 的文件 + 子目录 (跳过隐藏项)"""
+    mtime_ns = os.stat(path).st_mtime_ns
+    listing = DirListing(path, mtime_ns)
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir():
+                    listing.subdirs.append(entry.path)
+                elif entry.is_file() and match(entry.name):
+                    st = entry.stat()
+                    listing.files.append(FileEntry(entry.name, entry.path,
+                                                   st.st_size, st.st_mtime_ns))
+            except OSError:
+                continue
+    return listing
+
+
+class Scanner:
+    """并行目录扫描器 (无状态，可在多个线程中同时使用)"""
+
+    def __init__(self, workers: int = 8, timeout: float = 10.0):
+        """
+        Args:
+            workers: 并行列目录的线程数
+            timeout: 单个目录的超时 (秒)，0 表示不限
+        """
+        self.workers = max(1, workers)
+        self.timeout = timeout
+
+    def walk(self, root: str, match: Callable[[str], object], recursive: bool = True,
+             lister: Optional[Lister] = None) -> Iterator[DirListing]:
+        """逐目录产出扫描结果 (完成先后顺序)
+
+        Args:
+            root: 根目录
+            match: 按文件名过滤
+            recursive: 是否进入子目录
+            lister: 列单个目录的函数 (默认 list_directory；持久化索引可替换为
+                目录未变时直接返回缓存结果的版本)
+        """
+        lister = lister or list_directory
+        tasks: queue.SimpleQueue = queue.SimpleQueue()
+        results: queue.SimpleQueue = queue.SimpleQueue()
+        started: dict[str, float] = {}
+
+        def work():
+            while True:
+                path = tasks.get()
+                if path is None:
+                    return
+                started[path] = time.monotonic()
+                try:
+                    results.put((path, lister(path, match), None))
+                except Exception as e:
+                    results.put((path, None, e))
+
+        def spawn():
+            threading.Thread(target=work, name="scan", daemon=True).start()
+
+        outstanding = {root}
+        tasks.put(root)
+        spawned = 0
+        try:
+            while outstanding:
+                # 按待扫描目录数逐步加线程，单目录扫描不必开满
+                while spawned < min(self.workers, len(outstanding)):
+                    spawn()
+                    spawned += 1
+                try:
+                    path, listing, error = results.get(timeout=_TICK)
+                except queue.Empty:
+                    path = None
+                if path is not None and path in outstanding:
+                    outstanding.discard(path)
+                    if error is not None:
+                        log.warning(f"扫描目录失败 {path}: {error}")
+                        yield DirListing(path, error=str(error))
+                    else:
+                        if recursive:
+                            for subdir in listing.subdirs:
+                                outstanding.add(subdir)
+                                tasks.put(subdir)
+                        yield listing
+                if self.timeout > 0:
+                    now = time.monotonic()
+                    for path in [p for p in outstanding
+                                 if now - started.get(p, now) > self.timeout]:
+                        # 卡住的线程无法中断: 放弃该目录，补一个线程继续
+                        outstanding.discard(path)
+                        log.warning(f"目录扫描超时 ({self.timeout}s)，跳过: {path}")
+                        spawn()
+                        spawned += 1
+                        yield DirListing(path, timed_out=True)
+        finally:
+            for _ in range(spawned):
+                tasks.put(None)
@@ -0,0 +1,124 @@
+"""
+歌名 n-gram 倒排索引
+
+点歌搜索原来在锁内遍历整个歌曲库，对每首歌调用 name.lower() 做子串匹配，
+歌曲库数万首时每条弹幕都是 O(N) 的字符串处理，且都在事件循环上。
+
+这里在建索引时把每个歌名规范化 (小写) 一次，按字符二元组 (CJK 字符
+与拉丁字符同样处理) 建立倒排表。子串查询取查询串的全部二元组，
+只沿其中最短的倒排表对候选做一次真正的子串校验。
+单字符查询使用单字倒排表。
+
+倒排表是按编号升序的紧凑整数数组 (array('I'))：内存约为集合的
+1/8，而且沿最短倒排表升序校验时，第一个通过校验的就是编号最小的命中，
+常见字查询也能很快返回。单首歌增删用二分插入/删除维护有序。
+"""
+
+from array import array
+from bisect import bisect_left, insort
+from typing import Iterable, Iterator, Optional
+
+
+def normalize(text: str) -> str:
+    """搜索用的规范化形式 (与原先的 keyword.lower() in name.lower() 语义一致)"""
+    return text.lower()
+
+
+def grams(text: str, n: int = 2) -> set[str]:
+    """文本的全部 n 字符片段 (短于 n 时为空)"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NgramIndex:
+    """子串查询用的 n 元组倒排索引 (默认二元组)
+
+    只含 ASCII 的字段 (如拼音) 字母表小，二元组区分度低，可用 n=3。
+    """
+
+    def __init__(self, texts: Iterable[str] = (), n: int = 2):
+        self.n = n
+        self._docs: dict[int, str] = {}  # 编号 → 规范化文本
+        self._ngrams: dict[str, array] = {}  # n 元组 → 编号
+        self._chars: dict[str, array] = {}
+        # 批量构建: 编号递增，直接追加即有序
+        for doc_id, text in enumerate(texts):
+            norm = normalize(text)
+            self._docs[doc_id] = norm
+            for table, keys in ((self._ngrams, grams(norm, self.n)), (self._chars, set(norm))):
+                for key in keys:
+                    postings = table.get(key)
+                    if postings is None:
+                        postings = table[key] = array("I")
+                    postings.append(doc_id)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: int, text: str):
+        """加入一条文本 (编号由调用方分配)"""
+        norm = normalize(text)
+        self._docs[doc_id] = norm
+        for table, keys in ((self._ngrams, grams(norm, self.n)), (self._chars, set(norm))):
+            for key in keys:
+                postings = table.get(key)
+                if postings is None:
+                    postings = table[key] = array("I")
+                insort(postings, doc_id)
+
+    def remove(self, doc_id: int):
+        """移除一条文本"""
+        norm = self._docs.pop(doc_id, None)
+        if norm is None:
+            return
+        for table, keys in ((self._ngrams, grams(norm, self.n)), (self._chars, set(norm))):
+            for key in keys:
+                postings = table.get(key)
+                if postings is None:
+                    continue
+                i = bisect_left(postings, doc_id)
+                if i < len(postings) and postings[i] == doc_id:
+                    del postings[i]
+                if not postings:
+                    del table[key]
+
+    def _postings(self, query: str) -> Optional[array]:
+        """查询串所有 n 元组 (短于 n 时为单字) 中最短的倒排表；None 表示不限 (空查询)"""
+        if not query:
+            return None
+        table, keys = ((self._chars, set(query)) if len(query) < self.n
+                       else (self._ngrams, grams(query, self.n)))
+        shortest = None
+        for gram in keys:
+            postings = table.get(gram)
+            if not postings:
+                return array("I")
+            if shortest is None or len(postings) < len(shortest):
+                shortest = postings
+        return shortest
+
+    def iter_matches(self, query: str) -> Iterator[int]:
+        """按编号升序产出规范化文本包含 query 的编号"""
+        query = normalize(query)
+        postings = self._postings(query)
+        if postings is None:
+            yield from sorted(self._docs)
+            return
+        if len(query) == 1 or len(query) == self.n:
+            yield from postings  # 单字/n 元组命中即子串命中，无需校验
+            return
+        docs = self._docs
+        for doc_id in postings:
+            if query in docs[doc_id]:
+                yield doc_id
+
+    def search(self, query: str) -> list[int]:
+        """返回规范化文本包含 query 的全部编号 (升序)"""
+        return list(self.iter_matches(query))
+
+    def postings(self, gram: str) -> array:
+        """某个 n 元组的倒排表 (只读)"""
+        return self._ngrams.get(gram, array("I"))
+
+    def first(self, query: str) -> Optional[int]:
+        """编号最小的命中 (编号按字母序分配时即字母序第一个)"""
+        return next(self.iter_matches(query), None)
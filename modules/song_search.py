@@ -0,0 +1,324 @@
+"""
+点歌模糊搜索 - 多形式匹配 + 排序
+
+观众会发「点歌 qingtian」「点歌 qt」「点歌 睛天」(错字)、全角字母或繁体歌名，
+原来的子串搜索只认大小写不敏感的原文，且返回字母序第一首而不是最匹配的一首。
+
+建索引时为每首歌预先计算一次检索形式 (SearchKeys):
+  text      NFKC 规范化 (全角→半角) + 小写 + 繁→简 (需要 zhconv，可选)
+  pinyin    全拼 (需要 pypinyin，可选)，拉丁字符原样保留，去掉空白和标点
+  initials  拼音首字母 + 英文单词首字母
+中文查询同样转成全拼与 pinyin 比较，同音错字 (情天/晴天) 也能命中。
+
+每种形式各建一个 n 元组倒排索引 (search_index.NgramIndex)。查询时:
+  1. 各形式的前缀命中 (按检索形式排序的数组上二分查找，完全相同者最先)
+     和子串命中作为候选 (每种形式至多 _PREFIX_CANDIDATES / _CANDIDATES 个)
+  2. 没有任何子串命中时，按 n 元组投票选出近似候选 (跳过过于常见的 n 元组)
+  3. 候选逐一打分: 完全相同 > 前缀 > 子串 > 有界编辑距离 > n 元组重合度
+  4. 取前 k 个，同分按歌名字母序
+
+查询只涉及少量候选的字符串比较，十万首歌曲库下单次查询中位数在 1ms 以内。
+"""
+
+import heapq
+import logging
+import unicodedata
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from .search_index import NgramIndex, grams
+
+log = logging.getLogger("songs")
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+    log.warning("pypinyin 未安装，点歌搜索不支持拼音/首字母 (pip install pypinyin)")
+
+try:
+    import zhconv
+except ImportError:
+    zhconv = None
+
+# 检索形式的版本: 计算方式或可选依赖变化时，持久化的检索形式失效
+KEYS_VERSION = f"1:{'pinyin' if lazy_pinyin else '-'}:{'zhconv' if zhconv else '-'}"
+
+# 每种形式取用的前缀/子串命中候选上限
+_PREFIX_CANDIDATES = 16
+_CANDIDATES = 64
+# 近似匹配: 参与投票的倒排表长度上限 (更常见的 n 元组区分度太低) / 候选上限
+_VOTE_POSTINGS = 1000
+_FUZZY_CANDIDATES = 32
+
+# 各形式的分数权重: 原文 > 全拼 > 首字母
+_WEIGHTS = (1.0, 0.98, 0.9)
+
+
+@dataclass(frozen=True)
+class SearchKeys:
+    """一首歌预先计算的检索形式"""
+    text: str
+    pinyin: str
+    initials: str
+
+
+def fold(text: str) -> str:
+    """规范化: 全角→半角、小写、繁→简"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    if zhconv is not None:
+        text = zhconv.convert(text, "zh-cn")
+    return text
+
+
+def _is_han(ch: str) -> bool:
+    return "一" <= ch <= "鿿" or "㐀" <= ch <= "䶿"
+
+
+def _syllables(text: str) -> list[str]:
+    """规范化文本 → 音节/单词列表 (汉字转拼音，拉丁单词原样，丢弃空白和标点)"""
+    syllables: list[str] = []
+    run = ""
+    word = ""
+
+    def flush_han():
+        nonlocal run
+        if run:
+            syllables.extend(lazy_pinyin(run) if lazy_pinyin else list(run))
+            run = ""
+
+    def flush_word():
+        nonlocal word
+        if word:
+            syllables.append(word)
+            word = ""
+
+    for ch in text:
+        if _is_han(ch):
+            flush_word()
+            run += ch
+        elif ch.isalnum():
+            flush_han()
+            word += ch
+        else:
+            flush_han()
+            flush_word()
+    flush_han()
+    flush_word()
+    return syllables
+
+
+def derive_keys(name: str) -> SearchKeys:
+    """计算歌名的全部检索形式"""
+    text = fold(name)
+    syllables = _syllables(text)
+    return SearchKeys(
+        text=text,
+        pinyin="".join(syllables),
+        initials="".join(s[0] for s in syllables),
+    )
+
+
+def _substring_distance(query: str, text: str, limit: int) -> int:
+    """query 与 text 中任一子串的最小编辑距离 (相邻交换算一次)
+
+    Hyyrö 的位并行算法 (Myers 算法加上相邻交换项): 每个 text 字符
+    只做常数次整数位运算，不必逐格动态规划。超过 limit 时返回 limit + 1。
+    """
+    m = len(query)
+    peq: dict[str, int] = {}
+    for i, ch in enumerate(query):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    full = (1 << m) - 1
+    high = 1 << (m - 1)
+    vp, vn, score = full, 0, m
+    best = m
+    d0 = prev_eq = 0
+    for ch in text:
+        eq = peq.get(ch, 0)
+        tc = (((~d0 & eq) << 1) & prev_eq)  # 相邻交换
+        d0 = ((((eq & vp) + vp) ^ vp) | eq | vn | tc) & full
+        hp = vn | (~(d0 | vp) & full)
+        hn = vp & d0
+        if hp & high:
+            score += 1
+        elif hn & high:
+            score -= 1
+        hp = (hp << 1) & full  # 子串搜索: 首行恒为 0，不移入 1
+        hn = (hn << 1) & full
+        vp = hn | (~(d0 | hp) & full)
+        vn = hp & d0
+        prev_eq = eq
+        if score < best:
+            best = score
+    return min(best, limit + 1)
+
+
+def _max_distance(query: str) -> int:
+    """允许的编辑距离: 短查询不做近似匹配 (汉字信息量大，两个字即可容错一个)"""
+    if len(query) < (2 if any(_is_han(ch) for ch in query) else 3):
+        return 0
+    return 1 if len(query) < 6 else 2
+
+
+def score_form(query: str, text: str, fuzzy: bool = True) -> float:
+    """单一形式的匹配分数 (0 为不匹配，满分 100)"""
+    if not query or not text:
+        return 0.0
+    if text == query:
+        return 100.0
+    coverage = len(query) / len(text)
+    if text.startswith(query):
+        return 80.0 + 10.0 * coverage
+    pos = text.find(query)
+    if pos >= 0:
+        return 60.0 + 10.0 * coverage - min(pos, 10) * 0.2
+    if not fuzzy:
+        return 0.0
+    limit = _max_distance(query)
+    # 查询中有超过 limit 种字符不在 text 中时，编辑距离必然超限
+    if limit and len(set(query).difference(text)) <= limit:
+        d = _substring_distance(query, text, limit)
+        if d <= limit:
+            return 50.0 - 15.0 * d - 5.0 * (1 - min(coverage, 1.0))
+    # n 元组重合度 (词序打乱、多打/漏打若干字)；查询只占长歌名一小部分时不算
+    qg = grams(query)
+    if len(qg) >= 2 and coverage >= 0.3:
+        overlap = len(qg & grams(text)) / len(qg)
+        if overlap >= 0.6:
+            return 30.0 * overlap
+    return 0.0
+
+
+class SongSearch:
+    """歌名排序搜索引擎
+
+    编号由调用方分配 (SongManager 全量建索引时按字母序分配，
+    增量加入的歌曲编号递增)，同分时编号小者优先。
+    """
+
+    def __init__(self, names: Iterable[str] = (), keys: Optional[list[SearchKeys]] = None):
+        if keys is None:
+            keys = [derive_keys(name) for name in names]
+        self._keys: dict[int, SearchKeys] = dict(enumerate(keys))
+        # 批量构建 (编号递增，倒排表直接追加)
+        self._text = NgramIndex(k.text for k in keys)
+        self._pinyin = NgramIndex((k.pinyin for k in keys), n=3)
+        self._initials = NgramIndex(k.initials for k in keys)
+        # 前缀查找: 每种形式一份按 (形式, 编号) 排序的数组
+        self._sorted: list[list[tuple[str, int]]] = [
+            sorted((key, doc_id) for doc_id, key in enumerate(form)) for form in
+            ([k.text for k in keys], [k.pinyin for k in keys], [k.initials for k in keys])
+        ]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def keys(self, doc_id: int) -> Optional[SearchKeys]:
+        return self._keys.get(doc_id)
+
+    def add(self, doc_id: int, name: str, keys: Optional[SearchKeys] = None):
+        """加入一首歌 (keys 为预先计算的检索形式，None 时现场计算)"""
+        keys = keys or derive_keys(name)
+        self._index_keys(doc_id, keys)
+        for form, key in enumerate((keys.text, keys.pinyin, keys.initials)):
+            insort(self._sorted[form], (key, doc_id))
+
+    def _index_keys(self, doc_id: int, keys: SearchKeys):
+        self._keys[doc_id] = keys
+        self._text.add(doc_id, keys.text)
+        self._pinyin.add(doc_id, keys.pinyin)
+        self._initials.add(doc_id, keys.initials)
+
+    def remove(self, doc_id: int):
+        keys = self._keys.pop(doc_id, None)
+        if keys is None:
+            return
+        for index in (self._text, self._pinyin, self._initials):
+            index.remove(doc_id)
+        for form, key in enumerate((keys.text, keys.pinyin, keys.initials)):
+            entries = self._sorted[form]
+            i = bisect_left(entries, (key, doc_id))
+            if i < len(entries) and entries[i] == (key, doc_id):
+                del entries[i]
+
+    def _prefix_matches(self, form: int, query: str) -> list[int]:
+        """以 query 开头的前 _PREFIX_CANDIDATES 个 (完全相同者在最前)"""
+        entries = self._sorted[form]
+        result = []
+        for i in range(bisect_left(entries, (query, -1)), len(entries)):
+            key, doc_id = entries[i]
+            if not key.startswith(query) or len(result) >= _PREFIX_CANDIDATES:
+                break
+            result.append(doc_id)
+        return result
+
+    def _forms(self, query: str) -> list[tuple[NgramIndex, str, int]]:
+        """查询在各形式下的 (索引, 查询串, 形式序号)"""
+        forms = [(self._text, query, 0)]
+        compact = "".join(ch for ch in query if ch.isalnum())
+        if compact.isascii() and compact:
+            forms.append((self._pinyin, compact, 1))
+            if len(compact) >= 2:
+                forms.append((self._initials, compact, 2))
+        elif lazy_pinyin is not None:
+            forms.append((self._pinyin, "".join(_syllables(query)), 1))
+        return forms
+
+    def _score(self, doc_id: int, forms: list, fuzzy: bool) -> float:
+        keys = self._keys[doc_id]
+        best = 0.0
+        for _, query, form in forms:
+            text = (keys.text, keys.pinyin, keys.initials)[form]
+            score = score_form(query, text, fuzzy and form != 2) * _WEIGHTS[form]
+            if score > best:
+                best = score
+        return best
+
+    def _fuzzy_candidates(self, forms: list) -> list[int]:
+        """n 元组投票: 与查询共享 n 元组最多的候选"""
+        votes: dict[int, int] = {}
+        limit = max(_VOTE_POSTINGS, len(self._keys) // 50)
+        for index, query, form in forms:
+            if form == 2:
+                continue
+            for gram in grams(query, index.n):
+                postings = index.postings(gram)
+                if len(postings) > limit:
+                    continue
+                for doc_id in postings:
+                    votes[doc_id] = votes.get(doc_id, 0) + 1
+        # 票数相同时优先拼音长度接近查询的 (长歌名天然共享更多 n 元组)
+        target = max(len(query) for _, query, form in forms if form != 2)
+        keys = self._keys
+        return heapq.nlargest(_FUZZY_CANDIDATES, votes, key=lambda d: (
+            votes[d], -abs(len(keys[d].pinyin) - target)))
+
+    def top(self, query: str, k: int = 5) -> list[tuple[float, int]]:
+        """返回 [(分数, 编号), ...]，按分数降序，至多 k 个"""
+        query = fold(query).strip()
+        if not query:
+            return [(0.0, doc_id) for doc_id in sorted(self._keys)[:k]]
+        forms = self._forms(query)
+
+        candidates: set[int] = set()
+        for index, q, form in forms:
+            candidates.update(self._prefix_matches(form, q))
+            if form != 0 and len(q) < index.n:
+                continue  # 短于 n 元组的拼音/首字母子串区分度太低，只看前缀
+            # 原文形式的单字查询由 NgramIndex 按单字倒排表匹配
+            for i, doc_id in enumerate(index.iter_matches(q)):
+                if i >= _CANDIDATES:
+                    break
+                candidates.add(doc_id)
+        scored = [(self._score(doc_id, forms, False), doc_id) for doc_id in candidates]
+
+        if not scored:
+            for doc_id in self._fuzzy_candidates(forms):
+                score = self._score(doc_id, forms, True)
+                if score > 0:
+                    scored.append((score, doc_id))
+
+        ranked = heapq.nsmallest(k, ((-score, doc_id) for score, doc_id in scored if score > 0))
+        return [(-neg, doc_id) for neg, doc_id in ranked]
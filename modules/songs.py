@@ -1,96 +1,391 @@
 """
 歌曲搜索与队列管理
+
+面板每帧都要读正在播放/队列/总数。这些状态在每次修改时 (锁内) 发布为
+一份不可变的 SongSnapshot 并整体替换引用，读取方直接拿当前快照，
+无需加锁、无需复制；快照带递增的版本号，版本相同即内容未变。
 """
 
 import os
-import glob
 import threading
-from typing import Optional
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from .index_store import IndexStore
+from .metadata import MetadataService
+from .request_queue import QueueResult, RequestQueue
+from .scanner import SONG_EXTENSIONS, FileEntry, Scanner, suffix_of
+from .song_search import SearchKeys, SongSearch, derive_keys, fold
+from .state_journal import StateJournal
+from .text_output import TextOutputs
+
+
+# 快照中保留的歌曲库开头歌名数 (list_songs 小 limit 时不必复制整个歌名表)
+SNAPSHOT_HEAD = 8
+
+
+@dataclass(frozen=True)
+class SongSnapshot:
+    """歌曲库对外可见状态的不可变快照"""
+    version: int
+    now_playing: str
+    total: int
+    head: tuple[str, ...]  # 按歌名排序的前 SNAPSHOT_HEAD 首
+    queue: tuple[tuple[str, str], ...]  # 按播放顺序的 (name, filepath)
+
+
+class QueryCache:
+    """搜索结果 LRU 缓存 (含未找到的空结果)
+
+    每条记录带上写入时的索引代数，索引变化 (全量重建或增量更新) 后代数
+    加一，旧记录在下次命中时作废。非线程安全，由 SongManager 在锁内使用。
+    """
+
+    def __init__(self, capacity: int = 512):
+        self.capacity = capacity
+        self._entries: OrderedDict[tuple[str, int], tuple[int, list]] = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0  # 命中的是 "未找到"
+        self.misses = 0
+        self.stale = 0  # 因索引变化作废的记录
+
+    def get(self, key: tuple[str, int], generation: int) -> Optional[list]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if not entry[1]:
+                    self.negative_hits += 1
+                return entry[1]
+            del self._entries[key]
+            self.stale += 1
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple[str, int], generation: int, results: list):
+        if self.capacity <= 0:
+            return
+        self._entries[key] = (generation, results)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
 
 
 class SongManager:
     """歌曲库索引 + 队列管理"""
 
-    EXTENSIONS = ("*.mp4", "*.mp3", "*.flv", "*.mkv", "*.wav")
+    EXTENSIONS = SONG_EXTENSIONS
 
-    def __init__(self, song_dir: str, data_dir: str):
+    def __init__(self, song_dir: str, data_dir: str, store: Optional[IndexStore] = None,
+                 scanner: Optional[Scanner] = None, metadata: Optional[MetadataService] = None,
+                 cache_size: int = 512, queue: Optional[RequestQueue] = None,
+                 outputs: Optional[TextOutputs] = None, journal: Optional[StateJournal] = None):
         self.song_dir = song_dir
         self.data_dir = data_dir
-        self._index: list[tuple[str, str]] = []  # [(name, filepath), ...]
-        self._queue: list[str] = []  # [filepath, ...]
+        self.store = store  # 持久化索引 (None 时每次全量扫描)
+        self.scanner = scanner or Scanner()
+        self.metadata = metadata  # 时长等元数据 (None 时时长一律未知)
+        self.outputs = outputs or TextOutputs(data_dir)  # now_playing.txt 等 OBS 文本源
+        self.journal = journal  # 队列变化写入状态日志 (None 时不持久化)
+        self.index_stats: dict = {}
+        self._index: list[tuple[str, str]] = []  # [(name, filepath), ...] 按歌名排序
+        # 搜索编号 → (name, filepath)。全量建索引时按字母序分配，
+        # 增量加入的歌曲编号递增 (同分时排在后面，下次全量重扫后恢复字母序)
+        self._songs: dict[int, tuple[str, str]] = {}
+        self._ids: dict[str, int] = {}  # 绝对路径 → 搜索编号
+        self._next_id = 0
+        self._search = SongSearch()
+        self._generation = 0  # 索引代数: 每次索引变化加一，搜索缓存据此作废
+        self._cache = QueryCache(cache_size)
+        self._queue = queue if queue is not None else RequestQueue()  # 出队内容为 (name, filepath)
         self._now_playing: str = "等待播放..."
         self._lock = threading.Lock()
+        self._snapshot = SongSnapshot(0, self._now_playing, 0, (), ())
         self.build_index()
 
+    def _publish(self):
+        """发布新快照 (调用方持有锁)"""
+        self._snapshot = SongSnapshot(
+            version=self._snapshot.version + 1,
+            now_playing=self._now_playing,
+            total=len(self._index),
+            head=tuple(name for name, _ in self._index[:SNAPSHOT_HEAD]),
+            queue=tuple(self._queue.items()),
+        )
+
+    @property
+    def snapshot(self) -> SongSnapshot:
+        """当前快照 (无锁读取，内容不可变)"""
+        return self._snapshot
+
+    def matches(self, filename: str) -> bool:
+        """文件名是否为歌曲库收录的格式"""
+        return suffix_of(filename) in self.EXTENSIONS
+
     def build_index(self):
-        """扫描歌曲目录, 构建索引"""
-        index = []
-        for ext in self.EXTENSIONS:
-            for f in glob.glob(os.path.join(self.song_dir, ext)):
-                name = os.path.splitext(os.path.basename(f))[0]
-                index.append((name, f))
+        """扫描歌曲目录 (含子目录), 构建索引
+
+        边扫描边取检索形式: 有持久化索引时目录未变则不列目录，
+        检索形式只为新歌名计算；扫描超时的目录沿用上次的记录。
+        """
+        t0 = time.perf_counter()
+        root = os.path.abspath(self.song_dir)
+        store = self.store
+        lister = store.lister("songs") if store is not None else None
+        listings = []
+        found: list[FileEntry] = []
+        index: list[tuple[str, str]] = []
+        keys: dict[str, SearchKeys] = {}
+        derived: dict[str, SearchKeys] = {}
+        for listing in self.scanner.walk(root, self.matches, recursive=True, lister=lister):
+            listings.append(listing)
+            files = listing.files
+            if listing.timed_out and store is not None:
+                files = store.fallback("songs", listing.path)
+            found.extend(files)
+            entries = [(os.path.splitext(f.name)[0], f.path) for f in files]
+            index.extend(entries)
+            if store is not None:
+                keys.update(store.load_keys(name for name, _ in entries if name not in keys))
+            for name, _ in entries:
+                if name not in keys:
+                    keys[name] = derived[name] = derive_keys(name)
+        index.sort()
+        names = [name for name, _ in index]
+
+        rescanned = True
+        if store is not None:
+            scan = store.record("songs", root, listings)
+            rescanned = scan.rescanned
+            if derived or rescanned:
+                store.save_keys(derived, prune=names)
+        search = SongSearch(names, keys=[keys[name] for name in names])
         with self._lock:
-            self._index = sorted(index, key=lambda x: x[0])
+            self._index = index
+            self._songs = dict(enumerate(index))
+            self._ids = {os.path.abspath(path): i for i, (_, path) in enumerate(index)}
+            self._next_id = len(index)
+            self._search = search
+            self._generation += 1
+            self._publish()
+        if self.metadata is not None:
+            self.metadata.request(found)
+
+        self.index_stats = {
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000),
+            "warm": store is not None and not rescanned and not derived,
+            "rescanned": rescanned,
+            "keys_derived": len(derived),
+            "dirs": len(listings),
+            "timed_out": sum(1 for listing in listings if listing.timed_out),
+        }
+
+    def apply_changes(self, added: Iterable[str], removed: Iterable[str]) -> tuple[int, int]:
+        """增量更新索引 (目录监视): added / removed 为文件路径
+
+        Returns:
+            (新增首数, 移除首数)
+        """
+        with self._lock:
+            fresh = {os.path.abspath(p) for p in added
+                     if self.matches(os.path.basename(p))} - self._ids.keys()
+        names = {path: os.path.splitext(os.path.basename(path))[0] for path in fresh}
+        # 检索形式在锁外计算 (批量新增时 pypinyin 较慢)
+        keys = self.store.load_keys(names.values()) if self.store is not None else {}
+        derived = {name: derive_keys(name) for name in set(names.values()) if name not in keys}
+        if self.store is not None and derived:
+            self.store.save_keys(derived)
+        keys.update(derived)
+
+        added_count = removed_count = 0
+        with self._lock:
+            for path in removed:
+                doc_id = self._ids.pop(os.path.abspath(path), None)
+                if doc_id is None:
+                    continue
+                entry = self._songs.pop(doc_id)
+                self._search.remove(doc_id)
+                i = bisect_left(self._index, entry)
+                if i < len(self._index) and self._index[i] == entry:
+                    del self._index[i]
+                removed_count += 1
+            for path, name in sorted(names.items()):
+                if path in self._ids:
+                    continue
+                doc_id = self._next_id
+                self._next_id += 1
+                self._songs[doc_id] = (name, path)
+                self._ids[path] = doc_id
+                self._search.add(doc_id, name, keys[name])
+                insort(self._index, (name, path))
+                added_count += 1
+            if added_count or removed_count:
+                self._generation += 1
+                self._publish()
+        if self.metadata is not None and names:
+            self.metadata.request(list(names))
+        return added_count, removed_count
 
     def search(self, keyword: str) -> Optional[tuple[str, str]]:
-        """模糊搜索歌曲, 返回 (歌名, 文件路径) 或 None"""
-        keyword_lower = keyword.lower()
+        """模糊搜索歌曲, 返回最匹配的 (歌名, 文件路径) 或 None"""
+        results = self.search_top(keyword, 1)
+        return results[0] if results else None
+
+    def search_top(self, keyword: str, k: int = 5) -> list[tuple[str, str]]:
+        """模糊搜索歌曲, 按匹配度返回至多 k 首 [(歌名, 文件路径), ...]
+
+        支持全角/繁体、拼音 (qingtian)、拼音首字母 (qt) 和少量错字，
+        同分时按歌名字母序。结果按规范化后的关键词缓存 (含未找到)。
+        """
+        key = (fold(keyword).strip(), k)
         with self._lock:
-            for name, path in self._index:
-                if keyword_lower in name.lower():
-                    return name, path
-        return None
+            results = self._cache.get(key, self._generation)
+            if results is None:
+                results = [self._songs[doc_id] for _, doc_id in self._search.top(keyword, k)]
+                self._cache.put(key, self._generation, results)
+            return list(results)
+
+    @property
+    def search_cache_stats(self) -> dict:
+        """搜索缓存命中统计"""
+        with self._lock:
+            return self._cache.stats
 
     def list_songs(self, limit: int = 0) -> list[str]:
-        """返回所有歌曲名列表"""
+        """返回所有歌曲名列表 (按歌名排序，limit > 0 时至多 limit 首)"""
+        snapshot = self._snapshot
+        if 0 < limit <= len(snapshot.head) or snapshot.total <= len(snapshot.head):
+            return list(snapshot.head[:limit] if limit > 0 else snapshot.head)
         with self._lock:
-            names = [name for name, _ in self._index]
-        return names[:limit] if limit > 0 else names
+            index = self._index[:limit] if limit > 0 else self._index
+            return [name for name, _ in index]
 
     @property
     def total(self) -> int:
-        with self._lock:
-            return len(self._index)
+        return self._snapshot.total
+
+    # --- 元数据 ---
+
+    def duration(self, filepath: str) -> Optional[float]:
+        """歌曲时长 (秒)，尚未解析或解析失败时为 None"""
+        return self.metadata.duration(filepath) if self.metadata is not None else None
+
+    def queue_duration(self, snapshot: Optional[SongSnapshot] = None) -> Optional[float]:
+        """队列中歌曲的总时长 (秒)；有任何一首时长未知时为 None
+
+        Args:
+            snapshot: 按指定快照中的队列计算 (默认当前快照)
+        """
+        total = 0.0
+        for _, path in (snapshot or self._snapshot).queue:
+            seconds = self.duration(path)
+            if seconds is None:
+                return None
+            total += seconds
+        return total
 
     # --- 队列管理 ---
 
-    def queue_add(self, filepath: str, name: str):
+    def queue_add(self, filepath: str, name: str, uid: Optional[int] = None) -> QueueResult:
+        """加入点歌队列 (同一首歌不重复排队，按点歌人轮转)
+
+        Returns:
+            入队结果与排队位置
+        """
+        key = os.path.abspath(filepath)
         with self._lock:
-            self._queue.append((name, filepath))
+            result = self._queue.push(key, (name, filepath), uid)
+            if result.added:
+                self._publish()
+        if result.added and self.journal is not None:
+            self.journal.record("push", q="songs", key=key, item=[name, filepath], uid=uid)
+        if result.added and self.metadata is not None:
+            # 入队的歌优先解析 (面板显示队列时长)
+            self.metadata.request([filepath], priority=True)
+        return result
 
     def queue_pop(self) -> Optional[tuple[str, str]]:
         with self._lock:
-            return self._queue.pop(0) if self._queue else None
+            item = self._queue.pop()
+            if item is not None:
+                self._publish()
+        if item is not None and self.journal is not None:
+            self.journal.record("pop", q="songs", key=os.path.abspath(item[1]))
+        return item
 
-    def queue_list(self) -> list[str]:
-        """返回队列中的歌名列表"""
+    def queue_restore(self, entries: dict) -> int:
+        """从状态日志恢复队列，已不存在 (或超出队列上限) 的歌曲丢弃
+
+        Args:
+            entries: {去重键: ([name, filepath], uid)}，按入队顺序
+
+        Returns:
+            恢复的数量
+        """
+        dropped = []
         with self._lock:
-            return [name for name, _ in self._queue]
+            for key, (item, uid) in entries.items():
+                name, filepath = item
+                if not (os.path.exists(filepath) and self._queue.push(key, (name, filepath), uid).added):
+                    dropped.append(key)
+            self._publish()
+        if self.journal is not None:
+            for key in dropped:
+                self.journal.record("pop", q="songs", key=key)
+        return len(entries) - len(dropped)
+
+    def queue_list(self, limit: int = 0) -> list[str]:
+        """返回队列中的歌名列表 (按播放顺序，limit > 0 时至多 limit 首)"""
+        queue = self._snapshot.queue
+        return [name for name, _ in (queue[:limit] if limit > 0 else queue)]
+
+    def queue_peek(self) -> Optional[tuple[str, str]]:
+        """队列中下一首 (name, filepath)，不出队"""
+        queue = self._snapshot.queue
+        return queue[0] if queue else None
+
+    def queue_position(self, filepath: str) -> int:
+        """歌曲的排队位置 (从 1 开始)，不在队列中时为 0"""
+        with self._lock:
+            return self._queue.position(os.path.abspath(filepath))
 
     def queue_clear(self):
         with self._lock:
             self._queue.clear()
+            self._publish()
+        if self.journal is not None:
+            self.journal.record("clear", q="songs")
 
     @property
     def queue_count(self) -> int:
-        with self._lock:
-            return len(self._queue)
+        return len(self._snapshot.queue)
 
     # --- 当前播放 ---
 
     @property
     def now_playing(self) -> str:
-        with self._lock:
-            return self._now_playing
+        return self._snapshot.now_playing
 
     @now_playing.setter
     def now_playing(self, value: str):
         with self._lock:
             self._now_playing = value
-        # 同时写入文件, 供 OBS 底部字幕等使用
-        try:
-            np_file = os.path.join(self.data_dir, "now_playing.txt")
-            with open(np_file, "w", encoding="utf-8") as f:
-                f.write(value)
-        except OSError:
-            pass
+            self._publish()
+        # 同时写入 now_playing.txt, 供 OBS 底部字幕等使用 (合并、原子替换)
+        self.outputs.set("now_playing", value)
@@ -0,0 +1,161 @@
+"""
+运行状态日志 - 崩溃/重启后恢复点歌队列、模式和各模式的播放进度
+
+点歌/点播队列、当前模式和 VLCController 保存的各模式播放状态原来只在内存中，
+程序崩溃或系统更新重启后观众的点歌全部丢失，各模式也只能从头播放。
+
+StateJournal 把这些变化作为一行一条的 JSON 记录追加到 data_dir/state.journal:
+
+  {"t": "mode", "mode": "music"}
+  {"t": "push", "q": "songs", "key": ..., "item": [...], "uid": ...}
+  {"t": "pop", "q": "songs", "key": ...}
+  {"t": "clear", "q": "songs"}
+  {"t": "playback", "mode": "video", "source": ..., "playlist": ..., "current": ..., "cursor": ...}
+
+record 只把记录放进内存中的待写列表 (点歌等命令路径不等待磁盘)，后台任务
+(CoalescingWriter) 合并一段时间内的记录，在线程池中一次追加并 fsync。同时在内存中维护折叠后的
+当前状态，记录数超过阈值时把它写成新文件原子替换旧日志 (压缩)。
+
+启动时 load 读取日志 (忽略崩溃时写了一半的末行) 并立即压缩一次。
+"""
+
+import copy
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Optional
+
+from .coalescing import CoalescingWriter
+from .panel_output import write_atomic
+
+log = logging.getLogger("journal")
+
+
+@dataclass
+class JournalState:
+    """日志折叠后的状态"""
+    mode: Optional[str] = None
+    # 队列名 → {去重键: (item, uid)}，按入队顺序
+    queues: dict[str, dict[Hashable, tuple[list, Optional[int]]]] = field(default_factory=dict)
+    # 模式键 → playback 记录
+    playback: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    def apply(self, record: dict):
+        kind = record.get("t")
+        if kind == "mode":
+            self.mode = record["mode"]
+        elif kind == "push":
+            self.queues.setdefault(record["q"], {})[record["key"]] = (record["item"], record.get("uid"))
+        elif kind == "pop":
+            self.queues.get(record["q"], {}).pop(record["key"], None)
+        elif kind == "clear":
+            self.queues[record["q"]] = {}
+        elif kind == "playback":
+            self.playback[record["mode"]] = record
+
+    def records(self) -> list[dict]:
+        """重建该状态所需的最少记录 (压缩)"""
+        records: list[dict] = []
+        if self.mode is not None:
+            records.append({"t": "mode", "mode": self.mode})
+        for name, entries in self.queues.items():
+            for key, (item, uid) in entries.items():
+                records.append({"t": "push", "q": name, "key": key, "item": item, "uid": uid})
+        records.extend(self.playback.values())
+        return records
+
+
+class StateJournal(CoalescingWriter):
+    """追加写 + 定期压缩的状态日志 (record 线程安全)"""
+
+    def __init__(self, path: str, delay: float = 0.5, compact_every: int = 1000):
+        """
+        Args:
+            path: 日志文件路径
+            delay: 收到记录后等待的秒数，期间的后续记录合并为一次写入
+            compact_every: 追加的记录数超过此值时压缩
+        """
+        super().__init__(delay)
+        self.path = path
+        self.compact_every = max(1, compact_every)
+        self.stats = {"records": 0, "writes": 0, "compactions": 0}
+        self.state = JournalState()
+        self._pending: list[dict] = []
+        self._appended = 0  # 上次压缩后追加的记录数
+
+    def load(self) -> JournalState:
+        """读取日志并压缩，返回上次运行结束时的状态"""
+        count = 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.state.apply(record)
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        log.warning(f"忽略损坏的状态记录: {line.strip()[:80]}")
+                        continue
+                    count += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning(f"读取状态日志失败: {self.path} ({e})")
+        if count:
+            queued = sum(len(entries) for entries in self.state.queues.values())
+            log.info(f"状态日志: {count} 条记录 → 模式 {self.state.mode}, 队列 {queued} 项, "
+                     f"播放状态 {len(self.state.playback)} 个")
+        with self._io_lock:
+            self._compact()
+        with self._lock:
+            return copy.deepcopy(self.state)
+
+    def record(self, kind: str, **fields):
+        """追加一条记录 (不等待写盘)"""
+        record = {"t": kind, **fields}
+        with self._lock:
+            self.state.apply(record)
+            self._pending.append(record)
+            self.stats["records"] += 1
+        self._notify()
+
+    def _take_pending(self) -> list[dict]:
+        pending, self._pending = self._pending, []
+        return pending
+
+    def _write_pending(self, pending: list[dict]):
+        """追加待写记录并 fsync (记录数超过阈值时改为压缩)"""
+        if self._appended + len(pending) > self.compact_every:
+            self._compact()
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in pending)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            log.warning(f"写入状态日志失败: {e}")
+            return
+        self._appended += len(pending)
+        self.stats["writes"] += 1
+
+    def _compact(self):
+        """把当前状态写成新日志并原子替换 (调用方持有 _io_lock)"""
+        with self._lock:
+            # 待写记录已反映在 state 中，一并写入快照
+            self._pending.clear()
+            records = self.state.records()
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        try:
+            write_atomic(self.path, data.encode("utf-8"), fsync=True)
+        except OSError as e:
+            log.warning(f"压缩状态日志失败: {e}")
+            return
+        self._appended = len(records)
+        self.stats["compactions"] += 1
+
+
+def open_journal(data_dir: str, filename: str = "state.journal", **kwargs) -> StateJournal:
+    """创建状态日志，文件放在 data_dir 下"""
+    return StateJournal(os.path.join(data_dir, filename), **kwargs)
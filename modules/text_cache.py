@@ -0,0 +1,138 @@
+"""
+面板文本位图缓存 - 有界 LRU
+
+面板上的歌名、队列条目、提示语在相邻帧之间几乎不变，
+每帧重新走 FreeType 光栅化是纯浪费。这里把光栅化结果缓存为
+"L" 模式的蒙版 (alpha 覆盖率)，绘制时直接 paste 上色即可。
+
+蒙版与颜色无关，颜色在 paste 时才应用，因此同一段文本
+不同颜色共用一份缓存。
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+# 默认内存上限 (字节): 约可容纳数千条 20px 高的文本行
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+# (蒙版, (x 偏移, y 偏移))；空白文本的蒙版为 None
+TextBitmap = tuple[Optional[Image.Image], tuple[int, int]]
+
+
+def rasterize_text(text: str, font: ImageFont.FreeTypeFont) -> TextBitmap:
+    """将文本光栅化为紧凑蒙版
+
+    偏移量是蒙版左上角相对于 draw.text 锚点 (左上, "la") 的位置，
+    paste 到 (x + dx, y + dy) 与 draw.text((x, y), ...) 结果一致。
+    """
+    left, top, right, bottom = font.getbbox(text)
+    if right <= left or bottom <= top:
+        return None, (0, 0)
+    mask = Image.new("L", (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font)
+    return mask, (left, top)
+
+
+def rasterize_runs(runs: list) -> TextBitmap:
+    """将多字体混排文本 [(片段, 字体), ...] 光栅化为一个蒙版
+
+    各片段按前进宽度依次排列，共用一条基线 (取各字体最大上升高度)，
+    偏移量含义与 rasterize_text 相同。单一字体时等价于 rasterize_text。
+    """
+    if not runs:
+        return None, (0, 0)
+    if len(runs) == 1:
+        return rasterize_text(*runs[0])
+
+    baseline = max(font.getmetrics()[0] for _, font in runs)
+    placed = []
+    pen = 0.0
+    left = top = float("inf")
+    right = bottom = float("-inf")
+    for text, font in runs:
+        l, t, r, b = font.getbbox(text, anchor="ls")
+        if r > l and b > t:
+            left, top = min(left, pen + l), min(top, baseline + t)
+            right, bottom = max(right, pen + r), max(bottom, baseline + b)
+        placed.append((pen, text, font))
+        pen += font.getlength(text)
+    if right <= left or bottom <= top:
+        return None, (0, 0)
+
+    left, top = math.floor(left), math.floor(top)
+    mask = Image.new("L", (math.ceil(right) - left, math.ceil(bottom) - top), 0)
+    draw = ImageDraw.Draw(mask)
+    for x, text, font in placed:
+        draw.text((x - left, baseline - top), text, fill=255, font=font, anchor="ls")
+    return mask, (left, top)
+
+
+class TextBitmapCache:
+    """文本蒙版 LRU 缓存，按蒙版字节数限制总内存"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, TextBitmap] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size_of(entry: TextBitmap) -> int:
+        mask = entry[0]
+        return mask.width * mask.height if mask is not None else 0
+
+    def get(self, key: Hashable) -> Optional[TextBitmap]:
+        """查找缓存，命中时标记为最近使用"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: TextBitmap) -> TextBitmap:
+        """写入缓存，超出内存上限时淘汰最久未使用的条目"""
+        size = self._size_of(entry)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._size_of(old)
+            # 单条超过上限的文本不缓存
+            if size > self.max_bytes:
+                return entry
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size_of(evicted)
+                self.evictions += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def stats(self) -> dict:
+        """命中/未命中/淘汰次数，以及当前条目数和内存占用"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
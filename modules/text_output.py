@@ -0,0 +1,80 @@
+"""
+OBS 文本源输出文件 (now_playing.txt / ticker.txt 等)
+
+now_playing.txt 原来在事件循环里同步写: SongManager.now_playing 的 setter
+写一次，VLCController 紧接着再写一次同样的内容，弹幕点歌后又设置一次；
+直接 open("w") 覆盖写，OBS 文本源恰好在截断后读取时会显示空白或半截歌名。
+
+TextOutputs 统一管理这些文件:
+  - 按名称记录最新内容，短时间内的多次更新只写最后一次
+  - 在线程池中写临时文件再 os.replace 原子替换 (与面板图片相同)
+  - 内容与上次写入 (或启动时文件中已有的内容) 相同则不写
+
+合并与后台写盘由 CoalescingWriter 完成，事件循环未运行时 set 直接同步写入。
+"""
+
+import logging
+import os
+
+from .coalescing import CoalescingWriter
+from .panel_output import write_atomic
+
+log = logging.getLogger("output")
+
+
+class TextOutputs(CoalescingWriter):
+    """按名称合并写入的文本输出 (set 线程安全)"""
+
+    def __init__(self, directory: str, delay: float = 0.2):
+        """
+        Args:
+            directory: 输出目录 (名称 name 对应文件 <directory>/<name>.txt)
+            delay: 收到更新后等待的秒数，期间的后续更新合并为一次写入
+        """
+        super().__init__(delay)
+        self.directory = directory
+        self.stats = {"writes": 0, "unchanged": 0, "coalesced": 0}
+        self._pending: dict[str, str] = {}
+        self._written: dict[str, str] = {}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".txt")
+
+    def set(self, name: str, text: str):
+        """更新输出内容 (不立即写盘)"""
+        with self._lock:
+            if name in self._pending:
+                self.stats["coalesced"] += 1
+            self._pending[name] = text
+        self._notify()
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def _take_pending(self) -> dict[str, str]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def _write_pending(self, pending: dict[str, str]):
+        for name, text in pending.items():
+            self._write(name, text)
+
+    def _write(self, name: str, text: str):
+        path = self.path(name)
+        if name not in self._written:
+            # 首次写入: 与文件中已有内容比较 (重启后歌名未变则不写)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._written[name] = f.read()
+            except (OSError, UnicodeDecodeError):
+                pass
+        if self._written.get(name) == text:
+            self.stats["unchanged"] += 1
+            return
+        try:
+            write_atomic(path, text.encode("utf-8"))
+        except OSError as e:
+            log.warning(f"写入 {path} 失败: {e}")
+            return
+        self._written[name] = text
+        self.stats["writes"] += 1
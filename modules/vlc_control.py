@@ -5,23 +5,46 @@ VLC 源播放控制器 - 通过 OBS WebSocket 管理 VLC 视频源
   - play(filepath): 点歌即时播放单个文件
   - play_directory(directory): 播放整个目录
   - next_song(): 切歌 (模式感知)
+  - handle_media_event(): OBS 报告点歌/点播播完时立即播放队列下一项
+  - watch_requests(): 媒体事件不可用时轮询源状态/按时长兜底切下一项
   - stop(): 停止播放
-  - transition_to_mode(old_key, new_key): 模式切换，保存/恢复状态
+  - transition_to_mode(old_key, new_key, media): 模式切换，保存/恢复状态 (含播放进度)
+  - restore_states(): 从状态日志恢复各模式的播放状态 (重启后从上次的位置继续)
+
+大目录 (录像目录可有上千个文件) 按窗口提交: 本地保存完整列表和窗口起点，
+只把接下来 window 个文件设为 VLC 源的播放列表，窗口最后一项播完时再提交
+下一个窗口。请求大小和 OBS 重新解析的列表长度与目录大小无关。
+
+A/B 双源模式 (OBS 配置了第二个 VLC 源) 下，点歌/点播队列的下一项预先
+加载在隐藏的备用源上；轮到它时互换两个源的可见性并播放，没有重新打开
+媒体的黑帧和断音。切换耗时写入日志。
 """
 
+import asyncio
 import logging
 import os
+import threading
+import time
+from bisect import bisect_left
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Awaitable, Callable, Iterable, Optional
 
 from .songs import SongManager
 from .replay import ReplayManager
-from .obs_control import OBSController, MEDIA_NEXT, MEDIA_STOP, MEDIA_RESTART
+from .obs_control import (OBSController, MediaStatus, MEDIA_ENDED, MEDIA_NEXT, MEDIA_RESTART,
+                          MEDIA_STARTED, MEDIA_STATE_ENDED, MEDIA_STATE_PLAYING, MEDIA_STOP)
+from .scanner import MEDIA_EXTENSIONS, Scanner, suffix_of
+from .state_journal import StateJournal
 
 log = logging.getLogger("vlc")
 
-# 支持的媒体文件扩展名
-MEDIA_EXTENSIONS = {'.mp3', '.mp4', '.mkv', '.avi', '.flv', '.m4a', '.aac', '.ogg', '.wav'}
+# 恢复进度: 距开头不足此值 (毫秒) 不跳转；距结尾不足此值则从头播放下一项
+SEEK_MIN_MS = 3000
+# 未订阅到媒体事件时，轮询源状态等待开始播放的次数和间隔 (秒)
+SEEK_POLL_TRIES = 10
+SEEK_POLL_INTERVAL = 0.2
+# 没有媒体事件且时长未知时，点歌/点播播放多久 (秒) 后视为播完
+REQUEST_TIMEOUT = 15 * 60
 
 
 @dataclass
@@ -29,6 +52,8 @@ class ModeVLCState:
     """某个模式的 VLC 播放状态快照"""
     playlist: list[str] = field(default_factory=list)
     current_file: Optional[str] = None
+    cursor: Optional[int] = None  # current_file 的播放进度 (毫秒)
+    source: Optional[str] = None  # 播放列表来自的目录 (状态日志只记目录，恢复时重新取列表)
 
 
 class VLCController:
@@ -41,7 +66,8 @@ class VLCController:
     def __init__(self, obs: OBSController, song_manager: SongManager,
                  replay_manager: ReplayManager,
                  playback_dir: str, song_dir: str, replay_dir: str,
-                 data_dir: str):
+                 data_dir: str, scanner: Optional[Scanner] = None, window: int = 0,
+                 journal: Optional[StateJournal] = None):
         """
         Args:
             obs: OBS WebSocket 控制器
@@ -51,6 +77,9 @@ class VLCController:
             song_dir: 歌曲目录
             replay_dir: 录播目录 (回放模式)
             data_dir: 运行时数据目录
+            scanner: 目录扫描器 (与歌曲库/录播共用)
+            window: 每次提交给 VLC 源的文件数 (0 表示整个列表一次提交)
+            journal: 状态日志 (保存的各模式播放状态写入其中，None 时不持久化)
         """
         self.obs = obs
         self.songs = song_manager
@@ -59,11 +88,36 @@ class VLCController:
         self.song_dir = song_dir
         self.replay_dir = replay_dir
         self.data_dir = data_dir
+        self.scanner = scanner or Scanner()
+        self.window = max(0, window)
+        self.journal = journal
+        # 点歌队列播完时调用 (由模式管理器切回之前的模式)，None 时自行恢复录像
+        self.on_song_queue_empty: Optional[Callable[[], Awaitable[object]]] = None
 
         self._current_song_request: Optional[str] = None
         self._current_replay_request: Optional[str] = None
         self._current_mode: Optional[str] = None
+        # 当前点歌/点播开始播放的时间 (time.monotonic)，媒体事件不可用时据此判断播完
+        self._request_started = 0.0
+        # 完整播放列表 (只整体替换，不原地修改) 及已提交窗口在其中的起点和长度
         self._playback_files: list[str] = []
+        self._playlist_source: Optional[str] = None  # 目录播放时为该目录
+        self._window_start = 0
+        self._window_size = 0
+        # 当前播放列表已开始播放: 之后的 ended 才是播完 (更换列表/停止时也会收到 ended)
+        self._media_started = False
+        # 当前播放到列表中的第几项 (按 started 事件计数，-1 表示尚未开始)
+        self._playlist_index = -1
+        # 恢复模式状态后，列表第一项开始播放时跳转到的进度 (毫秒)
+        self._pending_seek: Optional[int] = None
+        # A/B 模式下已预加载在备用源上的文件
+        self._staged: Optional[str] = None
+        self._advance_lock = asyncio.Lock()
+
+        # 被监视目录的媒体文件列表 (有序)，首次播放时遍历一次，之后由目录监视
+        # 增量维护，播放时不再遍历 (None 表示已监视但尚未遍历)
+        self._dir_cache: dict[str, Optional[list[str]]] = {}
+        self._cache_lock = threading.Lock()
 
         # 各模式的播放状态快照
         self._mode_states: dict[str, ModeVLCState] = {}
@@ -77,28 +131,162 @@ class VLCController:
         """清理资源"""
         pass
 
+    @staticmethod
+    def is_media(filename: str) -> bool:
+        return suffix_of(filename) in MEDIA_EXTENSIONS
+
     def _scan_directory(self, directory: str) -> list[str]:
-        """扫描目录中的媒体文件"""
+        """目录中的媒体文件 (被监视的目录直接用缓存的列表)"""
+        key = os.path.abspath(directory) if directory else ""
+        with self._cache_lock:
+            watched = key in self._dir_cache
+            cached = self._dir_cache.get(key)
+            if cached is not None:
+                return list(cached)
+        if watched:
+            self.refresh_directory(directory)
+            with self._cache_lock:
+                return list(self._dir_cache[key] or [])
+        return self._walk_directory(directory)
+
+    def watch_directory(self, directory: str):
+        """标记目录由目录监视维护 (之后由 apply_changes / refresh_directory 更新)"""
+        if directory:
+            with self._cache_lock:
+                self._dir_cache.setdefault(os.path.abspath(directory), None)
+
+    def _walk_directory(self, directory: str) -> list[str]:
+        """遍历目录 (含子目录) 中的媒体文件"""
         files = []
-        if not directory or not os.path.isdir(directory):
+        if not directory:
             log.warning(f"目录不存在: {directory}")
             return files
 
-        try:
-            for root, _dirs, filenames in os.walk(directory):
-                for filename in filenames:
-                    if os.path.splitext(filename)[1].lower() in MEDIA_EXTENSIONS:
-                        full_path = os.path.join(root, filename)
-                        files.append(full_path)
-            files.sort()
-            log.debug(f"扫描完成: {directory} - {len(files)} 个媒体文件")
-        except Exception as e:
-            log.error(f"扫描目录失败 {directory}: {e}")
-
+        for listing in self.scanner.walk(directory, self.is_media, recursive=True):
+            files.extend(entry.path for entry in listing.files)
+        files.sort()
+        log.debug(f"扫描完成: {directory} - {len(files)} 个媒体文件")
         return files
 
-    def _save_mode_state(self, mode_key: str):
-        """保存当前模式的播放状态"""
+    def refresh_directory(self, directory: str):
+        """重新遍历目录并缓存其文件列表 (首次播放 / 全量重扫)"""
+        directory = os.path.abspath(directory)
+        files = self._walk_directory(directory)
+        with self._cache_lock:
+            self._dir_cache[directory] = files
+
+    def apply_changes(self, directory: str, added: Iterable[str], removed: Iterable[str]):
+        """增量更新被监视目录的文件列表 (目录监视回调)"""
+        with self._cache_lock:
+            files = self._dir_cache.get(os.path.abspath(directory))
+            if files is None:
+                return
+            for path in removed:
+                i = bisect_left(files, path)
+                if i < len(files) and files[i] == path:
+                    del files[i]
+            for path in added:
+                i = bisect_left(files, path)
+                if i == len(files) or files[i] != path:
+                    files.insert(i, path)
+
+    async def _set_playlist(self, files: list[str], seek: Optional[int] = None,
+                            start: int = 0, source: Optional[str] = None) -> bool:
+        """设置播放列表，从 files[start] 开始播放
+
+        Args:
+            files: 完整播放列表
+            seek: files[start] 开始播放后跳转到的进度 (毫秒)
+            start: 起始文件下标
+            source: 列表来自的目录
+        """
+        self._playback_files = files
+        self._playlist_source = source
+        self._pending_seek = seek  # 在请求发出前设置: started 事件可能先于请求返回到达
+        return await self._submit_window(start)
+
+    async def _switch_to(self, filepath: str) -> bool:
+        """播放单个文件: 已预加载在备用源上时 A/B 互换，否则替换当前源的播放列表"""
+        t0 = time.perf_counter()
+        swapped = False
+        if self._staged == filepath:
+            self._staged = None
+            # 互换会停止原来的源，其 ended 事件可能在 vlc_source_name 切换前到达，不能算作播完
+            self._media_started = False
+            swapped = await self.obs.swap_vlc_sources()
+        if swapped:
+            self._playback_files = [filepath]
+            self._playlist_source = None
+            self._pending_seek = None
+            self._window_start = 0
+            self._window_size = 1
+            # 该项的 started 事件在预加载时已由备用源发出 (当时不是当前源，被忽略)，
+            # 直接视为已开始，播完的 ended 才会推进队列
+            self._media_started = True
+            self._playlist_index = 0
+            success = True
+        else:
+            success = await self._set_playlist([filepath])
+        if success:
+            how = "A/B 互换" if swapped else "替换播放列表"
+            log.info(f"切换耗时: {(time.perf_counter() - t0) * 1000:.0f} ms ({how})")
+        return success
+
+    async def stage_next(self) -> bool:
+        """把队列中的下一项预加载到备用源 (A/B 模式，队列变化后调用)"""
+        if not self.obs.dual_vlc:
+            return False
+        queue = self.replays if self._current_mode == "replay" else self.songs
+        item = queue.queue_peek()
+        if item is None:
+            return False
+        filepath = item[1]
+        if filepath == self._staged:
+            return True
+        self._staged = None
+        if not await self.obs.stage_vlc_playlist([filepath]):
+            return False
+        self._staged = filepath
+        return True
+
+    def _windowed(self) -> bool:
+        # 没有媒体事件就无从得知窗口何时播完，此时整个列表一次提交
+        return 0 < self.window < len(self._playback_files) and self.obs.events_alive
+
+    async def _submit_window(self, start: int) -> bool:
+        """从完整列表的 start 处起提交一个窗口 (不分窗口时提交整个列表，从 start 开始)"""
+        files = self._playback_files
+        n = len(files)
+        start = start % n if n else 0
+        if self._windowed():
+            submitted = [files[(start + i) % n] for i in range(self.window)]
+        else:
+            submitted = files[start:] + files[:start] if start else files
+        self._window_start = start
+        self._window_size = len(submitted)
+        self._media_started = False
+        self._playlist_index = -1
+        return await self.obs.set_vlc_playlist(submitted)
+
+    def _playing_file(self) -> Optional[str]:
+        """按 started 事件计数得到的当前文件 (目录循环播放时 now_playing 不随之更新)"""
+        if self._playlist_index < 0 or not self._window_size:
+            return None
+        offset = self._playlist_index % self._window_size
+        return self._playback_files[(self._window_start + offset) % len(self._playback_files)]
+
+    def _window_exhausted(self) -> bool:
+        """已分窗口且正在播放窗口的最后一项"""
+        return (self._window_size < len(self._playback_files)
+                and self._playlist_index >= self._window_size - 1)
+
+    def _save_mode_state(self, mode_key: str, media: Optional[MediaStatus] = None):
+        """保存当前模式的播放状态
+
+        Args:
+            mode_key: 模式键
+            media: 切换前 VLC 源的状态 (含播放进度)，None 时只保存播放列表和当前文件
+        """
         if not mode_key:
             return
         # 只为有播放列表的模式保存状态
@@ -106,18 +294,36 @@ class VLCController:
             current_file = None
             if mode_key == "video":
                 # 录像模式：当前播放的是 now_playing 对应的文件
-                current_file = self._current_song_request or self._get_current_file_from_now_playing()
+                current_file = (self._current_song_request or self._playing_file()
+                                or self._get_current_file_from_now_playing())
             elif mode_key == "music":
                 current_file = self._current_song_request
+                if current_file is None:
+                    # 没有正在播放的点歌: 不保存列表，下次进入歌曲模式时从队列开始
+                    self._mode_states[mode_key] = ModeVLCState()
+                    if self.journal is not None:
+                        self.journal.record("playback", mode=mode_key, source=None,
+                                            playlist=None, current=None, cursor=None)
+                    return
             elif mode_key == "replay":
-                current_file = self._current_replay_request
+                current_file = self._current_replay_request or self._playing_file()
 
+            cursor = None
+            if current_file and media is not None and media.active and media.cursor:
+                cursor = media.cursor
             state = ModeVLCState(
-                playlist=list(self._playback_files),
+                playlist=self._playback_files,
                 current_file=current_file,
+                cursor=cursor,
+                source=self._playlist_source,
             )
             self._mode_states[mode_key] = state
-            log.debug(f"已保存模式状态: {mode_key} (播放列表: {len(state.playlist)} 个文件)")
+            if self.journal is not None:
+                self.journal.record("playback", mode=mode_key, source=state.source,
+                                    playlist=None if state.source else state.playlist,
+                                    current=state.current_file, cursor=state.cursor)
+            log.debug(f"已保存模式状态: {mode_key} (播放列表: {len(state.playlist)} 个文件, "
+                      f"进度: {cursor} ms)")
 
     def _get_current_file_from_now_playing(self) -> Optional[str]:
         """根据 now_playing 名称在播放列表中查找文件路径"""
@@ -133,67 +339,127 @@ class VLCController:
     async def _restore_mode_state(self, mode_key: str) -> bool:
         """恢复已保存的模式播放状态
 
-        将播放列表旋转，使保存时的文件排第一位。
+        从保存时的文件开始播放；有保存的进度时，该文件开始播放后跳转到该进度。
         Returns:
             是否成功恢复 (False 表示无保存状态)
         """
         state = self._mode_states.get(mode_key)
+        if state is not None and not state.playlist and state.source:
+            state.playlist = self._scan_directory(state.source)  # 从状态日志恢复的状态
         if not state or not state.playlist:
             return False
 
-        playlist = list(state.playlist)
+        playlist = state.playlist
 
-        # 如果有保存的当前文件，旋转列表使其排第一
-        if state.current_file and state.current_file in playlist:
-            idx = playlist.index(state.current_file)
-            playlist = playlist[idx:] + playlist[:idx]
+        # 如果有保存的当前文件，从它开始
+        seek = None
+        start = 0
+        if state.current_file:
+            try:
+                start = playlist.index(state.current_file)
+            except ValueError:
+                pass
+            else:
+                if state.cursor and state.cursor >= SEEK_MIN_MS:
+                    seek = state.cursor
 
-        self._playback_files = playlist
-        success = await self.obs.set_vlc_playlist(playlist)
+        success = await self._set_playlist(playlist, seek, start, state.source)
         if success:
-            first_name = os.path.splitext(os.path.basename(playlist[0]))[0]
+            first_name = os.path.splitext(os.path.basename(playlist[start]))[0]
             self.songs.now_playing = first_name
-            self._write_now_playing(first_name)
-            log.info(f"已恢复模式状态: {mode_key} (从 {first_name} 继续)")
+            position = f" {_format_ms(seek)}" if seek else ""
+            log.info(f"已恢复模式状态: {mode_key} (从 {first_name}{position} 继续)")
+            if seek and not self.obs.events_alive:
+                await self._poll_and_seek()
         return success
 
-    async def transition_to_mode(self, old_key: str, new_key: str):
+    def restore_states(self, records: dict[str, dict]):
+        """从状态日志恢复各模式保存的播放状态 (启动时，进入模式前调用)"""
+        for mode_key, record in records.items():
+            self._mode_states[mode_key] = ModeVLCState(
+                playlist=record.get("playlist") or [],
+                current_file=record.get("current"),
+                cursor=record.get("cursor"),
+                source=record.get("source"),
+            )
+        if records:
+            log.info(f"已从状态日志恢复播放状态: {', '.join(records)}")
+
+    async def _seek_pending(self, media: Optional[MediaStatus] = None):
+        """恢复的文件已开始播放: 跳转到保存的进度"""
+        seek, self._pending_seek = self._pending_seek, None
+        if not seek:
+            return
+        duration = media.duration if media is not None else None
+        if duration and duration - seek < SEEK_MIN_MS:
+            return  # 保存时已接近结尾，从头播放
+        if await self.obs.set_media_cursor(seek):
+            log.info(f"已跳转到保存的进度: {_format_ms(seek)}")
+
+    async def _poll_and_seek(self):
+        """没有媒体事件时，轮询源状态直到开始播放再跳转"""
+        for _ in range(SEEK_POLL_TRIES):
+            if self._pending_seek is None:
+                return  # 已被 started 事件处理，或期间更换了播放列表
+            media = await self.obs.get_media_status()
+            if media is not None and media.state == MEDIA_STATE_PLAYING:
+                await self._seek_pending(media)
+                return
+            await asyncio.sleep(SEEK_POLL_INTERVAL)
+        log.debug("等待开始播放超时，放弃恢复进度")
+        self._pending_seek = None
+
+    async def transition_to_mode(self, old_key: str, new_key: str,
+                                 media: Optional[MediaStatus] = None):
         """模式切换：保存旧模式状态，进入新模式
 
         Args:
             old_key: 旧模式键 (如 "video", "music", "replay")
             new_key: 新模式键
+            media: 切换前 VLC 源的状态 (OBSController.switch_mode_sources 读取)
         """
         # 1. 保存旧模式状态
-        self._save_mode_state(old_key)
+        self._save_mode_state(old_key, media)
 
-        # 2. 进入新模式
+        # 2. 进入新模式 (先设置当前模式: 新列表的 started 事件按新模式保存播放状态)
         if new_key == "video":
-            restored = await self._restore_mode_state("video")
-            if not restored:
-                await self.play_directory(self.playback_dir)
             self._current_mode = "video"
             self._current_song_request = None
             self._current_replay_request = None
+            restored = await self._restore_mode_state("video")
+            if not restored:
+                await self.play_directory(self.playback_dir)
 
         elif new_key == "music":
-            restored = await self._restore_mode_state("music")
-            if not restored:
-                # 歌曲模式无保存状态时，等待点歌（不主动播放）
-                pass
             self._current_mode = "music"
             self._current_replay_request = None
+            # 歌曲模式的播放状态按当前点歌保存，started 事件可能先于恢复返回到达
+            state = self._mode_states.get("music")
+            self._current_song_request = state.current_file if state else None
+            restored = await self._restore_mode_state("music")
+            if restored:
+                # 继续播放之前的点歌，播完后接着播队列
+                self._current_song_request = self._playback_files[self._window_start]
+                self._request_started = time.monotonic()
+            else:
+                self._current_song_request = None
+                if self.obs.connected:
+                    # 歌曲模式无保存状态时播放队列 (重启后恢复的点歌)，队列空则等待点歌
+                    next_item = self.songs.queue_pop()
+                    if next_item:
+                        await self.play(next_item[1])
 
         elif new_key == "replay":
+            self._current_mode = "replay"
+            self._current_song_request = None
             restored = await self._restore_mode_state("replay")
             if not restored:
                 await self.play_directory(self.replay_dir)
-            self._current_mode = "replay"
-            self._current_song_request = None
 
         elif new_key in ("broadcast", "pk"):
             await self.stop()
             self._current_mode = new_key
+            self._current_song_request = None  # 直播/PK 时点歌作废 (之后的点歌进入队列)
 
         elif new_key == "other":
             await self.stop()
@@ -208,13 +474,13 @@ class VLCController:
         self._current_song_request = filepath
         song_name = os.path.splitext(os.path.basename(filepath))[0]
 
-        success = await self.obs.set_vlc_playlist([filepath])
+        success = await self._switch_to(filepath)
         if success:
-            self._playback_files = [filepath]
+            self._request_started = time.monotonic()
             self.songs.now_playing = song_name
             self._current_mode = "music"
             log.info(f"即时播放: {song_name}")
-            self._write_now_playing(song_name)
+            await self.stage_next()
         else:
             log.error(f"设置 VLC 播放列表失败: {filepath}")
 
@@ -228,14 +494,14 @@ class VLCController:
 
         self._current_replay_request = filepath
 
-        success = await self.obs.set_vlc_playlist([filepath])
+        success = await self._switch_to(filepath)
         if success:
-            self._playback_files = [filepath]
+            self._request_started = time.monotonic()
             self.replays.now_playing = code
             self.songs.now_playing = f"回放 {code}"
             self._current_mode = "replay"
             log.info(f"即时播放录播: {code}")
-            self._write_now_playing(f"回放 {code}")
+            await self.stage_next()
         else:
             log.error(f"设置 VLC 播放列表失败: {filepath}")
 
@@ -248,16 +514,15 @@ class VLCController:
             log.warning(f"目录为空: {directory}")
             return False
 
-        self._playback_files = files
         self._current_song_request = None
         self._current_replay_request = None
 
-        success = await self.obs.set_vlc_playlist(files)
+        success = await self._set_playlist(files, source=directory)
         if success:
             first_song = os.path.splitext(os.path.basename(files[0]))[0]
             self.songs.now_playing = first_song
-            log.info(f"目录播放已启动: {len(files)} 个文件 (来自: {directory})")
-            self._write_now_playing(first_song)
+            window = f", 每次提交 {self._window_size} 个" if self._window_size < len(files) else ""
+            log.info(f"目录播放已启动: {len(files)} 个文件{window} (来自: {directory})")
         return success
 
     async def next_song(self) -> bool:
@@ -274,10 +539,8 @@ class VLCController:
                 name, filepath = next_item
                 return await self.play(filepath)
             else:
-                # 队列空，恢复录像模式（通过返回 False 让调用者处理）
-                log.info("歌曲队列已空，等待切换到录像模式")
-                self._current_song_request = None
-                return False
+                log.info("歌曲队列已空，回到之前的模式")
+                return await self.clear_song_request()
 
         elif self._current_mode == "replay":
             # 回放模式：弹出点播队列下一个
@@ -292,39 +555,133 @@ class VLCController:
                     self._current_replay_request = None
                     return await self.play_directory(self.replay_dir)
             else:
-                success = await self.obs.media_action(MEDIA_NEXT)
-                if success:
-                    log.info("已切歌 (下一首)")
-                return success
+                return await self._media_next()
 
         else:
             # 录像模式及其他：直接 MEDIA_NEXT
+            return await self._media_next()
+
+    async def _media_next(self) -> bool:
+        if self._window_exhausted():
+            # 窗口最后一项: 直接提交下一个窗口
+            success = await self._next_window()
+        else:
+            self._media_started = False  # 下一项的 started 计入列表位置
             success = await self.obs.media_action(MEDIA_NEXT)
-            if success:
-                log.info("已切歌 (下一首)")
-            return success
+        if success:
+            log.info("已切歌 (下一首)")
+        return success
+
+    async def handle_media_event(self, event: str, input_name: str):
+        """OBS 媒体事件回调 (MediaInputPlaybackStarted / Ended)"""
+        if input_name != self.obs.vlc_source_name:
+            return
+        if event == MEDIA_STARTED:
+            if not self._media_started:
+                # 新的一项开始 (暂停后继续播放不计)
+                self._media_started = True
+                self._playlist_index += 1
+                if self._pending_seek is not None:
+                    if self._playlist_index == 0:
+                        await self._seek_pending()
+                    else:
+                        self._pending_seek = None
+                # 记下当前模式播放到哪一项 (崩溃重启后从这里继续)
+                if self.journal is not None and self._current_mode:
+                    self._save_mode_state(self._current_mode)
+        elif event == MEDIA_ENDED and self._media_started:
+            self._media_started = False
+            if self._current_song_request or self._current_replay_request:
+                await self.advance()
+            elif self._window_exhausted():
+                await self._next_window()
+
+    async def watch_requests(self, interval: float = 5.0, grace: float = 30.0):
+        """媒体事件不可用时的兜底: 点歌/点播播完后播放队列下一项
+
+        媒体事件订阅正常时由 handle_media_event 处理，这里什么也不做。
+        订阅失败或断开期间每 interval 秒读取一次 VLC 源状态，源已播完，
+        或已播放超过 时长 + grace 秒 (时长未知时 15 分钟) 时调用 advance。
+        """
+        while True:
+            await asyncio.sleep(interval)
+            request = self._current_song_request or self._current_replay_request
+            if request is None or self.obs.events_alive or not self.obs.connected:
+                continue
+            elapsed = time.monotonic() - self._request_started
+            if elapsed < interval:
+                continue  # 刚切换，源状态可能还是上一项的
+            media = await self.obs.get_media_status()
+            if request != (self._current_song_request or self._current_replay_request):
+                continue  # 读取状态期间已切换
+            if media is not None and media.state == MEDIA_STATE_ENDED:
+                log.info("点歌/点播已播完 (轮询源状态)")
+            else:
+                manager = self.songs if self._current_song_request else self.replays
+                duration = manager.duration(request)
+                timeout = duration + grace if duration else REQUEST_TIMEOUT
+                if elapsed <= timeout:
+                    continue
+                log.info(f"点歌/点播已播放 {elapsed / 60:.1f} 分钟，视为播完")
+            self._media_started = False
+            await self.advance()
+
+    async def _next_window(self) -> bool:
+        """当前窗口已播完: 提交完整列表中紧接着的下一个窗口"""
+        start = self._window_start + self._window_size
+        log.debug(f"提交下一个播放窗口: 第 {start % len(self._playback_files) + 1} 个起")
+        return await self._submit_window(start)
+
+    async def advance(self) -> bool:
+        """当前点歌/点播播完: 播放队列下一项，队列空则恢复之前的播放列表"""
+        async with self._advance_lock:
+            if self._current_song_request:
+                next_item = self.songs.queue_pop()
+                if next_item:
+                    name, filepath = next_item
+                    log.info(f"点歌播放完毕，播放队列下一首: {name}")
+                    return await self.play(filepath)
+                log.info("点歌播放完毕，队列已空，回到之前的模式")
+                return await self.clear_song_request()
+
+            if self._current_replay_request:
+                next_item = self.replays.queue_pop()
+                if next_item:
+                    code, filepath = next_item
+                    log.info(f"点播播放完毕，播放队列下一个: {code}")
+                    return await self.play_replay(filepath, code)
+                log.info("点播播放完毕，恢复回放序列")
+                self._current_replay_request = None
+                return await self.play_directory(self.replay_dir)
+            return False
 
     async def stop(self) -> bool:
         """停止播放"""
+        self._media_started = False
+        self._pending_seek = None
         success = await self.obs.media_action(MEDIA_STOP)
         if success:
             log.info("播放已停止")
         return success
 
     async def clear_song_request(self) -> bool:
-        """清除当前点歌请求，恢复录像列表"""
+        """清除当前点歌请求，回到之前的模式
+
+        设置了 on_song_queue_empty 时交给模式管理器切换 (面板与保存的状态随之更新)，
+        否则自行从歌曲模式回到录像模式。
+        """
         if not self._current_song_request:
             return True
 
-        log.info("清除点歌请求，恢复录像")
+        log.info("清除点歌请求")
         self._current_song_request = None
-        return await self.play_directory(self.playback_dir)
-
-    def _write_now_playing(self, song_name: str):
-        """写入 now_playing.txt (供 OBS 底部字幕使用)"""
-        try:
-            np_file = os.path.join(self.data_dir, "now_playing.txt")
-            with open(np_file, "w", encoding="utf-8") as f:
-                f.write(song_name)
-        except OSError:
-            pass
+        if self.on_song_queue_empty is not None:
+            await self.on_song_queue_empty()
+        elif self._current_mode == "music":
+            await self.transition_to_mode("music", "video")
+        return True
+
+
+def _format_ms(ms: int) -> str:
+    seconds = int(ms) // 1000
+    return f"{seconds // 60}:{seconds % 60:02d}"
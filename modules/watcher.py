@@ -0,0 +1,445 @@
+"""
+目录监视 - 歌曲库/录像/录播目录的增量更新
+
+新歌、新录播原来要重启才出现: 索引只在启动时建一次，录像目录则在每次
+play_directory 时整个重新遍历。DirectoryWatcher 监视这些目录，把文件的
+新增/删除/改名作为增量交给订阅者 (SongManager / ReplayManager / VLCController)。
+
+后端:
+  inotify  Linux (ctypes 直接调用 libc，无额外依赖)，fd 挂在事件循环上
+  poll     其余平台或 inotify 不可用时: 定期 stat 目录，mtime 变化才重新
+           列目录；新出现的文件大小/mtime 连续两轮不变 (复制完成) 才上报
+
+防抖: 第一个事件到达后，安静 debounce 秒 (最长 max_delay 秒) 再统一处理，
+批量复制 500 个文件只触发一次索引更新。处理时按文件当前是否存在判定
+新增/删除，同一文件在窗口内的多次变化只算最终状态。
+
+子目录整体删除/移出、事件队列溢出时，对应订阅者做一次全量重扫；
+此外每隔 rescan_interval 秒对所有订阅者做一次全量重扫作为一致性校验。
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+log = logging.getLogger("watcher")
+
+# inotify 事件掩码 (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+@dataclass
+class Watch:
+    """一个订阅: 目录 + 文件名过滤 + 回调"""
+    root: str  # 绝对路径
+    on_change: Callable[[list[str], list[str]], object]  # (新增路径, 删除路径)
+    match: Callable[[str], object]  # 按文件名过滤
+    recursive: bool = False
+    rescan: Optional[Callable[[], object]] = None  # 全量重扫
+    name: str = ""
+
+    def covers(self, path: str) -> bool:
+        parent = os.path.dirname(path)
+        if parent == self.root:
+            return True
+        return self.recursive and parent.startswith(self.root + os.sep)
+
+
+@dataclass
+class _Pending:
+    """防抖窗口内累积的变化"""
+    paths: set[str] = field(default_factory=set)
+    rescans: set[str] = field(default_factory=set)  # 需要全量重扫的根目录
+
+
+def _walk_files(directory: str) -> list[str]:
+    paths = []
+    for root, _dirs, filenames in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in filenames)
+    return paths
+
+
+class _Inotify:
+    """inotify 后端"""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify 仅支持 Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._dirs: dict[int, str] = {}  # wd → 目录
+        self._roots: dict[str, bool] = {}  # 根目录 → 是否递归
+
+    def _add(self, directory: str) -> bool:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            log.warning(f"无法监视目录 {directory}: {os.strerror(ctypes.get_errno())}")
+            return False
+        self._dirs[wd] = directory
+        return True
+
+    def add_root(self, root: str, recursive: bool):
+        """监视根目录 (递归时包括全部子目录；已监视的目录重复添加无副作用)"""
+        self._roots[root] = self._roots.get(root, False) or recursive
+        if not os.path.isdir(root):
+            return
+        if self._roots[root]:
+            self._add_tree(root)
+        else:
+            self._add(root)
+
+    def _add_tree(self, directory: str):
+        if self._add(directory):
+            for parent, dirs, _files in os.walk(directory):
+                for name in dirs:
+                    self._add(os.path.join(parent, name))
+
+    def _root_of(self, directory: str) -> Optional[str]:
+        for root in self._roots:
+            if directory == root or directory.startswith(root + os.sep):
+                return root
+        return None
+
+    def read(self, pending: _Pending):
+        """读取全部就绪事件并合并到 pending"""
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                self._handle(wd, mask, name, pending)
+
+    def _handle(self, wd: int, mask: int, name: str, pending: _Pending):
+        if mask & IN_Q_OVERFLOW:
+            log.warning("inotify 事件队列溢出，全量重扫")
+            pending.rescans.update(self._roots)
+            return
+        if mask & IN_IGNORED:
+            self._dirs.pop(wd, None)
+            return
+        directory = self._dirs.get(wd)
+        if directory is None:
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if directory in self._roots:
+                pending.rescans.add(directory)
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            root = self._root_of(directory)
+            if root is None or not self._roots[root]:
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # 新子目录 (可能是整个文件夹移入): 监视它并上报已有文件
+                self._add_tree(path)
+                pending.paths.update(_walk_files(path))
+            elif mask & IN_MOVED_FROM:
+                pending.rescans.add(root)  # 子目录整体移出: 其中文件未逐个上报
+            return
+        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+            pending.paths.add(path)  # IN_CREATE 不上报: 等写完 (IN_CLOSE_WRITE)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Poller:
+    """轮询后端 (在工作线程中执行，状态只由该线程访问)"""
+
+    def __init__(self):
+        self._roots: dict[str, bool] = {}
+        self._dir_mtimes: dict[str, int] = {}  # 目录 → mtime
+        self._files: dict[str, set[str]] = {}  # 目录 → 文件名
+        self._unstable: dict[str, tuple[int, int]] = {}  # 新文件 → (大小, mtime)
+
+    def add_root(self, root: str, recursive: bool):
+        self._roots[root] = self._roots.get(root, False) or recursive
+        self._scan_dir(root, _Pending(), baseline=True)
+
+    def _scan_dir(self, directory: str, pending: _Pending, baseline: bool = False):
+        """重新列一个目录，与上次的文件名集合对比"""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            self._drop_dir(directory, pending)
+            return
+        self._dir_mtimes[directory] = mtime
+        names, subdirs = set(), []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    names.add(entry.name)
+            except OSError:
+                continue
+        old = self._files.get(directory, set())
+        self._files[directory] = names
+        if not baseline:
+            for name in names - old:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                self._unstable[path] = (st.st_size, st.st_mtime_ns)
+            pending.paths.update(os.path.join(directory, name) for name in old - names)
+        root = self._root_of(directory)
+        if root is not None and self._roots[root]:
+            for subdir in subdirs:
+                if subdir not in self._dir_mtimes:
+                    self._scan_dir(subdir, pending, baseline)
+
+    def _drop_dir(self, directory: str, pending: _Pending):
+        """目录消失: 其中 (含子目录) 已知文件全部按删除上报"""
+        for known in [d for d in self._files if d == directory or d.startswith(directory + os.sep)]:
+            pending.paths.update(os.path.join(known, name) for name in self._files.pop(known))
+            self._dir_mtimes.pop(known, None)
+
+    def _root_of(self, directory: str) -> Optional[str]:
+        for root in self._roots:
+            if directory == root or directory.startswith(root + os.sep):
+                return root
+        return None
+
+    def poll(self) -> _Pending:
+        pending = _Pending()
+        for directory in list(self._dir_mtimes) + [r for r in self._roots if r not in self._dir_mtimes]:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                self._drop_dir(directory, pending)
+                continue
+            if self._dir_mtimes.get(directory) != mtime:
+                self._scan_dir(directory, pending)
+        # 新文件大小/mtime 连续两轮不变才算复制完成
+        for path, previous in list(self._unstable.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._unstable[path]
+                pending.paths.add(path)
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current == previous:
+                del self._unstable[path]
+                pending.paths.add(path)
+            else:
+                self._unstable[path] = current
+        return pending
+
+
+class DirectoryWatcher:
+    """目录监视 + 防抖批量分发"""
+
+    def __init__(self, backend: str = "auto", debounce: float = 1.0, max_delay: float = 10.0,
+                 poll_interval: float = 5.0, rescan_interval: float = 600.0):
+        """
+        Args:
+            backend: auto (Linux 用 inotify，否则轮询) / inotify / poll
+            debounce: 最后一个事件后安静多久再处理 (秒)
+            max_delay: 持续有事件时最长等待 (秒)
+            poll_interval: 轮询间隔 (秒，仅轮询后端)
+            rescan_interval: 全量重扫间隔 (秒，0 表示不做)
+        """
+        self.backend = backend
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.watches: list[Watch] = []
+        self._pending = _Pending()
+        self._pending_lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inotify: Optional[_Inotify] = None
+        self._poller: Optional[_Poller] = None
+        self.stats = {"batches": 0, "added": 0, "removed": 0, "rescans": 0}
+
+    def watch(self, directory: str, on_change: Callable[[list[str], list[str]], object],
+              match: Callable[[str], object] = lambda name: True, recursive: bool = False,
+              rescan: Optional[Callable[[], object]] = None, name: str = ""):
+        """订阅目录变化 (须在 run 之前调用)
+
+        on_change(added, removed) 与 rescan() 在工作线程中调用，路径均为绝对路径。
+        """
+        if not directory:
+            return
+        self.watches.append(Watch(os.path.abspath(directory), on_change, match,
+                                  recursive, rescan, name or directory))
+
+    def _roots(self) -> dict[str, bool]:
+        roots: dict[str, bool] = {}
+        for w in self.watches:
+            roots[w.root] = roots.get(w.root, False) or w.recursive
+        return roots
+
+    def _notify(self, pending: _Pending):
+        """合并一批变化并唤醒分发循环 (可在任意线程调用)"""
+        if not pending.paths and not pending.rescans:
+            return
+        with self._pending_lock:
+            self._pending.paths |= pending.paths
+            self._pending.rescans |= pending.rescans
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _take(self) -> _Pending:
+        with self._pending_lock:
+            pending, self._pending = self._pending, _Pending()
+        return pending
+
+    def _start_backend(self) -> str:
+        """建立监视后端 (在线程池中运行；add_reader 不是线程安全的，由 run 在事件循环中调用)"""
+        roots = self._roots()
+        if self.backend in ("auto", "inotify"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                if self.backend == "inotify":
+                    log.warning(f"inotify 不可用 ({e})，改用轮询")
+            else:
+                for root, recursive in roots.items():
+                    self._inotify.add_root(root, recursive)
+                return "inotify"
+        self._poller = _Poller()
+        for root, recursive in roots.items():
+            self._poller.add_root(root, recursive)
+        return "poll"
+
+    def _on_inotify(self):
+        pending = _Pending()
+        self._inotify.read(pending)
+        self._notify(pending)
+
+    async def _poll_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self._notify(await loop.run_in_executor(None, self._poller.poll))
+
+    def _dispatch(self, pending: _Pending):
+        """在工作线程中把一批变化分发给订阅者"""
+        for w in self.watches:
+            if w.root in pending.rescans:
+                self._rescan(w)
+                continue
+            added, removed = [], []
+            for path in pending.paths:
+                if not w.covers(path) or not w.match(os.path.basename(path)):
+                    continue
+                (added if os.path.isfile(path) else removed).append(path)
+            if not added and not removed:
+                continue
+            added.sort()
+            try:
+                w.on_change(added, removed)
+            except Exception as e:
+                log.error(f"目录更新处理失败 ({w.name}): {e}")
+                continue
+            self.stats["added"] += len(added)
+            self.stats["removed"] += len(removed)
+            log.info(f"目录变化: {w.name} 新增 {len(added)} 个, 移除 {len(removed)} 个")
+        self.stats["batches"] += 1
+
+    def _rescan(self, w: Watch):
+        if w.rescan is None:
+            return
+        try:
+            w.rescan()
+        except Exception as e:
+            log.error(f"全量重扫失败 ({w.name}): {e}")
+        self.stats["rescans"] += 1
+
+    def _rescan_all(self):
+        if self._inotify is not None:
+            for root, recursive in self._roots().items():
+                self._inotify.add_root(root, recursive)  # 补上可能漏掉的子目录
+        for w in self.watches:
+            self._rescan(w)
+        log.debug(f"目录全量重扫完成 ({len(self.watches)} 个订阅)")
+
+    async def _wait(self, timeout: Optional[float]) -> bool:
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def run(self):
+        """监视循环 (启动后台任务使用)"""
+        if not self.watches:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        backend = await self._loop.run_in_executor(None, self._start_backend)
+        if self._inotify is not None:
+            self._loop.add_reader(self._inotify.fd, self._on_inotify)
+        names = ", ".join(w.name for w in self.watches)
+        log.info(f"目录监视启动 ({backend}; {names}; 防抖 {self.debounce}s, "
+                 f"全量重扫间隔 {self.rescan_interval or '-'}s)")
+        poll_task = asyncio.ensure_future(self._poll_loop()) if self._poller else None
+        next_rescan = self._loop.time() + self.rescan_interval if self.rescan_interval else None
+        try:
+            while True:
+                has_pending = bool(self._pending.paths or self._pending.rescans)
+                timeout = None if next_rescan is None else max(0.0, next_rescan - self._loop.time())
+                if not has_pending and not await self._wait(timeout):
+                    await self._loop.run_in_executor(None, self._rescan_all)
+                    next_rescan = self._loop.time() + self.rescan_interval
+                    continue
+                # 防抖: 安静 debounce 秒或累计 max_delay 秒后统一处理
+                deadline = self._loop.time() + self.max_delay
+                while await self._wait(min(self.debounce, max(0.0, deadline - self._loop.time()))):
+                    if self._loop.time() >= deadline:
+                        break
+                await self._loop.run_in_executor(None, self._dispatch, self._take())
+        except asyncio.CancelledError:
+            log.info(f"目录监视停止 (批次 {self.stats['batches']}, 新增 {self.stats['added']}, "
+                     f"移除 {self.stats['removed']}, 全量重扫 {self.stats['rescans']})")
+            raise
+        finally:
+            if poll_task is not None:
+                poll_task.cancel()
+            self.close()
+
+    def close(self):
+        if self._inotify is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        self._poller = None
@@ -0,0 +1 @@
+"""单元测试 (纯逻辑部分，无需 OBS/B站)"""
@@ -0,0 +1,68 @@
+"""RequestQueue 去重 + 按点歌人轮转"""
+
+import random
+
+from modules.request_queue import QueueStatus, RequestQueue
+
+
+def drain(queue):
+    items = []
+    while True:
+        item = queue.pop()
+        if item is None:
+            return items
+        items.append(item)
+
+
+def test_round_robin_between_requesters():
+    queue = RequestQueue()
+    for key, uid in (("a1", 1), ("a2", 1), ("a3", 1), ("b1", 2), ("c1", 3), ("b2", 2)):
+        queue.push(key, key, uid)
+    assert list(queue.items()) == ["a1", "b1", "c1", "a2", "b2", "a3"]
+    assert drain(queue) == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_duplicate_returns_existing_position():
+    queue = RequestQueue()
+    queue.push("x", "x", 1)
+    queue.push("y", "y", 2)
+    result = queue.push("y", "y", 3)
+    assert result.status == QueueStatus.DUPLICATE
+    assert result.position == 2
+    assert len(queue) == 2
+
+
+def test_per_user_limit_and_capacity():
+    queue = RequestQueue(per_user=2, capacity=3)
+    assert queue.push("a", "a", 1).added
+    assert queue.push("b", "b", 1).added
+    assert queue.push("c", "c", 1).status == QueueStatus.USER_LIMIT
+    assert queue.push("d", "d", None).added  # 主播端不受个人上限约束
+    assert queue.push("e", "e", 2).status == QueueStatus.FULL
+
+
+def test_limit_and_count():
+    queue = RequestQueue()
+    for i in range(5):
+        queue.push(i, i, i % 2)
+    assert list(queue.items(3)) == [0, 1, 2]
+    assert queue.count(0) == 3
+    assert queue.count(1) == 2
+    assert queue.count(9) == 0
+
+
+def test_items_and_positions_match_pop_order():
+    rng = random.Random(1234)
+    for _ in range(50):
+        queue = RequestQueue()
+        next_key = 0
+        for _ in range(rng.randrange(1, 60)):
+            if rng.random() < 0.7 or not len(queue):
+                queue.push(next_key, next_key, rng.choice([None, 1, 2, 3, 4]))
+                next_key += 1
+            else:
+                queue.pop()
+            order = list(queue.items())
+            assert [queue.position(key) for key in order] == list(range(1, len(order) + 1))
+        assert drain(queue) == order
+        assert queue.position(0) == 0
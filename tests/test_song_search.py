@@ -0,0 +1,68 @@
+"""SongSearch 排序搜索"""
+
+import pytest
+
+from modules.song_search import SongSearch, lazy_pinyin
+
+NAMES = ["我爱你", "晴天", "稻香", "Hello", "Yesterday", "七里香", "告白气球"]
+
+
+@pytest.fixture(scope="module")
+def search():
+    return SongSearch(NAMES)
+
+
+def names(search, query, k=5):
+    return [NAMES[doc_id] for _, doc_id in search.top(query, k)]
+
+
+def test_single_han_character_matches_substring(search):
+    assert names(search, "爱") == ["我爱你"]
+    assert set(names(search, "香")) == {"稻香", "七里香"}
+
+
+def test_single_latin_character_matches_substring(search):
+    assert set(names(search, "e")) == {"Hello", "Yesterday"}
+    assert names(search, "H") == ["Hello"]
+
+
+def test_exact_beats_prefix_beats_substring():
+    search = SongSearch(["晴天雨", "晴天", "下雨晴天"])
+    assert [doc_id for _, doc_id in search.top("晴天", 3)] == [1, 0, 2]
+
+
+def test_fullwidth_and_case_folding(search):
+    assert names(search, "ＨＥＬＬＯ")[0] == "Hello"
+
+
+def test_no_match_returns_empty(search):
+    assert search.top("zzzz") == []
+
+
+def test_empty_query_returns_first_ids(search):
+    assert [doc_id for _, doc_id in search.top("", 3)] == [0, 1, 2]
+
+
+def test_add_and_remove():
+    local = SongSearch(NAMES)
+    local.add(len(NAMES), "爱情转移")
+    assert len(local.top("爱", 5)) == 2
+    local.remove(0)
+    assert [doc_id for _, doc_id in local.top("爱", 5)] == [len(NAMES)]
+
+
+@pytest.mark.skipif(lazy_pinyin is None, reason="需要 pypinyin")
+class TestPinyin:
+    def test_full_pinyin(self, search):
+        assert names(search, "qingtian")[0] == "晴天"
+
+    def test_initials(self, search):
+        assert names(search, "gbqq")[0] == "告白气球"
+
+    def test_homophone_typo(self, search):
+        assert names(search, "情天")[0] == "晴天"
+
+    def test_single_character_with_pinyin_installed(self, search):
+        # 拼音形式对单字查询只看前缀，不能挡住原文形式的子串匹配
+        assert names(search, "爱") == ["我爱你"]
+        assert "Hello" in names(search, "e")
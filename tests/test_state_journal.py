@@ -0,0 +1,82 @@
+"""StateJournal 记录折叠、损坏末行与压缩"""
+
+import json
+
+from modules.state_journal import StateJournal
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_queue_records_fold(tmp_path):
+    path = str(tmp_path / "state.journal")
+    journal = StateJournal(path)
+    journal.record("mode", mode="music")
+    for key in ("a", "b", "c"):
+        journal.record("push", q="songs", key=key, item=[key, f"/songs/{key}.mp3"], uid=1)
+    journal.record("pop", q="songs", key="a")
+    journal.record("push", q="replays", key="r1", item=["r1", "/replays/r1.mp4"], uid=None)
+    journal.record("clear", q="replays")
+
+    state = StateJournal(path).load()
+    assert state.mode == "music"
+    assert list(state.queues["songs"]) == ["b", "c"]
+    assert state.queues["songs"]["b"] == (["b", "/songs/b.mp3"], 1)
+    assert state.queues["replays"] == {}
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / "state.journal")
+    journal = StateJournal(path)
+    journal.record("push", q="songs", key="a", item=["a", "/songs/a.mp3"], uid=1)
+    journal.record("push", q="songs", key="b", item=["b", "/songs/b.mp3"], uid=2)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"t": "pop", "q": "songs", "ke')  # 崩溃时写了一半
+
+    state = StateJournal(path).load()
+    assert list(state.queues["songs"]) == ["a", "b"]
+    # load 后已压缩: 损坏的末行不再留在文件中，之后的追加不会接在半行后面
+    assert [r["key"] for r in read_records(path)] == ["a", "b"]
+
+    journal = StateJournal(path)
+    journal.load()
+    journal.record("pop", q="songs", key="a")
+    assert list(StateJournal(path).load().queues["songs"]) == ["b"]
+
+
+def test_playback_keeps_latest_per_mode(tmp_path):
+    path = str(tmp_path / "state.journal")
+    journal = StateJournal(path)
+    journal.record("playback", mode="video", source="/videos", playlist=None,
+                   current="/videos/1.mp4", cursor=1000)
+    journal.record("playback", mode="video", source="/videos", playlist=None,
+                   current="/videos/2.mp4", cursor=5000)
+    journal.record("playback", mode="music", source=None, playlist=["/songs/a.mp3"],
+                   current="/songs/a.mp3", cursor=None)
+
+    playback = StateJournal(path).load().playback
+    assert playback["video"]["current"] == "/videos/2.mp4"
+    assert playback["video"]["cursor"] == 5000
+    assert playback["music"]["playlist"] == ["/songs/a.mp3"]
+
+
+def test_compaction_rewrites_folded_state(tmp_path):
+    path = str(tmp_path / "state.journal")
+    journal = StateJournal(path, compact_every=10)
+    for i in range(30):
+        journal.record("push", q="songs", key=i, item=[str(i), f"/songs/{i}.mp3"], uid=i)
+        journal.record("pop", q="songs", key=i)
+    journal.record("push", q="songs", key="last", item=["last", "/songs/last.mp3"], uid=None)
+
+    assert journal.stats["compactions"] > 0
+    assert len(read_records(path)) <= 10
+    assert list(StateJournal(path).load().queues["songs"]) == ["last"]
+
+
+def test_missing_file_loads_empty_state(tmp_path):
+    state = StateJournal(str(tmp_path / "state.journal")).load()
+    assert state.mode is None
+    assert state.queues == {}
+    assert state.playback == {}